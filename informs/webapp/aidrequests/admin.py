@@ -8,7 +8,7 @@ from django.contrib import messages
 from django.utils.html import format_html
 from django.urls import reverse
 
-from .models import FieldOp, FieldOpNotify, AidType, AidRequest, AidRequestLog, AidLocation
+from .models import FieldOp, FieldOpNotify, AidType, AidRequest, AidRequestLog, AidLocation, CotDestination
 from .forms import AidLocationInline, AidRequestInline
 
 
@@ -90,6 +90,13 @@ class AidRequestAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 
+class CotDestinationInline(admin.TabularInline):
+    """Further TAK servers for the field op's CoT"""
+    model = CotDestination
+    extra = 0
+    fields = ('tak_server', 'encoding', 'enabled')
+
+
 class FieldOpAdmin(admin.ModelAdmin):
     """fieldops admin"""
 
@@ -105,7 +112,8 @@ class FieldOpAdmin(admin.ModelAdmin):
         'updated_by'
         )
 
-    inlines = [AidRequestInline]
+    inlines = [CotDestinationInline, AidRequestInline]
+    exclude = ('tak_servers',)
 
     filter_horizontal = ('aid_types', 'notify')
 
@@ -182,7 +190,7 @@ class AidRequestLogAdmin(admin.ModelAdmin):
 
 
 class FieldOpNotifyAdmin(admin.ModelAdmin):
-    list_display = ('name', 'type', 'email', 'sms_number')
+    list_display = ('name', 'type', 'email', 'sms_number', 'digest_minutes')
     search_fields = ('name', 'type', 'email', 'sms_number')
 
 
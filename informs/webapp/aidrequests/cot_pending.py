@@ -0,0 +1,89 @@
+"""
+Debounced CoT updates for AidRequest changes.
+
+A dispatcher working through an aid request changes its status and priority several
+times within seconds, and each change used to queue a full connect-build-send. Changes
+are now recorded per field op in PendingCot, and one ONCE schedule per field op flushes
+them all in a single send once the op has been quiet for COT_DEBOUNCE_QUIET seconds,
+or at the latest COT_DEBOUNCE_MAX_DELAY seconds after the first pending change.
+
+The django-q scheduler checks schedules about every 30 seconds, so flushes land up to
+that much later than the computed time.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from django_q.models import Schedule
+from django_q.tasks import async_task
+
+from .models import PendingCot
+from .queues import COT_QUEUE, schedule_options
+
+logger = logging.getLogger(__name__)
+
+COT_DEBOUNCE_QUIET = getattr(settings, 'COT_DEBOUNCE_QUIET', 5)  # seconds without changes before a flush; 0 sends right away
+COT_DEBOUNCE_MAX_DELAY = getattr(settings, 'COT_DEBOUNCE_MAX_DELAY', 30)  # seconds, cap on how long a change can wait
+
+
+def flush_schedule_name(field_op_slug):
+    return f"cot_flush_{field_op_slug}"
+
+
+def queue_aid_request_cot(aid_request):
+    """Record a CoT-relevant change to an aid request and (re)schedule its field op's flush."""
+    field_op = aid_request.field_op
+    if COT_DEBOUNCE_QUIET <= 0:
+        async_task(
+            'aidrequests.tasks.send_cot_task',
+            field_op_slug=field_op.slug,
+            mark_type='aid',
+            aidrequest=aid_request.pk,
+            task_name=f"Update_CoT_AR_{aid_request.pk}",
+            cluster=COT_QUEUE
+        )
+        return
+
+    now = timezone.now()
+    with transaction.atomic():
+        pending, created = PendingCot.objects.get_or_create(
+            aid_request_id=aid_request.pk,
+            defaults={'field_op_id': field_op.pk, 'first_changed': now, 'last_changed': now}
+        )
+        if not created:
+            PendingCot.objects.filter(pk=pending.pk).update(last_changed=now)
+
+        first_changed = PendingCot.objects.filter(field_op_id=field_op.pk).aggregate(first=Min('first_changed'))['first']
+        next_run = min(now + timedelta(seconds=COT_DEBOUNCE_QUIET), first_changed + timedelta(seconds=COT_DEBOUNCE_MAX_DELAY))
+
+        # each change pushes the flush back, up to the max delay
+        Schedule.objects.update_or_create(
+            name=flush_schedule_name(field_op.slug),
+            defaults={
+                'func': 'aidrequests.tasks.flush_pending_cot',
+                'args': repr(field_op.slug),
+                'kwargs': repr(schedule_options(COT_QUEUE)),
+                'schedule_type': Schedule.ONCE,
+                'repeats': -1,
+                'next_run': next_run,
+            }
+        )
+    logger.info(f"AR-{aid_request.pk}: CoT update queued for {field_op.slug}, flush at {next_run.isoformat()}")
+
+
+def claim_pending(field_op_slug, cutoff):
+    """IDs of aid requests with changes for a field op up to cutoff."""
+    return list(
+        PendingCot.objects
+        .filter(field_op__slug=field_op_slug, last_changed__lte=cutoff)
+        .order_by('aid_request_id')
+        .values_list('aid_request_id', flat=True)
+    )
+
+
+def release_pending(aid_request_ids, cutoff):
+    """Forget flushed changes; anything changed again after cutoff stays pending."""
+    PendingCot.objects.filter(aid_request_id__in=aid_request_ids, last_changed__lte=cutoff).delete()
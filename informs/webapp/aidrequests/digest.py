@@ -0,0 +1,77 @@
+"""
+Digest emails for notify contacts, for bursts of new aid requests.
+
+A notify contact with digest_minutes set gets no email per new aid request. The
+request is recorded in PendingDigest, and the first one in a window sets up a ONCE
+schedule that flushes the contact's pending requests for that field op
+digest_minutes later, as one summary email with one static map of all their
+locations. So a surge costs one email per contact per window instead of one per
+request. Priorities in NOTIFY_DIGEST_BYPASS (high) skip the digest and go out right
+away, like they do for contacts without a digest.
+
+The django-q scheduler checks schedules about every 30 seconds, so digests land up
+to that much later than the window.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_q.models import Schedule
+
+from .models import PendingDigest
+from .queues import NOTIFY_QUEUE, schedule_options
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_DIGEST_BYPASS = getattr(settings, 'NOTIFY_DIGEST_BYPASS', ('high',))  # priorities emailed right away
+
+
+def digest_schedule_name(notify_pk, field_op_slug):
+    return f"notify_digest_{notify_pk}_{field_op_slug}"
+
+
+def wants_digest(notify, aid_request):
+    """Whether a new aid request goes into the contact's digest rather than its own email."""
+    return notify.digest_minutes > 0 and aid_request.priority not in NOTIFY_DIGEST_BYPASS
+
+
+def queue_digest(notifies, aid_request):
+    """Record a new aid request for the digests of notifies, scheduling each window's flush."""
+    field_op = aid_request.field_op
+    now = timezone.now()
+    with transaction.atomic():
+        PendingDigest.objects.bulk_create(
+            [PendingDigest(notify=notify, field_op=field_op, aid_request=aid_request, queued_at=now) for notify in notifies],
+            ignore_conflicts=True,
+        )
+        for notify in notifies:
+            # the window starts with its first request and is not pushed back
+            Schedule.objects.get_or_create(
+                name=digest_schedule_name(notify.pk, field_op.slug),
+                defaults={
+                    'func': 'aidrequests.tasks.flush_digest',
+                    'args': repr((notify.pk, field_op.slug)),
+                    'kwargs': repr(schedule_options(NOTIFY_QUEUE)),
+                    'schedule_type': Schedule.ONCE,
+                    'repeats': -1,
+                    'next_run': now + timedelta(minutes=notify.digest_minutes),
+                }
+            )
+    logger.info(f"AR-{aid_request.pk}: Queued for the digest of {', '.join(notify.name for notify in notifies)}")
+
+
+def claim_digest(notify_pk, field_op_slug, cutoff):
+    """Pending digest entries of a contact and field op up to cutoff, oldest first."""
+    return list(
+        PendingDigest.objects
+        .filter(notify_id=notify_pk, field_op__slug=field_op_slug, queued_at__lte=cutoff)
+        .order_by('aid_request_id')
+        .values_list('aid_request_id', flat=True)
+    )
+
+
+def release_digest(notify_pk, aid_request_ids):
+    """Forget entries that went out in a digest."""
+    PendingDigest.objects.filter(notify_id=notify_pk, aid_request_id__in=aid_request_ids).delete()
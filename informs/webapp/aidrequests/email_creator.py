@@ -1,3 +1,6 @@
+import threading
+from collections import OrderedDict
+
 from django.conf import settings
 from django.urls import reverse
 from django.contrib.sites.models import Site
@@ -5,6 +8,13 @@ from django.utils.html import strip_tags
 
 # from icecream import ic
 
+EMAIL_CONTENT_CACHE_SIZE = getattr(settings, 'EMAIL_CONTENT_CACHE_SIZE', 64)  # rendered emails kept per process
+EMAIL_BATCH_RECIPIENTS = getattr(settings, 'EMAIL_BATCH_RECIPIENTS', False)  # one bcc message per batch instead of one per recipient
+EMAIL_BATCH_SIZE = getattr(settings, 'EMAIL_BATCH_SIZE', 50)  # recipients per message, Azure's limit
+
+_content_cache = OrderedDict()
+_content_cache_lock = threading.Lock()  # shared by the notify and email sender threads
+
 
 def email_connectstring():
     connect_string = f"endpoint=https://{settings.MAIL_ENDPOINT}/;accesskey={settings.MAIL_FROM_KEY}"
@@ -12,6 +22,58 @@ def email_connectstring():
 
 
 def email_creator_html(aid_request, aid_location, notify, map_file):
+    """The email about an aid request for one notify contact."""
+    return email_message(email_content(aid_request, aid_location, map_file), [notify.email])
+
+
+def email_content(aid_request, aid_location, map_file):
+    """Subject and body of the email about an aid request, rendered once and cached.
+
+    Only the recipients differ between the emails of an event, so the content is
+    rendered once per aid request, location and map; the timestamps in the key
+    make any edit render it afresh. Rendering happens outside the lock; two threads
+    missing the same key both render it and the later one is kept.
+    """
+    key = (
+        aid_request.pk, aid_request.updated_at, aid_request.field_op_id, aid_request.field_op.updated_at,
+        aid_location.pk, aid_location.updated_at, map_file,
+    )
+    with _content_cache_lock:
+        content = _content_cache.get(key)
+        if content is not None:
+            _content_cache.move_to_end(key)
+            return content
+    content = render_email_content(aid_request, aid_location, map_file)
+    with _content_cache_lock:
+        _content_cache[key] = content
+        _content_cache.move_to_end(key)
+        while len(_content_cache) > EMAIL_CONTENT_CACHE_SIZE:
+            _content_cache.popitem(last=False)
+    return content
+
+
+def email_message(content, addresses, bcc=False):
+    """An Azure email message of the rendered content, to addresses."""
+    recipients = [{"address": address} for address in addresses]
+    return {
+        "senderAddress": settings.MAIL_FROM,
+        "recipients": {"bcc": recipients} if bcc else {"to": recipients},
+        'content': dict(content),
+    }
+
+
+def email_messages(content, addresses):
+    """The messages that deliver content to addresses: one per address, or with
+    EMAIL_BATCH_RECIPIENTS one bcc message per EMAIL_BATCH_SIZE addresses."""
+    if not EMAIL_BATCH_RECIPIENTS:
+        return [email_message(content, [address]) for address in addresses]
+    return [
+        email_message(content, addresses[start:start + EMAIL_BATCH_SIZE], bcc=True)
+        for start in range(0, len(addresses), EMAIL_BATCH_SIZE)
+    ]
+
+
+def render_email_content(aid_request, aid_location, map_file):
     domain = Site.objects.get_current().domain
     protocol = 'https'
     field_op = aid_request.field_op
@@ -109,7 +171,10 @@ def email_creator_html(aid_request, aid_location, notify, map_file):
     </table>
     """
 
-    map_url = f"{protocol}://{domain}/{map_file}"
+    if map_file:
+        map_html = f'<img src="{protocol}://{domain}/{map_file}" alt="Aid Location - Preview Map">'
+    else:
+        map_html = 'No map available'
     location_html = f"""
         <hr>
         <div style="text-align: left;">
@@ -141,7 +206,7 @@ def email_creator_html(aid_request, aid_location, notify, map_file):
                     <td class="col-auto">
                         <div>
                             <div id="map-image">
-                                <img src="{map_url}" alt="Aid Location - Preview Map">
+                                {map_html}
                             </div>
                         </div>
                     </td>
@@ -163,15 +228,61 @@ def email_creator_html(aid_request, aid_location, notify, map_file):
 
     html += f"<pre>{additional_info_html}</pre>"
 
-    message = {
-        "senderAddress": settings.MAIL_FROM,
-        "recipients": {
-            "to": [{"address": notify.email}]
-        },
-        'content': {
-            "subject": subject,
-            "plainText": strip_tags(html),
-            "html": html
-        },
+    return {
+        "subject": subject,
+        "plainText": strip_tags(html),
+        "html": html
+    }
+
+
+def digest_content(field_op, aid_requests, map_file=None):
+    """Subject and body of a digest email summarizing several new aid requests of a field op."""
+    domain = Site.objects.get_current().domain
+    protocol = 'https'
+
+    subject = f"SOA:{field_op.slug}: {len(aid_requests)} new Aid Requests"
+
+    rows = []
+    for aid_request in aid_requests:
+        url = f"{protocol}://{domain}{reverse('aid_request_detail', kwargs={'pk': aid_request.pk, 'field_op': field_op.slug})}"
+        location = aid_request.location
+        address = (location.address_found or location.address_searched or '') if location else ''
+        distance = f"{location.distance} km" if location and location.distance is not None else ''
+        rows.append(f"""
+        <tr>
+            <td style="font-weight: bold;"><a href="{url}">{aid_request.pk}</a></td>
+            <td>{aid_request.aid_type}</td>
+            <td>{aid_request.priority or ''}</td>
+            <td>{aid_request.group_size or ''}</td>
+            <td>{aid_request.requestor_first_name} {aid_request.requestor_last_name}</td>
+            <td>{address}</td>
+            <td>{distance}</td>
+        </tr>""")
+
+    html = f"""
+    <h2>{field_op}: {len(aid_requests)} new Aid Requests</h2>
+    <table border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; width: auto; text-align: left">
+        <tr>
+            <th style="font-weight: normal;">ID</th>
+            <th style="font-weight: normal;">Aid Type</th>
+            <th style="font-weight: normal;">Priority</th>
+            <th style="font-weight: normal;">Group Size</th>
+            <th style="font-weight: normal;">Requestor</th>
+            <th style="font-weight: normal;">Address</th>
+            <th style="font-weight: normal;">Distance</th>
+        </tr>{''.join(rows)}
+    </table>
+    """
+    if map_file:
+        html += f"""
+    <hr>
+    <div id="map-image">
+        <img src="{protocol}://{domain}/{map_file}" alt="New Aid Locations - Preview Map">
+    </div>
+    """
+
+    return {
+        "subject": subject,
+        "plainText": strip_tags(html),
+        "html": html
     }
-    return message
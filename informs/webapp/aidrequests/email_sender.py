@@ -0,0 +1,93 @@
+"""
+Email delivery through Azure Communication Services, a whole event's messages at once.
+
+Each message is a long-running send: begin_send posts it, and the poller follows it
+until the service has accepted or rejected it. Sending one message per task paid a new
+EmailClient and a full polling wait per recipient, one after the other. send_messages()
+reuses one client per process and runs every message's send and poll on a thread
+pool, so an event's emails all finish in about one provider round trip, and a batch
+never takes longer than EMAIL_SEND_TIMEOUT.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+from azure.communication.email import EmailClient
+from django.conf import settings
+
+from .email_creator import email_connectstring
+
+logger = logging.getLogger(__name__)
+
+EMAIL_SEND_WORKERS = getattr(settings, 'EMAIL_SEND_WORKERS', 8)  # messages sent at the same time
+EMAIL_SEND_TIMEOUT = getattr(settings, 'EMAIL_SEND_TIMEOUT', 25)  # seconds, cap on a whole batch
+EMAIL_POLL_INTERVAL = getattr(settings, 'EMAIL_POLL_INTERVAL', 1)  # seconds between polls when the service gives no Retry-After
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def email_client():
+    """The process's EmailClient, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = EmailClient.from_connection_string(email_connectstring())
+        return _client
+
+
+class EmailResult(NamedTuple):
+    recipients: list  # addresses the message went to
+    status: str  # 'Succeeded' or 'Failed' from the service, else 'Error' or 'Timeout'
+    message_id: str  # the service's operation id, None when it never answered
+    error: str  # None when sent
+
+
+def message_recipients(message):
+    recipients = message.get('recipients', {})
+    return [recipient['address'] for kind in ('to', 'cc', 'bcc') for recipient in recipients.get(kind, [])]
+
+
+def deliver(client, message):
+    """Send one message and wait for the service's verdict."""
+    poller = client.begin_send(message, polling_interval=EMAIL_POLL_INTERVAL)
+    return poller.result(timeout=EMAIL_SEND_TIMEOUT)
+
+
+def send_messages(messages):
+    """Send messages concurrently on one client.
+
+    Returns:
+        list: an EmailResult per message, in order
+    """
+    if not messages:
+        return []
+    client = email_client()
+    executor = ThreadPoolExecutor(max_workers=min(EMAIL_SEND_WORKERS, len(messages)), thread_name_prefix='email')
+    futures = [executor.submit(deliver, client, message) for message in messages]
+    wait(futures, timeout=EMAIL_SEND_TIMEOUT)
+    # a send still running ends with its poller's own timeout
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for message, future in zip(messages, futures):
+        recipients = message_recipients(message)
+        if not future.done():
+            results.append(EmailResult(recipients, 'Timeout', None, f"No answer after {EMAIL_SEND_TIMEOUT}s"))
+        elif future.cancelled() or future.exception() is not None:
+            error = 'Cancelled' if future.cancelled() else str(future.exception())
+            logger.error(f"Error sending email to {', '.join(recipients)}: {error}")
+            results.append(EmailResult(recipients, 'Error', None, error))
+        else:
+            status = future.result() or {}
+            if status.get('status') in ('NotStarted', 'Running'):
+                # the poller gave up before the service decided
+                error = f"Still {status['status']} after {EMAIL_SEND_TIMEOUT}s"
+                results.append(EmailResult(recipients, 'Timeout', status.get('id'), error))
+                continue
+            error = None
+            if status.get('status') != 'Succeeded':
+                error = (status.get('error') or {}).get('message') or status.get('status', 'No status')
+            results.append(EmailResult(recipients, status.get('status', 'Error'), status.get('id'), error))
+    return results
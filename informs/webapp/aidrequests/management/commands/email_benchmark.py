@@ -0,0 +1,53 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from aidrequests import email_creator
+from aidrequests.email_creator import email_creator_html, email_content, email_messages, render_email_content
+from aidrequests.models import FieldOp, FieldOpNotify, AidType, AidRequest, AidLocation
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark rendering notification emails, per recipient and once per event'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contacts', type=int, default=10, help='Notify contacts per event')
+        parser.add_argument('--runs', type=int, default=200, help='Events rendered per measurement')
+
+    def handle(self, *args, **options):
+        contacts, runs = options['contacts'], options['runs']
+        # unsaved instances: rendering only reads them, so nothing touches the database but Site
+        now = timezone.now()
+        field_op = FieldOp(pk=1, name='Benchmark Op', slug='email-bench', latitude=34.0, longitude=-118.0, updated_at=now)
+        aid_request = AidRequest(
+            pk=1, field_op=field_op, aid_type=AidType(name='Evacuation', slug='evac'), updated_at=now,
+            requestor_first_name='Pat', requestor_last_name='Doe', street_address='1 Main St', city='Town', state='CA',
+            aid_description='Two adults and a dog need a ride out. ' * 10, medical_needs='Insulin, kept cold.',
+        )
+        aid_location = AidLocation(pk=1, aid_request=aid_request, latitude=34.1, longitude=-118.1, updated_at=now,
+                                   address_searched='1 Main St Town CA', address_found='1 Main St, Town, CA 90000')
+        notifies = [FieldOpNotify(name=f"Contact {i}", type='email-user', email=f"contact{i}@example.com")
+                    for i in range(contacts)]
+        map_file = 'media/maps/AR1-L1-map.png'
+
+        def uncached():
+            # what email_creator_html did before the content was cached
+            for notify in notifies:
+                render_email_content(aid_request, aid_location, map_file)
+
+        def per_recipient():
+            email_creator._content_cache.clear()
+            for notify in notifies:
+                email_creator_html(aid_request, aid_location, notify, map_file)
+
+        def once_per_event():
+            email_creator._content_cache.clear()
+            email_messages(email_content(aid_request, aid_location, map_file), [notify.email for notify in notifies])
+
+        uncached()  # warm the Site cache and the URL resolver
+        self.stdout.write(f"{contacts} contacts, {runs} events")
+        for name, func in (('render per recipient', uncached), ('email_creator_html', per_recipient),
+                           ('render once per event', once_per_event)):
+            seconds = min(timeit.repeat(func, number=runs, repeat=3)) / runs
+            self.stdout.write(f"{name:<22} {seconds * 1000:>8.3f} ms/event {seconds * 1e6 / contacts:>9.1f} us/recipient")
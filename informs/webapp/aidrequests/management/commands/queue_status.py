@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from aidrequests.queues import QUEUE_LATENCY_SAMPLE, queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Show depth and latency of the django-q queues (see aidrequests.queues)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'queue':<10} {'queued':>7} {'running':>8} {'oldest wait':>12} {'avg run':>8} {'failed':>7}")
+        for stats in queue_stats():
+            run_time = f"{stats.run_time:.1f}s" if stats.run_time is not None else '-'
+            line = (f"{stats.name:<10} {stats.queued:>7} {stats.running:>8} {stats.oldest_wait:>11.1f}s "
+                    f"{run_time:>8} {stats.failed:>7}")
+            self.stdout.write(self.style.WARNING(line) if stats.failed or stats.oldest_wait > 60 else line)
+        self.stdout.write(f'avg run and failed are over the last {QUEUE_LATENCY_SAMPLE} tasks of each queue')
@@ -1,23 +1,41 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django_q.models import Schedule
 from django_q.tasks import schedule
 
+from aidrequests.queues import COT_QUEUE, schedule_options
+
+COT_REFRESH_INTERVAL = getattr(settings, 'COT_REFRESH_INTERVAL', 5)  # minutes between CoT refresh runs
+
 class Command(BaseCommand):
-    help = 'Sets up scheduled tasks for sending COT messages'
+    help = 'Sets up scheduled tasks for refreshing COT messages and probing TAK servers'
 
     def handle(self, *args, **options):
-        # Delete any existing schedules with this name to avoid duplicates
-        Schedule.objects.filter(name='hourly_field_op_cot').delete()
+        # Delete any existing schedules with these names to avoid duplicates;
+        # the hourly full sweep is replaced by the stale-aware refresh
+        Schedule.objects.filter(name__in=['hourly_field_op_cot', 'cot_refresh']).delete()
+
+        # Resend only the COT markers that are due, every few minutes
+        schedule(
+            func='aidrequests.tasks.refresh_due_cot',        # The function to run
+            name='cot_refresh',                              # A unique name for this schedule
+            schedule_type=Schedule.MINUTES,                  # Run on an interval
+            minutes=COT_REFRESH_INTERVAL,                    # Wake up every few minutes
+            repeats=-1,                                      # Repeat indefinitely
+            **schedule_options(COT_QUEUE)                    # Enqueue on the CoT queue
+        )
 
-        # Create a new schedule for the hourly COT messages
+        # Probe TAK servers whose CoT circuit is open (see takserver.cot_circuit)
+        Schedule.objects.filter(name='tak_circuit_probe').delete()
         schedule(
-            func='aidrequests.tasks.send_all_field_op_cot',  # The function to run
-            name='hourly_field_op_cot',                      # A unique name for this schedule
-            schedule_type=Schedule.MINUTES,                   # Run on an interval
-            minutes=60,                                      # Every 60 minutes
-            repeats=-1                                       # Repeat indefinitely
+            func='takserver.cot_circuit.probe_open_circuits',
+            name='tak_circuit_probe',
+            schedule_type=Schedule.MINUTES,
+            minutes=1,
+            repeats=-1,
+            **schedule_options(COT_QUEUE)
         )
 
         self.stdout.write(
-            self.style.SUCCESS('Successfully set up hourly COT message schedule')
+            self.style.SUCCESS('Successfully set up COT refresh and TAK circuit probe schedules')
         )
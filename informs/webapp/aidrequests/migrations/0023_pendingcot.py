@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aidrequests', '0022_alter_aidrequest_requestor_first_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingCot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_changed', models.DateTimeField()),
+                ('last_changed', models.DateTimeField()),
+                ('aid_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_cot', to='aidrequests.aidrequest')),
+                ('field_op', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_cot', to='aidrequests.fieldop')),
+            ],
+            options={
+                'verbose_name': 'Pending CoT Update',
+                'verbose_name_plural': 'Pending CoT Updates',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aidrequests', '0023_pendingcot'),
+        ('takserver', '0008_cot_refresh'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotDestination',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encoding', models.CharField(blank=True, choices=[('xml', 'CoT XML'), ('protobuf', 'TAK Protocol v1 (protobuf)')], help_text="Wire format for this destination; empty uses the TAK server's CoT encoding.", max_length=10)),
+                ('enabled', models.BooleanField(default=True)),
+                ('field_op', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cot_destinations', to='aidrequests.fieldop')),
+                ('tak_server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cot_destinations', to='takserver.takserver')),
+            ],
+            options={
+                'verbose_name': 'CoT Destination',
+                'verbose_name_plural': 'CoT Destinations',
+            },
+        ),
+        migrations.AddField(
+            model_name='fieldop',
+            name='tak_servers',
+            field=models.ManyToManyField(blank=True, help_text="Further TAK servers that get the same CoT as the field op's TAK server", related_name='destination_field_ops', through='aidrequests.CotDestination', to='takserver.takserver'),
+        ),
+        migrations.AddConstraint(
+            model_name='cotdestination',
+            constraint=models.UniqueConstraint(fields=('field_op', 'tak_server'), name='unique_cot_destination'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aidrequests', '0024_cotdestination'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fieldopnotify',
+            name='digest_minutes',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Collect new aid requests into one email every N minutes, 0 to email each right away. High priority requests are always sent right away.'),
+        ),
+        migrations.CreateModel(
+            name='PendingDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queued_at', models.DateTimeField()),
+                ('aid_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_digest', to='aidrequests.aidrequest')),
+                ('field_op', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_digest', to='aidrequests.fieldop')),
+                ('notify', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_digest', to='aidrequests.fieldopnotify')),
+            ],
+            options={
+                'verbose_name': 'Pending Digest Entry',
+                'verbose_name_plural': 'Pending Digest Entries',
+                'constraints': [models.UniqueConstraint(fields=('notify', 'aid_request'), name='unique_pending_digest')],
+            },
+        ),
+    ]
@@ -7,7 +7,6 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django_q.tasks import async_task
 from geopy.distance import geodesic
 
 from .timestamped_model import TimeStampedModel
@@ -29,6 +28,11 @@ class FieldOpNotify(TimeStampedModel):
     type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     email = models.EmailField(blank=True, null=True)
     sms_number = models.CharField(max_length=15, blank=True, null=True)
+    digest_minutes = models.PositiveSmallIntegerField(
+        default=0,
+        help_text='Collect new aid requests into one email every N minutes, 0 to email each right away. '
+                  'High priority requests are always sent right away.'
+    )
 
     class Meta:
         verbose_name = 'Notify Address'
@@ -127,6 +131,10 @@ class FieldOp(TimeStampedModel):
     tak_server = models.ForeignKey(
         TakServer, related_name='field_ops', on_delete=models.SET_NULL, null=True, blank=True
     )
+    tak_servers = models.ManyToManyField(
+        TakServer, through='CotDestination', related_name='destination_field_ops', blank=True,
+        help_text="Further TAK servers that get the same CoT as the field op's TAK server"
+    )
     created_by = models.ForeignKey(
         User, related_name='field_ops_created', on_delete=models.SET_NULL, null=True, blank=True
     )
@@ -148,6 +156,27 @@ class FieldOp(TimeStampedModel):
         return str(self.name)
 
 
+class CotDestination(models.Model):
+    """A further TAK server a field op's CoT is sent to, with its own options"""
+    field_op = models.ForeignKey(FieldOp, on_delete=models.CASCADE, related_name='cot_destinations')
+    tak_server = models.ForeignKey(TakServer, on_delete=models.CASCADE, related_name='cot_destinations')
+    encoding = models.CharField(
+        max_length=10, choices=TakServer.ENCODING_CHOICES, blank=True,
+        help_text="Wire format for this destination; empty uses the TAK server's CoT encoding."
+    )
+    enabled = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = 'CoT Destination'
+        verbose_name_plural = 'CoT Destinations'
+        constraints = [
+            models.UniqueConstraint(fields=['field_op', 'tak_server'], name='unique_cot_destination'),
+        ]
+
+    def __str__(self):
+        return f"{self.field_op.slug} -> {self.tak_server}"
+
+
 class AidRequest(TimeStampedModel):
     """ scope to a field operation object"""
     field_op = models.ForeignKey(FieldOp, on_delete=models.CASCADE,
@@ -322,13 +351,9 @@ class AidRequest(TimeStampedModel):
             priority_changed = original.priority != self.priority
 
             if (status_changed or priority_changed) and not self.field_op.disable_cot:
-                async_task(
-                    'aidrequests.tasks.send_cot_task',
-                    field_op_slug=self.field_op.slug,
-                    mark_type='aid',
-                    aidrequest=self.pk,
-                    task_name=f"Update_CoT_AR_{self.pk}"
-                )
+                # Coalesced with other changes to this field op into one debounced send
+                from .cot_pending import queue_aid_request_cot
+                queue_aid_request_cot(self)
 
         super(AidRequest, self).save(*args, **kwargs)
 
@@ -414,6 +439,39 @@ class AidRequestLog(TimeStampedModel):
         return f"{self.updated_at}({self.updated_by}): {self.log_entry}"
 
 
+class PendingCot(models.Model):
+    """An AidRequest change waiting for the next debounced CoT flush of its field op"""
+    field_op = models.ForeignKey(FieldOp, on_delete=models.CASCADE, related_name='pending_cot')
+    aid_request = models.OneToOneField(AidRequest, on_delete=models.CASCADE, related_name='pending_cot')
+    first_changed = models.DateTimeField()
+    last_changed = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Pending CoT Update'
+        verbose_name_plural = 'Pending CoT Updates'
+
+    def __str__(self):
+        return f"{self.field_op.slug}: AR-{self.aid_request_id}"
+
+
+class PendingDigest(models.Model):
+    """A new AidRequest waiting for the next digest email to a notify contact"""
+    notify = models.ForeignKey(FieldOpNotify, on_delete=models.CASCADE, related_name='pending_digest')
+    field_op = models.ForeignKey(FieldOp, on_delete=models.CASCADE, related_name='pending_digest')
+    aid_request = models.ForeignKey(AidRequest, on_delete=models.CASCADE, related_name='pending_digest')
+    queued_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Pending Digest Entry'
+        verbose_name_plural = 'Pending Digest Entries'
+        constraints = [
+            models.UniqueConstraint(fields=['notify', 'aid_request'], name='unique_pending_digest'),
+        ]
+
+    def __str__(self):
+        return f"{self.notify.name}: AR-{self.aid_request_id}"
+
+
 auditlog.register(FieldOp,
                   exclude_fields=['created_by', 'created_at', 'updated_by', 'updated_at'],
                   serialize_data=True,
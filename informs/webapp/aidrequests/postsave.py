@@ -0,0 +1,155 @@
+"""
+Post-save pipeline for new aid requests, as stages with dependencies.
+
+    location ─┬─ notify   email task, enqueued as soon as the location is known, or digest entries
+              ├─ map      static map task
+              └─ cot      CoT push task for the aid request
+
+Only the location stage (geocoding, or the coordinates the submitter picked) runs
+inside the post-save task; everything after it is enqueued right away, so responders
+are notified about one geocode round trip after submit instead of after the static map
+too. The map and CoT tasks run concurrently on their own queues (see queues). The map's
+filename is chosen before the map is drawn, so the emails can link to it; the email
+task waits a little for the map and leaves it out if it is not drawn in time.
+
+run_stages() records each stage's outcome and timing in the post-save result;
+enqueued stages carry their django-q task name, whose Task row records the rest.
+get_aid_request_status follows those tasks.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+from django.conf import settings
+from django_q.tasks import async_task
+
+from .email_creator import email_content
+from .geocoder import get_azure_geocode, geocode_save
+from .digest import queue_digest, wants_digest
+from .models import AidLocation
+from .queues import COT_QUEUE, MAPS_QUEUE, NOTIFY_QUEUE
+from takserver.cot import cot_targets_for
+
+logger = logging.getLogger(__name__)
+
+
+class Stage(NamedTuple):
+    """One step of the pipeline; runs once every stage it comes after has succeeded."""
+    name: str
+    run: Callable  # run(aid_request, context) -> dict with 'status' ('success', 'queued', 'skipped', 'failed')
+    after: tuple = ()
+
+
+def run_stages(stages, aid_request, context):
+    """Run the stages in order, skipping those whose dependencies did not succeed.
+
+    Stages must be listed after the stages they depend on. Each stage's result is
+    kept in context under its name for the stages after it; objects a stage hands on
+    go into context directly, so the report stays small.
+
+    Returns:
+        dict: {stage name: {'status', 'duration' and whatever the stage reported}}
+    """
+    report = {}
+    for stage in stages:
+        blocked = [name for name in stage.after if report.get(name, {}).get('status') not in ('success', 'queued')]
+        if blocked:
+            report[stage.name] = {'status': 'skipped', 'duration': 0.0, 'message': f"after {', '.join(blocked)}"}
+            continue
+        started = time.monotonic()
+        try:
+            result = stage.run(aid_request, context)
+        except Exception as e:
+            logger.exception(f"AR-{aid_request.pk}: Post-save stage {stage.name} failed")
+            result = {'status': 'failed', 'message': str(e)}
+        result['duration'] = round(time.monotonic() - started, 3)
+        context[stage.name] = report[stage.name] = result
+    return report
+
+
+def map_filename_for(aid_request, location):
+    timestamp = datetime.now().strftime("%y%m%d%H%M%S")
+    return f"AR{aid_request.pk}-L{location.pk}-map_{timestamp}.png"
+
+
+def location_stage(aid_request, context):
+    """The submitter's coordinates, or else the geocoded address."""
+    latitude, longitude = context.get('latitude'), context.get('longitude')
+    if latitude and longitude:
+        logger.info(f"AR-{aid_request.pk}: Coordinates provided, creating AidLocation directly.")
+        # AidLocation.save() works out the distance from the field op
+        aid_location = AidLocation.objects.create(
+            aid_request=aid_request,
+            latitude=latitude,
+            longitude=longitude,
+            source=context.get('location_source') or 'user_picked',
+            status='confirmed',
+            note=context.get('location_note'),
+        )
+    elif aid_request.street_address and aid_request.city and aid_request.state:
+        geocode_results = get_azure_geocode(aid_request)
+        if geocode_results.get('status') != 'Success':
+            logger.error(f"AR-{aid_request.pk}: Address geocoding failed: {geocode_results.get('status')}")
+            return {'status': 'failed', 'message': f"Geocoding failed: {geocode_results.get('status')}"}
+        aid_location = geocode_save(aid_request, geocode_results)
+    else:
+        logger.warning(f"AR-{aid_request.pk}: Not enough address information to geocode.")
+        return {'status': 'failed', 'message': 'Not enough address information to geocode.'}
+
+    logger.info(f"AR-{aid_request.pk}: AidLocation created: {aid_location.pk}, distance: {aid_location.distance}km.")
+    context['aid_location'] = aid_location
+    return {
+        'status': 'success',
+        'location_pk': aid_location.pk,
+        'map_filename': map_filename_for(aid_request, aid_location),
+    }
+
+
+def notify_stage(aid_request, context):
+    """Enqueue one task that emails every email notify contact of the field op,
+    and queue the request for the contacts that take a digest (see digest)."""
+    notifies = list(aid_request.field_op.notify.filter(type__startswith='email'))
+    digest = [notify for notify in notifies if wants_digest(notify, aid_request)]
+    if digest:
+        queue_digest(digest, aid_request)
+    addresses = [notify.email for notify in notifies if notify not in digest]
+    if not addresses:
+        return {'status': 'queued' if digest else 'skipped', 'tasks': [], 'digest': len(digest)}
+    map_file = f"{settings.MAPS_PATH}/{context['location']['map_filename']}"
+    content = email_content(aid_request, context['aid_location'], map_file)
+    # the map is drawn at the same time; if it never shows up the email goes out without it
+    content_without_map = email_content(aid_request, context['aid_location'], None)
+    # the recipients are attached when it is sent; send_emails logs the per-recipient results
+    task_name = f"AR{aid_request.pk}_SendEmail_New"
+    async_task('aidrequests.tasks.send_notification_email', content, addresses, aid_request_pk=aid_request.pk,
+               map_file=map_file, content_without_map=content_without_map, task_name=task_name, cluster=NOTIFY_QUEUE)
+    return {'status': 'queued', 'tasks': [task_name], 'digest': len(digest)}
+
+
+def map_stage(aid_request, context):
+    """Enqueue the static map, drawn under the filename the emails link to."""
+    location = context['location']
+    task_name = f"AR{aid_request.pk}_map"
+    async_task('aidrequests.tasks.generate_static_map_for_location', location['location_pk'],
+               map_filename=location['map_filename'], task_name=task_name, cluster=MAPS_QUEUE)
+    return {'status': 'queued', 'task': task_name, 'map_filename': location['map_filename']}
+
+
+def cot_stage(aid_request, context):
+    """Enqueue the CoT push of the new aid request to the field op's TAK servers."""
+    field_op = aid_request.field_op
+    if field_op.disable_cot or not cot_targets_for(field_op):
+        return {'status': 'skipped', 'message': 'CoT is off for this field operation.'}
+    task_name = f"AR{aid_request.pk}_cot"
+    async_task('aidrequests.tasks.send_cot_task', field_op_slug=field_op.slug, mark_type='aid',
+               aidrequest=aid_request.pk, task_name=task_name, cluster=COT_QUEUE)
+    return {'status': 'queued', 'task': task_name}
+
+
+POSTSAVE_STAGES = (
+    Stage('location', location_stage),
+    Stage('notify', notify_stage, after=('location',)),
+    Stage('map', map_stage, after=('location',)),
+    Stage('cot', cot_stage, after=('location',)),
+)
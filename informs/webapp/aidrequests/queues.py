@@ -0,0 +1,87 @@
+"""
+Named django-q queues, so slow work cannot hold up time-critical work.
+
+    cot       CoT pushes, debounced flushes, refreshes and TAK circuit probes
+    notify    email delivery
+    maps      static maps
+    geocode   the post-save task, which geocodes new aid requests
+
+Each queue is a settings.Q_NAMED_CLUSTERS entry with its own workers, timeout and
+retry. The queues are opt-in: only those listed in the Q_ALT_CLUSTERS environment
+variable become ALT_CLUSTERS of settings.Q_CLUSTER, each served by its own cluster:
+
+    Q_ALT_CLUSTERS=cot,notify,maps,geocode Q_CLUSTER_NAME=cot python manage.py qcluster
+
+The default cluster runs the scheduler and everything not routed here. A queue name
+that has no ALT_CLUSTERS entry routes to the default queue, so a single-cluster
+setup (Q_ALT_CLUSTERS unset) keeps working. Pass the queue to async_task as cluster=, and to schedules as
+q_options (schedule_options), which leaves them to the default cluster's scheduler.
+"""
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Avg, Count, F, Min, Q
+from django.utils import timezone
+from django_q.brokers import get_broker
+from django_q.conf import Conf
+from django_q.models import OrmQ, Task
+
+QUEUE_LATENCY_SAMPLE = getattr(settings, 'QUEUE_LATENCY_SAMPLE', 50)  # recent tasks averaged for queue run time
+
+
+def queue_name(setting, default):
+    """The configured queue name, or None (the default queue) when no cluster serves it."""
+    name = getattr(settings, setting, default)
+    return name if name in settings.Q_CLUSTER.get('ALT_CLUSTERS', {}) else None
+
+
+COT_QUEUE = queue_name('COT_QUEUE', 'cot')
+NOTIFY_QUEUE = queue_name('NOTIFY_QUEUE', 'notify')
+MAPS_QUEUE = queue_name('MAPS_QUEUE', 'maps')
+GEOCODE_QUEUE = queue_name('GEOCODE_QUEUE', 'geocode')
+
+
+def schedule_options(queue):
+    """Schedule kwargs that have the scheduler enqueue on queue."""
+    return {'q_options': {'cluster': queue}} if queue else {}
+
+
+class QueueStats(NamedTuple):
+    name: str
+    queued: int  # waiting for a worker
+    running: int  # pulled by a worker, not yet acknowledged
+    oldest_wait: float  # seconds the oldest waiting task has waited, 0 when none
+    run_time: float  # seconds, average over the last QUEUE_LATENCY_SAMPLE tasks; None without any
+    failed: int  # failures among those tasks
+
+
+def queue_stats():
+    """Depth and latency of the default queue and each named queue.
+
+    Waiting OrmQ rows carry their enqueue time in lock until a worker pulls them, so
+    the oldest lock of a queue is how long its head has waited.
+    """
+    now = timezone.now()
+    names = [Conf.PREFIX, *settings.Q_CLUSTER.get('ALT_CLUSTERS', {})]
+    waiting = dict(
+        OrmQ.objects.using(Conf.ORM).filter(key__in=names, lock__lte=now)
+        .values('key').annotate(oldest=Min('lock')).values_list('key', 'oldest')
+    )
+    stats = []
+    for name in names:
+        broker = get_broker(name)
+        recent = Task.objects.filter(cluster=None if name == Conf.PREFIX else name).order_by('-stopped')
+        recent = recent.values_list('pk', flat=True)[:QUEUE_LATENCY_SAMPLE]
+        run = Task.objects.filter(pk__in=list(recent)).aggregate(
+            run_time=Avg(F('stopped') - F('started')),
+            failed=Count('pk', filter=Q(success=False)),
+        )
+        stats.append(QueueStats(
+            name=name,
+            queued=broker.queue_size(),
+            running=broker.lock_size(),
+            oldest_wait=(now - waiting[name]).total_seconds() if name in waiting else 0.0,
+            run_time=run['run_time'].total_seconds() if run['run_time'] is not None else None,
+            failed=run['failed'],
+        ))
+    return stats
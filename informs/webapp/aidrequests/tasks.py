@@ -1,26 +1,24 @@
 from django.conf import settings
 
-from azure.communication.email import EmailClient
 from datetime import datetime
-from geopy.distance import geodesic
 
-from .email_creator import email_connectstring, email_creator_html
-from .geocoder import get_azure_geocode, geocode_save
-from .views.maps import staticmap_aid, calculate_zoom
-from .models import FieldOpNotify, AidRequest, FieldOp, AidLocation
-from takserver.cot import CotSender, pytak_send_cot
+from .email_creator import email_content, email_messages, digest_content
+from .email_sender import send_messages
+from .views.maps import staticmap_aid, staticmap_digest
+from .models import FieldOpNotify, AidRequest, AidRequestLog, FieldOp, AidLocation
+from .cot_pending import claim_pending, release_pending
+from .digest import claim_digest, release_digest
+from .postsave import POSTSAVE_STAGES, run_stages
+from takserver.cot import pytak_send_cot, cot_targets_for, no_targets_reason, COT_DESTINATIONS
+from takserver.cot_sweep import run_sweep, sweep_job, sweep_report
+from takserver.cot_refresh import refresh_jobs
 
-import asyncio
-import pytak
-
-from django.core.management import call_command
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django_q.tasks import async_task
+from django.db.models import Q
+from django.utils import timezone
 
 import logging
 import os
+import time
 
 # Get the main application logger
 logger = logging.getLogger(__name__)
@@ -28,10 +26,13 @@ logger = logging.getLogger(__name__)
 # Get a dedicated COT logger
 cot_logger = logging.getLogger('cot')
 
-def generate_static_map_for_location(location_pk):
+EMAIL_MAP_WAIT = getattr(settings, 'EMAIL_MAP_WAIT', 20)  # seconds a new request's email waits for its static map
+
+def generate_static_map_for_location(location_pk, map_filename=None):
     """
     Generates a static map for a given AidLocation and saves it.
     This is a standalone task that can be called asynchronously or synchronously.
+    map_filename is the name to save it under when it was chosen beforehand (see postsave).
     """
     try:
         location = AidLocation.objects.get(pk=location_pk)
@@ -50,8 +51,9 @@ def generate_static_map_for_location(location_pk):
     )
 
     if staticmap_data:
-        timestamp = datetime.now().strftime("%y%m%d%H%M%S")
-        map_filename = f"AR{aid_request.pk}-L{location.pk}-map_{timestamp}.png"
+        if not map_filename:
+            timestamp = datetime.now().strftime("%y%m%d%H%M%S")
+            map_filename = f"AR{aid_request.pk}-L{location.pk}-map_{timestamp}.png"
 
         # We need the full path to save the file
         map_directory = os.path.join(settings.BASE_DIR, 'media', 'maps')
@@ -64,7 +66,7 @@ def generate_static_map_for_location(location_pk):
 
         try:
             # If a map already exists, delete the old one
-            if location.map_filename:
+            if location.map_filename and location.map_filename != map_filename:
                 old_map_path = os.path.join(map_directory, location.map_filename)
                 if os.path.exists(old_map_path):
                     os.remove(old_map_path)
@@ -83,98 +85,32 @@ def generate_static_map_for_location(location_pk):
 
 
 def aid_request_postsave(aid_request, **kwargs):
+    """Locate a new aid request, then fan out to notifications, static map and CoT (see postsave)."""
     # Guard against signal-based calls that lack necessary form data
     if 'trigger' in kwargs:
         logger.warning(f"AR-{aid_request.pk}: Post-save task called by a signal. Aborting to prevent duplicate/failed runs. KWargs: {kwargs}")
         return "Task aborted: called by signal."
 
     logger.info(f"Staring aid_request_postsave for AR-{aid_request.pk} with kwargs: {kwargs}")
-    is_new = kwargs.get('is_new')
-
-    if not is_new:
+    if not kwargs.get('is_new'):
         return "Not a new aid request, no post-save actions taken."
 
-    latitude = kwargs.get('latitude')
-    longitude = kwargs.get('longitude')
-    location_note = kwargs.get('location_note')
-    location_source = kwargs.get('location_source')
-    aid_location = None
-    map_file = None
-
-    if latitude and longitude:
-        logger.info(f"AR-{aid_request.pk}: Coordinates provided, creating AidLocation directly.")
-        aid_location = AidLocation.objects.create(
-            aid_request=aid_request,
-            latitude=latitude,
-            longitude=longitude,
-            source=location_source or 'user_picked',
-            status='confirmed',
-            note=location_note
-        )
-
-        logger.info(f"AR-{aid_request.pk}: Calculating distance from FieldOp.")
-        distance = round(geodesic(
-            (aid_request.field_op.latitude, aid_request.field_op.longitude),
-            (latitude, longitude)
-        ).km, 2)
-        aid_location.distance = distance
-        aid_location.save()
-
-    else:
-        logger.info(f"AR-{aid_request.pk}: No coordinates provided, checking for address to geocode.")
-        if aid_request.street_address and aid_request.city and aid_request.state:
-            geocode_results = get_azure_geocode(aid_request)
-            if geocode_results.get('status') == 'Success':
-                aid_location = geocode_save(aid_request, geocode_results)
-            else:
-                logger.error(f"AR-{aid_request.pk}: Address geocoding failed: {geocode_results.get('status')}")
-        else:
-            logger.warning(f"AR-{aid_request.pk}: Not enough address information to geocode.")
-
-    if aid_location:
-        logger.info(f"AR-{aid_request.pk}: AidLocation created/found: {aid_location.pk}, distance: {aid_location.distance}km.")
-
-        # Generate the map using the new standalone task
-        generate_static_map_for_location(aid_location.pk)
-        aid_location.refresh_from_db() # Refresh to get the map_filename
-
-        logger.info(f"AR-{aid_request.pk}: Preparing to send notification emails.")
-        notify_emails = aid_request.field_op.notify.filter(type__startswith='email')
-        email_results = ""
-        for notify in notify_emails:
-            map_file = f"{settings.MAPS_PATH}/{aid_location.map_filename}" if aid_location.map_filename else None
-            message = email_creator_html(aid_request, aid_location, notify, map_file)
-            try:
-                task_name = f"AR{aid_request.pk}_SendEmail_New_{notify.pk}"
-                async_task('aidrequests.tasks.send_email', message, task_name=task_name)
-                email_results += f"Email task for {notify.name} enqueued.\\n"
-            except Exception as e:
-                logger.error(f"Error enqueuing email task for {notify.name}: {e}")
-                email_results += f"Email Enqueue Error for {notify.name}: {e}\\n"
-
-        if email_results.endswith('\\n'):
-            email_results = email_results[:-2]
-
-        try:
-            aid_request.logs.create(log_entry=f'{email_results}')
-        except Exception as e:
-            logger.error(f"Error logging email results: {e}")
-
-        return {
-            'location_created_pk': aid_location.pk,
-            'map_generated': True if aid_location.map_filename else False,
-            'map_filename': aid_location.map_filename,
-            'email_tasks_queued': [f"AR{aid_request.pk}_SendEmail_New_{n.pk}" for n in notify_emails]
-        }
+    context = {key: kwargs.get(key) for key in ('latitude', 'longitude', 'location_note', 'location_source')}
+    stages = run_stages(POSTSAVE_STAGES, aid_request, context)
+    logger.info(f"AR-{aid_request.pk}: Post-save stages: "
+                + ", ".join(f"{name} {stage['status']} {stage['duration']}s" for name, stage in stages.items()))
 
-    else:
+    location = stages['location']
+    if location['status'] != 'success':
         logger.warning(f"AR-{aid_request.pk}: No AidLocation was created. Skipping map and notifications.")
-        return {
-            'location_created_pk': None,
-            'map_generated': False,
-            'map_filename': None,
-            'email_tasks_queued': []
-        }
+    return {
+        'location_created_pk': location.get('location_pk'),
+        'map_filename': stages['map'].get('map_filename'),
+        'map_task': stages['map'].get('task'),
+        'cot_task': stages['cot'].get('task'),
+        'email_tasks_queued': stages['notify'].get('tasks', []),
+        'stages': stages,
+    }
 
 
 def aid_request_notify(aid_request, **kwargs):
@@ -182,48 +118,18 @@ def aid_request_notify(aid_request, **kwargs):
     aid_location = aid_request.location
     map_file = f"{settings.MAPS_PATH}/{aid_location.map_filename}"
 
-    results = ""
-    if 'email_extra' in kwargs['kwargs']:
-        email_extra = kwargs['kwargs']['email_extra']
-        if email_extra:
-            notify = FieldOpNotify(
-                type='email-adhoc',
-                name='Extra Email',
-                email=email_extra
-            )
-            message = email_creator_html(aid_request, aid_location, notify, map_file)
-            try:
-                timestamp = datetime.now().strftime('%H%M%S')
-                task_name = f"AR{aid_request.pk}_SendEmail_Manual_Adhoc_{timestamp}"
-                async_task('aidrequests.tasks.send_email', message, task_name=task_name)
-                results += f"Email task for {notify.email} enqueued.\n |"
-            except Exception as e:
-                logger.error(f"Error enqueuing email task for {notify.email}: {e}")
-                results += f"Email Enqueue Error for {notify.email}: {e}\n"
-
-    notifies = kwargs['kwargs']['notifies']
-    notify_emails = notifies.filter(type__startswith='email')
-    for notify in notify_emails:
-        message = email_creator_html(aid_request, aid_location, notify, map_file)
-        try:
-            task_name = f"AR{aid_request.pk}_SendEmail_Manual_{notify.pk}"
-            async_task('aidrequests.tasks.send_email', message, task_name=task_name)
-            results += f"Email task for {notify.email} enqueued.\n"
-        except Exception as e:
-            logger.error(f"Error enqueuing email task for {notify.email}: {e}")
-            results += f"Email Enqueue Error for {notify.email}: {e}\n"
-
-    if results.endswith('\n'):
-        results = results[:-1]
+    notifies = list(kwargs['kwargs']['notifies'].filter(type__startswith='email'))
+    email_extra = kwargs['kwargs'].get('email_extra')
+    if email_extra:
+        notifies.append(FieldOpNotify(type='email-adhoc', name='Extra Email', email=email_extra))
 
+    # this task already runs on the notify queue, so the emails go out from here
+    content = email_content(aid_request, aid_location, map_file)
     try:
-        aid_request.logs.create(
-            log_entry=f'{results}'
-        )
-    except Exception as e:
-        logger.error(f"Error logging notification results: {e}")
-
-    return results
+        results = send_notification_email(content, [notify.email for notify in notifies], aid_request_pk=aid_request.pk)
+    except RuntimeError as e:
+        return str(e)
+    return f"{len(results)} emails sent."
 
 
 # def aidrequest_takcot(aidrequest_id=None, aidrequest_list=None, message_type='update'):
@@ -264,42 +170,157 @@ def aid_request_notify(aid_request, **kwargs):
 #         return 'No AidRequest List'
 
 
-def send_email(message):
-    try:
-        POLLER_WAIT_TIME = 5
-        client = EmailClient.from_connection_string(email_connectstring())
-        poller = client.begin_send(message)
-        time_elapsed = 0
+def send_emails(messages, aid_request_pk=None):
+    """Send an event's emails concurrently (see email_sender).
 
-        while not poller.done():
-            poller.wait(POLLER_WAIT_TIME)
-            time_elapsed += POLLER_WAIT_TIME
-            if time_elapsed > 5 * POLLER_WAIT_TIME:
-                raise RuntimeError("Polling timed out.")
+    Per-recipient results go to the aid request's log as one entry.
+    Raises when any message was not sent, so the task shows as failed.
+    """
+    results = send_messages(messages)
+    lines = [
+        f"Email to {', '.join(result.recipients)} sent." if result.status == 'Succeeded'
+        else f"Email to {', '.join(result.recipients)} failed ({result.status}): {result.error}"
+        for result in results
+    ]
+    if aid_request_pk and lines:
+        try:
+            AidRequestLog.objects.create(aid_request_id=aid_request_pk, log_entry='\n'.join(lines))
+        except Exception as e:
+            logger.error(f"Error logging email results: {e}")
 
-        if poller.result()["status"] == "Succeeded":
-            result = poller.result()
+    failed = [result for result in results if result.status != 'Succeeded']
+    logger.info(f"AR-{aid_request_pk}: {len(results) - len(failed)} of {len(results)} emails sent.")
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(results)} emails not sent: " + "; ".join(lines))
+    return [result._asdict() for result in results]
 
-    except Exception as e:
-        logger.error(f"Error sending email: {e}")
-        return e
 
-    return result
+def map_ready(map_file, wait=None, interval=0.5):
+    """Whether the static map at map_file (under BASE_DIR) is on disk, waiting up to wait
+    (EMAIL_MAP_WAIT) seconds for it."""
+    path = os.path.join(settings.BASE_DIR, map_file)
+    deadline = time.monotonic() + (EMAIL_MAP_WAIT if wait is None else wait)
+    while not os.path.exists(path):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
+
 
+def send_notification_email(content, addresses, aid_request_pk=None, map_file=None, content_without_map=None):
+    """Send one rendered email to every address (see email_creator.email_messages).
 
-def send_all_field_op_cot():
+    content may show the static map at map_file while the maps queue is still drawing it;
+    content_without_map goes out instead when the map is not on disk within EMAIL_MAP_WAIT.
+    """
+    if map_file and content_without_map and not map_ready(map_file):
+        logger.warning(f"AR-{aid_request_pk}: Static map {map_file} is not ready, emailing without it.")
+        content = content_without_map
+    return send_emails(email_messages(content, addresses), aid_request_pk=aid_request_pk)
+
+
+def digest_map(field_op, aid_requests, notify_pk):
+    """Draw one static map of the field op and the aid requests' locations; returns its filename or None."""
+    points = [
+        (aid_request.pk, aid_request.location.latitude, aid_request.location.longitude)
+        for aid_request in aid_requests if aid_request.location
+    ]
+    if not points:
+        return None
+    staticmap_data = staticmap_digest(fieldop_lat=field_op.latitude, fieldop_lon=field_op.longitude, aid_points=points)
+    if not staticmap_data:
+        logger.warning(f"[{field_op.slug}] Digest map for notify {notify_pk} did not return PNG data.")
+        return None
+    map_filename = f"digest-{field_op.slug}-N{notify_pk}-{datetime.now().strftime('%y%m%d%H%M%S')}.png"
+    map_directory = os.path.join(settings.BASE_DIR, 'media', 'maps')
+    os.makedirs(map_directory, exist_ok=True)
+    with open(os.path.join(map_directory, map_filename), 'wb') as file:
+        file.write(staticmap_data)
+    return map_filename
+
+
+def flush_digest(notify_pk, field_op_slug):
+    """Email a notify contact one digest of the new aid requests of a field op.
+
+    Run by the ONCE schedule set up in digest.queue_digest(). Entries are only
+    forgotten once the email went out; after a failure they go with the next digest.
+    """
+    cutoff = timezone.now()
+    aid_request_ids = claim_digest(notify_pk, field_op_slug, cutoff)
+    if not aid_request_ids:
+        return f"No pending digest entries for notify {notify_pk} in {field_op_slug}."
+
+    notify = FieldOpNotify.objects.get(pk=notify_pk)
+    field_op = FieldOp.objects.get(slug=field_op_slug)
+    aid_requests = list(
+        AidRequest.objects.filter(pk__in=aid_request_ids)
+        .select_related('aid_type').prefetch_related('locations').order_by('pk')
+    )
+    map_filename = digest_map(field_op, aid_requests, notify_pk)
+    map_file = f"{settings.MAPS_PATH}/{map_filename}" if map_filename else None
+    logger.info(f"[{field_op_slug}] Sending a digest of {len(aid_requests)} aid requests to {notify.name}")
+    send_notification_email(digest_content(field_op, aid_requests, map_file), [notify.email])
+
+    AidRequestLog.objects.bulk_create(
+        AidRequestLog(aid_request=aid_request, log_entry=f"Email to {notify.email} sent in a digest.")
+        for aid_request in aid_requests
+    )
+    release_digest(notify_pk, aid_request_ids)
+    return f"Digest of {len(aid_requests)} aid requests sent to {notify.name}."
+
+
+def send_email(message):
+    """Send one email; returns the result, or the exception when it was not sent."""
+    result, = send_messages([message])
+    if result.status != 'Succeeded':
+        logger.error(f"Error sending email: {result.error}")
+        return RuntimeError(result.error)
+    return result._asdict()
+
+
+def _sweep_result(reports):
+    """Totals and a readable per field op report for a CoT sweep."""
+    result = {
+        'sent': sum(report['sent'] for report in reports),
+        'skipped': sum(report['skipped'] for report in reports),
+        'replayed': sum(report['replayed'] for report in reports),
+        'bytes': sum(report['bytes'] for report in reports),
+        'errors': sum(1 for report in reports if report['error']),
+        'field_ops': reports,
+    }
+    final_report = "\n".join(
+        f"{report['field_op']} ({report['tak_server']}): "
+        + (f"Error sending: {report['error']}" if report['error'] else f"sent {report['sent']}, skipped {report['skipped']}, replayed {report['replayed']}")
+        + f" in {report['duration']}s"
+        for report in reports
+    )
+    return result, final_report
+
+
+def send_all_field_op_cot(delta_only=False):
     """Send COT messages for all active field ops that have COT enabled.
 
-    This is the function called by the hourly scheduler to send both
-    field operation markers and aid request markers with a stale time
-    of +1 day (86400 seconds).
+    A full sweep of both field operation markers and aid request markers with
+    a stale time of +1 day (86400 seconds). The scheduler runs refresh_due_cot
+    instead; this remains for a manual full resend, e.g. to a TAK server that lost its
+    data, so every marker is sent. With delta_only, markers the TAK server already has
+    unchanged, and that are not close to going stale, are skipped (see takserver.cot_delta).
+
+    Field ops are sent concurrently, grouped by TAK server (see takserver.cot_sweep),
+    so one slow or unreachable server does not hold up the others. A field op with
+    several TAK servers is built once and reported per server.
+
+    Returns:
+        dict: totals and a per field op report (markers sent/skipped/replayed, bytes, duration, error)
     """
     try:
-        # Get all field ops with TAK servers and COT enabled
-        field_ops = FieldOp.objects.filter(tak_server__isnull=False, disable_cot=False)
-        logger.info(f"Found {field_ops.count()} field ops with TAK servers and COT enabled")
+        # Get all field ops with TAK servers (their own or CoT destinations) and COT enabled
+        field_ops = list(FieldOp.objects.filter(Q(tak_server__isnull=False) | Q(cot_destinations__enabled=True),
+                                                disable_cot=False)
+                         .distinct().select_related('tak_server').prefetch_related(COT_DESTINATIONS))
+        logger.info(f"Found {len(field_ops)} field ops with TAK servers and COT enabled")
 
-        if field_ops.count() == 0:
+        if not field_ops:
             # If no field ops found, check what we have in the system
             all_field_ops = FieldOp.objects.all()
             logger.info(f"Total field ops in system: {all_field_ops.count()}")
@@ -307,42 +328,68 @@ def send_all_field_op_cot():
                 logger.info(f"Field op {fo.slug} - TAK server: {fo.tak_server}, COT enabled: {not fo.disable_cot}")
             return "No COT messages were sent - no eligible field ops found"
 
-        results = []
+        # Active aid requests for every field op, in one query
+        active_requests = {}
+        for field_op_id, aid_request_id in AidRequest.objects.filter(
+            field_op__in=field_ops,
+            status__in=['new', 'assigned', 'resolved']
+        ).values_list('field_op_id', 'id'):
+            active_requests.setdefault(field_op_id, []).append(aid_request_id)
+
+        reports = []
+        jobs = []
         for field_op in field_ops:
             try:
-                logger.info(f"Sending hourly COT update for field op: {field_op.slug}")
-                # Use the enhanced send_cot_task which handles both field and aid marks appropriately
-                task_result = send_cot_task(
-                    field_op_slug=field_op.slug,
-                    mark_type='aid'  # This will send both field mark and all aid marks
-                )
-                results.append(task_result)
+                targets = cot_targets_for(field_op)
+                if targets:
+                    jobs.append(sweep_job(field_op, active_requests.get(field_op.pk, []), targets=targets))
             except Exception as e:
-                error_msg = f"Error sending COT for {field_op.slug}: {str(e)}"
-                logger.error(error_msg)
-                results.append(error_msg)
-                # Add a flag to indicate an error occurred to fail the main task
-                # This part will be handled by the logic below, by checking if any result contains "Error"
-
-        if not results:
-            return "No COT messages were sent - no eligible field ops found"
+                logger.error(f"Error preparing COT for {field_op.slug}: {str(e)}")
+                reports.append(sweep_report(field_op.slug, field_op.tak_server.name if field_op.tak_server else None,
+                                            error=str(e)))
 
-        # Log the completion
-        final_report = "\n".join(results)
-        any_errors_encountered = any("Error sending" in result or "Failed COT for" in result or "Error in send_cot_task" in result for result in results)
+        logger.info(f"Sending {'changed' if delta_only else 'all'} COT markers for {len(jobs)} field ops")
+        reports.extend(run_sweep(jobs, delta_only=delta_only))
 
-        if any_errors_encountered:
+        result, final_report = _sweep_result(reports)
+        if result['errors']:
             logger.error(f"send_all_field_op_cot completed with one or more errors. Report:\n{final_report}")
             raise RuntimeError(f"send_all_field_op_cot completed with one or more errors. Report:\n{final_report}")
         else:
-            logger.info(f"Hourly COT update completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            return final_report
+            logger.info(f"COT sweep of all field ops completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: "
+                        f"{result['sent']} sent, {result['skipped']} skipped. Report:\n{final_report}")
+            return result
     except Exception as e:
         logger.error(f"Main error in send_all_field_op_cot: {str(e)}")
         # Ensure this top-level exception also makes the task fail in Django Q
         raise RuntimeError(f"Critical error in send_all_field_op_cot: {str(e)}") from e
 
 
+def refresh_due_cot():
+    """Send the CoT markers that are due for a refresh, and any a TAK server never got.
+
+    Called every few minutes by the scheduler in place of the hourly full sweep: each
+    marker is resent at a jittered fraction of its stale time (see takserver.cot_refresh),
+    which spreads TAK traffic evenly instead of sending every marker at once.
+
+    Returns:
+        dict: totals and a per field op report, as for send_all_field_op_cot
+    """
+    jobs, reports = refresh_jobs(timezone.now())
+    if not jobs and not reports:
+        return "No CoT markers due for a refresh"
+
+    logger.info(f"Refreshing CoT for {len(jobs)} field ops")
+    reports.extend(run_sweep(jobs, delta_only=False))
+
+    result, final_report = _sweep_result(reports)
+    if result['errors']:
+        logger.error(f"refresh_due_cot completed with one or more errors. Report:\n{final_report}")
+        raise RuntimeError(f"refresh_due_cot completed with one or more errors. Report:\n{final_report}")
+    logger.info(f"CoT refresh sent {result['sent']} markers. Report:\n{final_report}")
+    return result
+
+
 # def send_fieldop_cot_task(field_op_slug, message_type='update'):
 #     """Send COT message for a single field op marker."""
 #     try:
@@ -360,7 +407,7 @@ def send_all_field_op_cot():
 #         return error_msg
 
 
-def send_cot_task(field_op_slug, mark_type='field', aidrequest=None, aidrequests=None, **kwargs):
+def send_cot_task(field_op_slug, mark_type='field', aidrequest=None, aidrequests=None, delta_only=False, **kwargs):
     """Django-Q2 task for sending COT messages for field ops and/or aid requests.
 
     This function is a synchronous interface for Django-Q2.
@@ -371,6 +418,7 @@ def send_cot_task(field_op_slug, mark_type='field', aidrequest=None, aidrequests
         mark_type (str): Either 'field' for field op marker only or 'aid' for aid requests
         aidrequest (int): Single aid request ID when mark_type is 'aid'
         aidrequests (list): List of aid request IDs when mark_type is 'aid'
+        delta_only (bool): Only send markers that changed or are close to stale on the TAK server
 
     If mark_type='aid' and neither aidrequest nor aidrequests is provided,
     all active aid requests for the field op will be sent.
@@ -383,7 +431,7 @@ def send_cot_task(field_op_slug, mark_type='field', aidrequest=None, aidrequests
         # Get the field op
         from .models import FieldOp, AidRequest # Keep this import for model access
         try:
-            field_op = FieldOp.objects.get(slug=field_op_slug)
+            field_op = FieldOp.objects.select_related('tak_server').prefetch_related(COT_DESTINATIONS).get(slug=field_op_slug)
         except FieldOp.DoesNotExist:
             error_msg = f"Field op not found: {field_op_slug}"
             logger.error(error_msg)
@@ -394,9 +442,11 @@ def send_cot_task(field_op_slug, mark_type='field', aidrequest=None, aidrequests
             logger.info(f"COT disabled for field op: {field_op.slug}")
             return 'COT disabled for field operation'
 
-        if not field_op.tak_server:
-            logger.info(f"No TAK server configured for field op: {field_op.slug}")
-            return 'No TAK server configured for field operation'
+        targets = cot_targets_for(field_op)
+        if not targets:
+            reason = no_targets_reason(field_op)
+            logger.info(f"No CoT sent for field op {field_op.slug}: {reason}")
+            return f"No CoT sent for field operation: {reason}"
 
         # Validate mark_type for CotMaker instruction
         if mark_type not in ['field', 'aid']:
@@ -457,7 +507,7 @@ def send_cot_task(field_op_slug, mark_type='field', aidrequest=None, aidrequests
 
         # Log TAK server configuration (moved here as it's relevant if we proceed)
         logger.info("TAK Server Config for call:", {
-            'server': field_op.tak_server.dns_name,
+            'servers': [target.tak_server for target in targets],
             'disable_cot': field_op.disable_cot,
             'field_op_slug': field_op_slug,
             'cot_maker_mark_type': cot_maker_mark_type,
@@ -470,16 +520,21 @@ def send_cot_task(field_op_slug, mark_type='field', aidrequest=None, aidrequests
             field_op_slug=field_op_slug,
             mark_type=cot_maker_mark_type, # This tells CotMaker what to look for in aid_request_ids
             aid_request_ids=final_aid_request_ids,
-            include_field_op_marker=include_the_field_op_marker
+            include_field_op_marker=include_the_field_op_marker,
+            delta_only=delta_only
         )
 
         if isinstance(result, Exception):
             error_msg = f"Error during pytak_send_cot for {field_op_slug}: {str(result)}"
             logger.error(error_msg)
             raise result # Re-raise the actual exception
+        elif isinstance(result, str) and result.startswith('Failed'):
+            # No TAK server took the events (they were spooled); fail the task so that
+            # callers like flush_pending_cot keep their changes
+            raise RuntimeError(result)
         else:
             # Construct a more informative success message based on what was intended.
-            # The actual count of messages sent is handled by CotSender/pytak internals.
+            # The actual count of messages sent is reported by pytak_send_cot.
             sent_parts = []
             if include_the_field_op_marker:
                 sent_parts.append("FieldOp marker")
@@ -490,6 +545,10 @@ def send_cot_task(field_op_slug, mark_type='field', aidrequest=None, aidrequests
                 success_msg = f"CoT task completed for {field_op_slug}, but no specific markers were designated for sending in this call."
             else:
                 success_msg = f"CoT task for {field_op_slug} initiated to send: {', '.join(sent_parts)}."
+            if isinstance(result, dict):
+                success_msg += f" Sent {result['sent']}, skipped {result['skipped']} unchanged, replayed {result['replayed']} spooled."
+                for tak_server, failure in result.get('failed', {}).items():
+                    success_msg += f" {tak_server}: {failure}."
 
             logger.info(success_msg)
             return success_msg # Return the more generic success message from pytak_send_cot or this constructed one
@@ -499,3 +558,21 @@ def send_cot_task(field_op_slug, mark_type='field', aidrequest=None, aidrequests
         logger.exception(error_msg) # Use logger.exception to include stack trace
         raise # Re-raise the caught exception to ensure Django Q2 sees it as a failure
         # return error_msg # Old: return error string
+
+
+def flush_pending_cot(field_op_slug):
+    """Send every pending AidRequest CoT change for a field op in one batch.
+
+    Run by the debounced ONCE schedule set up in cot_pending.queue_aid_request_cot().
+    Changes are only forgotten once the send succeeded; a failed flush is retried
+    with the next change to the field op, and the hourly sweep covers it regardless.
+    """
+    cutoff = timezone.now()
+    aid_request_ids = claim_pending(field_op_slug, cutoff)
+    if not aid_request_ids:
+        return f"No pending CoT updates for {field_op_slug}."
+
+    logger.info(f"Flushing {len(aid_request_ids)} pending CoT updates for {field_op_slug}")
+    result = send_cot_task(field_op_slug=field_op_slug, mark_type='aid', aidrequests=aid_request_ids)
+    release_pending(aid_request_ids, cutoff)
+    return result
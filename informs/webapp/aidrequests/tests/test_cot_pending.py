@@ -0,0 +1,67 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from django_q.models import Schedule
+
+from ..models import FieldOp, AidType, AidRequest, PendingCot
+from ..cot_pending import flush_schedule_name
+from ..tasks import flush_pending_cot
+from takserver.models import TakServer
+
+
+class TestCotPending(TestCase):
+    """Test debounced CoT sends for AidRequest changes."""
+
+    def setUp(self):
+        self.field_op = FieldOp.objects.create(name='Test Operation', slug='test-op', latitude=34.0, longitude=-118.0)
+        self.aid_type = AidType.objects.create(name='Test Aid Type', slug='test-aid')
+        self.aid_requests = [AidRequest.objects.create(field_op=self.field_op, aid_type=self.aid_type) for _ in range(2)]
+
+    def change_status(self, aid_request, status):
+        aid_request.status = status
+        aid_request.save()
+
+    def test_changes_are_coalesced_per_field_op(self):
+        """Several changes leave one pending row per request and one flush schedule"""
+        self.change_status(self.aid_requests[0], 'assigned')
+        self.change_status(self.aid_requests[0], 'resolved')
+        self.change_status(self.aid_requests[1], 'assigned')
+        self.assertEqual(PendingCot.objects.filter(field_op=self.field_op).count(), 2)
+        self.assertEqual(Schedule.objects.filter(name=flush_schedule_name('test-op')).count(), 1)
+
+    def test_flush_is_pushed_back_up_to_max_delay(self):
+        self.change_status(self.aid_requests[0], 'assigned')
+        PendingCot.objects.update(first_changed=timezone.now() - timedelta(seconds=28))
+        self.change_status(self.aid_requests[1], 'assigned')
+        schedule = Schedule.objects.get(name=flush_schedule_name('test-op'))
+        self.assertLess(schedule.next_run, timezone.now() + timedelta(seconds=3))
+        self.assertEqual(schedule.func, 'aidrequests.tasks.flush_pending_cot')
+
+    def test_flush_sends_all_pending_in_one_call(self):
+        self.change_status(self.aid_requests[0], 'assigned')
+        self.change_status(self.aid_requests[1], 'assigned')
+        with mock.patch('aidrequests.tasks.send_cot_task', return_value='sent') as send_cot_task:
+            self.assertEqual(flush_pending_cot('test-op'), 'sent')
+        send_cot_task.assert_called_once_with(
+            field_op_slug='test-op', mark_type='aid', aidrequests=[ar.pk for ar in self.aid_requests]
+        )
+        self.assertFalse(PendingCot.objects.exists())
+
+    def test_failed_flush_keeps_changes_pending(self):
+        self.change_status(self.aid_requests[0], 'assigned')
+        with mock.patch('aidrequests.tasks.send_cot_task', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                flush_pending_cot('test-op')
+        self.assertEqual(PendingCot.objects.count(), 1)
+
+    def test_unreachable_tak_server_keeps_changes_pending(self):
+        self.field_op.tak_server = TakServer.objects.create(name='test-server', dns_name='test.example.com')
+        self.field_op.save()
+        self.change_status(self.aid_requests[0], 'assigned')
+        failed = "Failed: unreachable (0 messages sent before the failure, 2 spooled)"
+        with mock.patch('aidrequests.tasks.pytak_send_cot', return_value=failed):
+            with self.assertRaisesRegex(RuntimeError, 'unreachable'):
+                flush_pending_cot('test-op')
+        self.assertEqual(PendingCot.objects.count(), 1)
@@ -0,0 +1,74 @@
+import ast
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django_q.models import Schedule
+
+from ..models import FieldOp, FieldOpNotify, AidType, AidRequest, PendingDigest
+from ..digest import digest_schedule_name
+from ..queues import NOTIFY_QUEUE
+from ..tasks import aid_request_postsave, flush_digest
+
+
+class TestDigest(TestCase):
+    """Test digest emails for bursts of new aid requests."""
+
+    def setUp(self):
+        self.field_op = FieldOp.objects.create(name='Test Operation', slug='test-op', latitude=34.0, longitude=-118.0)
+        self.digest = FieldOpNotify.objects.create(name='Digest', type='email-group', email='digest@example.com',
+                                                   digest_minutes=10)
+        self.direct = FieldOpNotify.objects.create(name='Direct', type='email-individual', email='direct@example.com')
+        self.field_op.notify.add(self.digest, self.direct)
+        self.aid_type = AidType.objects.create(name='Test Aid Type', slug='test-aid')
+
+    def new_request(self, priority=None):
+        aid_request = AidRequest.objects.create(field_op=self.field_op, aid_type=self.aid_type, priority=priority)
+        with mock.patch('aidrequests.postsave.async_task') as async_task:
+            aid_request_postsave(aid_request, is_new=True, latitude=34.1, longitude=-118.1)
+        email_calls = [call for call in async_task.call_args_list if call.args[0] == 'aidrequests.tasks.send_notification_email']
+        return aid_request, [address for call in email_calls for address in call.args[2]]
+
+    def test_digest_contacts_are_queued_and_the_rest_emailed(self):
+        first, addresses = self.new_request()
+        self.assertEqual(addresses, ['direct@example.com'])
+        second, _ = self.new_request()
+
+        self.assertEqual(set(PendingDigest.objects.values_list('aid_request_id', flat=True)), {first.pk, second.pk})
+        schedule = Schedule.objects.get(name=digest_schedule_name(self.digest.pk, 'test-op'))
+        self.assertEqual(ast.literal_eval(schedule.args), (self.digest.pk, 'test-op'))
+        self.assertEqual(ast.literal_eval(schedule.kwargs), {'q_options': {'cluster': NOTIFY_QUEUE}} if NOTIFY_QUEUE else {})
+        self.assertEqual(Schedule.objects.filter(func='aidrequests.tasks.flush_digest').count(), 1)
+
+    def test_high_priority_bypasses_the_digest(self):
+        _, addresses = self.new_request(priority='high')
+        self.assertEqual(sorted(addresses), ['digest@example.com', 'direct@example.com'])
+        self.assertFalse(PendingDigest.objects.exists())
+
+    def test_flush_sends_one_summary_with_one_map(self):
+        aid_requests = [self.new_request()[0] for _ in range(3)]
+        with tempfile.TemporaryDirectory() as base_dir, override_settings(BASE_DIR=base_dir), \
+                mock.patch('aidrequests.tasks.staticmap_digest', return_value=b'\x89PNG map') as staticmap, \
+                mock.patch('aidrequests.tasks.send_emails', return_value=[]) as send_emails:
+            result = flush_digest(self.digest.pk, 'test-op')
+
+        self.assertEqual([point[0] for point in staticmap.call_args.kwargs['aid_points']], [ar.pk for ar in aid_requests])
+        (messages,), _ = send_emails.call_args
+        message, = messages
+        self.assertEqual(message['recipients']['to'], [{'address': 'digest@example.com'}])
+        self.assertIn('3 new Aid Requests', message['content']['subject'])
+        self.assertIn(f"digest-test-op-N{self.digest.pk}-", message['content']['html'])
+        for aid_request in aid_requests:
+            self.assertIn(f"/aidrequest/{aid_request.pk}/", message['content']['html'])
+        self.assertIn('3 aid requests', result)
+        self.assertFalse(PendingDigest.objects.exists())
+        self.assertEqual(aid_requests[0].logs.filter(log_entry__contains='in a digest').count(), 1)
+
+    def test_failed_flush_keeps_the_entries(self):
+        self.new_request()
+        with mock.patch('aidrequests.tasks.staticmap_digest', return_value=None), \
+                mock.patch('aidrequests.tasks.send_emails', side_effect=RuntimeError('1 of 1 emails not sent')):
+            with self.assertRaises(RuntimeError):
+                flush_digest(self.digest.pk, 'test-op')
+        self.assertEqual(PendingDigest.objects.count(), 1)
+        self.assertEqual(flush_digest(self.direct.pk, 'test-op'), f"No pending digest entries for notify {self.direct.pk} in test-op.")
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import email_creator
+from ..email_creator import email_content, email_creator_html, email_messages
+from ..models import FieldOp, FieldOpNotify, AidType, AidRequest, AidLocation
+
+
+class TestEmailContent(TestCase):
+    """Test rendering notification emails once per event."""
+
+    def setUp(self):
+        self.field_op = FieldOp.objects.create(name='Test Operation', slug='test-op', latitude=34.0, longitude=-118.0)
+        aid_type = AidType.objects.create(name='Test Aid Type', slug='test-aid')
+        self.aid_request = AidRequest.objects.create(field_op=self.field_op, aid_type=aid_type)
+        self.aid_location = AidLocation.objects.create(aid_request=self.aid_request, latitude=34.1, longitude=-118.1)
+        self.map_file = 'media/maps/test.png'
+        email_creator._content_cache.clear()
+        self.addCleanup(email_creator._content_cache.clear)
+
+    def test_recipients_share_one_rendering(self):
+        notifies = [FieldOpNotify(name=f"N{i}", type='email-user', email=f"n{i}@example.com") for i in range(3)]
+        with mock.patch.object(email_creator, 'render_email_content', wraps=email_creator.render_email_content) as render:
+            messages = [email_creator_html(self.aid_request, self.aid_location, notify, self.map_file) for notify in notifies]
+        render.assert_called_once()
+        self.assertEqual([message['recipients']['to'] for message in messages],
+                         [[{'address': f"n{i}@example.com"}] for i in range(3)])
+        self.assertEqual(len({message['content']['html'] for message in messages}), 1)
+
+    def test_an_edit_renders_afresh(self):
+        before = email_content(self.aid_request, self.aid_location, self.map_file)
+        self.aid_request.status = 'assigned'
+        self.aid_request.save()
+        after = email_content(self.aid_request, self.aid_location, self.map_file)
+        self.assertNotEqual(before['subject'], after['subject'])
+        self.assertIn('assigned', after['subject'])
+
+    def test_cache_is_shared_between_threads(self):
+        map_files = [f"media/maps/test-{i % 4}.png" for i in range(200)]
+        with mock.patch.object(email_creator, 'EMAIL_CONTENT_CACHE_SIZE', 2), \
+                mock.patch.object(email_creator, 'render_email_content', side_effect=lambda *args: {'map': args[2]}), \
+                ThreadPoolExecutor(max_workers=8) as pool:
+            contents = list(pool.map(lambda map_file: email_content(self.aid_request, self.aid_location, map_file), map_files))
+        self.assertEqual([content['map'] for content in contents], map_files)
+        self.assertEqual(len(email_creator._content_cache), 2)
+
+    def test_batched_recipients_go_in_bcc(self):
+        content = email_content(self.aid_request, self.aid_location, self.map_file)
+        addresses = [f"n{i}@example.com" for i in range(5)]
+        with mock.patch.object(email_creator, 'EMAIL_BATCH_RECIPIENTS', True), \
+                mock.patch.object(email_creator, 'EMAIL_BATCH_SIZE', 2):
+            messages = email_messages(content, addresses)
+        self.assertEqual([len(message['recipients']['bcc']) for message in messages], [2, 2, 1])
+        self.assertNotIn('to', messages[0]['recipients'])
+        self.assertEqual(len(email_messages(content, addresses)), 5)
@@ -0,0 +1,97 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import email_sender
+from ..models import FieldOp, AidType, AidRequest
+from ..tasks import send_emails
+
+
+class FakePoller:
+    def __init__(self, message, delay):
+        self.message, self.delay = message, delay
+
+    def result(self, timeout=None):
+        time.sleep(min(self.delay, timeout))
+        if self.delay > timeout:
+            return {'id': 'op-slow', 'status': 'Running'}
+        address = self.message['recipients']['to'][0]['address']
+        if address.startswith('bounce'):
+            return {'id': f"op-{address}", 'status': 'Failed', 'error': {'message': 'Recipient rejected'}}
+        return {'id': f"op-{address}", 'status': 'Succeeded', 'error': None}
+
+
+class FakeClient:
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.threads = set()
+
+    def begin_send(self, message, polling_interval=None):
+        self.threads.add(threading.current_thread().name)
+        return FakePoller(message, self.delay)
+
+
+def email(address):
+    return {'senderAddress': 'noreply@example.com', 'recipients': {'to': [{'address': address}]},
+            'content': {'subject': 'Test', 'plainText': 'Test', 'html': '<p>Test</p>'}}
+
+
+class TestEmailSender(TestCase):
+    """Test concurrent email delivery on one client."""
+
+    def setUp(self):
+        self.client = FakeClient()
+        patcher = mock.patch.object(email_sender.EmailClient, 'from_connection_string', return_value=self.client)
+        self.from_connection_string = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, email_sender, '_client', None)
+        email_sender._client = None
+
+    def test_messages_are_sent_together_on_one_client(self):
+        started = time.monotonic()
+        results = email_sender.send_messages([email(f"user{i}@example.com") for i in range(6)])
+        elapsed = time.monotonic() - started
+        results += email_sender.send_messages([email('late@example.com')])
+
+        self.assertLess(elapsed, 0.6)  # about one round trip, not six
+        self.assertGreater(len(self.client.threads), 1)
+        self.from_connection_string.assert_called_once()
+        self.assertEqual({result.status for result in results}, {'Succeeded'})
+        self.assertEqual(results[0].recipients, ['user0@example.com'])
+        self.assertEqual(results[0].message_id, 'op-user0@example.com')
+
+    def test_slow_sends_time_out_without_holding_up_the_batch(self):
+        self.client.delay = 5
+        with mock.patch.object(email_sender, 'EMAIL_SEND_TIMEOUT', 0.2):
+            started = time.monotonic()
+            result, = email_sender.send_messages([email('slow@example.com')])
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(result.status, 'Timeout')
+
+
+class TestSendEmailsTask(TestCase):
+    """Test the send_emails task's result log."""
+
+    def setUp(self):
+        field_op = FieldOp.objects.create(name='Test Operation', slug='test-op', latitude=34.0, longitude=-118.0)
+        aid_type = AidType.objects.create(name='Test Aid Type', slug='test-aid')
+        self.aid_request = AidRequest.objects.create(field_op=field_op, aid_type=aid_type)
+        patcher = mock.patch.object(email_sender.EmailClient, 'from_connection_string', return_value=FakeClient(0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, email_sender, '_client', None)
+        email_sender._client = None
+
+    def test_results_are_logged_in_one_entry(self):
+        results = send_emails([email('a@example.com'), email('b@example.com')], aid_request_pk=self.aid_request.pk)
+        self.assertEqual([result['status'] for result in results], ['Succeeded', 'Succeeded'])
+        log, = self.aid_request.logs.all()
+        self.assertEqual(log.log_entry, "Email to a@example.com sent.\nEmail to b@example.com sent.")
+
+    def test_a_failed_recipient_fails_the_task(self):
+        with self.assertRaisesRegex(RuntimeError, '1 of 2 emails not sent'):
+            send_emails([email('a@example.com'), email('bounce@example.com')], aid_request_pk=self.aid_request.pk)
+        log, = self.aid_request.logs.all()
+        self.assertIn("Email to bounce@example.com failed (Failed): Recipient rejected", log.log_entry)
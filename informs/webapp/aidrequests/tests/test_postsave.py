@@ -0,0 +1,117 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from ..models import FieldOp, FieldOpNotify, AidType, AidRequest, AidLocation, CotDestination
+from ..postsave import Stage, run_stages
+from ..tasks import aid_request_postsave, send_notification_email
+from takserver.models import TakServer
+
+
+class TestPostsaveStages(TestCase):
+    """Test the staged post-save pipeline for new aid requests."""
+
+    def setUp(self):
+        self.tak_server = TakServer.objects.create(name='test-server', dns_name='test.example.com')
+        self.field_op = FieldOp.objects.create(
+            name='Test Operation', slug='test-op', latitude=34.0, longitude=-118.0, tak_server=self.tak_server
+        )
+        self.field_op.notify.add(
+            FieldOpNotify.objects.create(name='Dispatch', type='email-group', email='dispatch@example.com'),
+            FieldOpNotify.objects.create(name='Phone', type='sms', sms_number='5550100'),
+        )
+        self.aid_type = AidType.objects.create(name='Test Aid Type', slug='test-aid')
+        self.aid_request = AidRequest.objects.create(field_op=self.field_op, aid_type=self.aid_type)
+
+    def postsave(self, **kwargs):
+        with mock.patch('aidrequests.postsave.async_task') as async_task:
+            result = aid_request_postsave(self.aid_request, is_new=True, **kwargs)
+        return result, async_task.call_args_list
+
+    def test_stages_skip_after_a_failure(self):
+        calls = []
+
+        def fail(aid_request, context):
+            raise RuntimeError("no route")
+
+        def record(aid_request, context):
+            calls.append(context['first']['status'])
+            return {'status': 'success'}
+
+        report = run_stages(
+            [Stage('first', fail), Stage('second', record, after=('first',)), Stage('third', record)],
+            self.aid_request, {},
+        )
+        self.assertEqual(report['first']['status'], 'failed')
+        self.assertEqual(report['first']['message'], 'no route')
+        self.assertEqual(report['second']['status'], 'skipped')
+        self.assertEqual(report['third']['status'], 'success')
+        self.assertEqual(calls, ['failed'])
+        self.assertIn('duration', report['third'])
+
+    def test_emails_go_out_before_map_and_cot(self):
+        result, calls = self.postsave(latitude=34.1, longitude=-118.1, location_source='manual')
+        funcs = [call.args[0] for call in calls]
+        self.assertEqual(funcs, [
+            'aidrequests.tasks.send_notification_email',
+            'aidrequests.tasks.generate_static_map_for_location',
+            'aidrequests.tasks.send_cot_task',
+        ])
+
+        location = AidLocation.objects.get(aid_request=self.aid_request)
+        self.assertEqual(result['location_created_pk'], location.pk)
+        self.assertEqual(result['email_tasks_queued'], [calls[0].kwargs['task_name']])
+        self.assertEqual((result['map_task'], result['cot_task']), (f"AR{self.aid_request.pk}_map", f"AR{self.aid_request.pk}_cot"))
+        # the email links to the map the map task is about to draw
+        map_filename = calls[1].kwargs['map_filename']
+        self.assertEqual(result['map_filename'], map_filename)
+        self.assertIn(map_filename, calls[0].args[1]['html'])
+        self.assertEqual({stage['status'] for stage in result['stages'].values()}, {'success', 'queued'})
+
+    def test_failed_geocode_skips_everything_after_it(self):
+        self.aid_request.street_address, self.aid_request.city, self.aid_request.state = '1 Main St', 'Town', 'CA'
+        with mock.patch('aidrequests.postsave.get_azure_geocode', return_value={'status': 'No results'}):
+            result, calls = self.postsave()
+        self.assertEqual(calls, [])
+        self.assertIsNone(result['location_created_pk'])
+        self.assertEqual(result['stages']['location']['status'], 'failed')
+        self.assertEqual({result['stages'][name]['status'] for name in ('notify', 'map', 'cot')}, {'skipped'})
+
+    def test_no_cot_task_when_cot_is_disabled(self):
+        self.field_op.disable_cot = True
+        self.field_op.save()
+        result, calls = self.postsave(latitude=34.1, longitude=-118.1)
+        self.assertIsNone(result['cot_task'])
+        self.assertEqual(result['stages']['cot']['status'], 'skipped')
+        self.assertNotIn('aidrequests.tasks.send_cot_task', [call.args[0] for call in calls])
+
+    def test_cot_task_for_destinations_without_a_field_op_server(self):
+        self.field_op.tak_server = None
+        self.field_op.save()
+        result, calls = self.postsave(latitude=34.1, longitude=-118.1)
+        self.assertEqual(result['stages']['cot']['status'], 'skipped')
+
+        CotDestination.objects.create(field_op=self.field_op, tak_server=self.tak_server)
+        self.aid_request.field_op = FieldOp.objects.get(pk=self.field_op.pk)
+        result, calls = self.postsave(latitude=34.1, longitude=-118.1)
+        self.assertEqual(result['stages']['cot']['status'], 'queued')
+        self.assertIn('aidrequests.tasks.send_cot_task', [call.args[0] for call in calls])
+
+    def test_email_leaves_out_a_map_that_was_not_drawn(self):
+        _, calls = self.postsave(latitude=34.1, longitude=-118.1)
+        call = calls[0]
+        kwargs = {key: call.kwargs[key] for key in ('aid_request_pk', 'map_file', 'content_without_map')}
+        with tempfile.TemporaryDirectory() as base_dir, override_settings(BASE_DIR=base_dir), \
+                mock.patch('aidrequests.tasks.EMAIL_MAP_WAIT', 0), \
+                mock.patch('aidrequests.tasks.send_emails', return_value=[]) as send_emails:
+            send_notification_email(*call.args[1:], **kwargs)
+            os.makedirs(os.path.join(base_dir, settings.MAPS_PATH))
+            open(os.path.join(base_dir, kwargs['map_file']), 'wb').close()
+            send_notification_email(*call.args[1:], **kwargs)
+        without_map, with_map = [messages[0]['content']['html'] for (messages,), _ in send_emails.call_args_list]
+        self.assertNotIn(kwargs['map_file'], without_map)
+        self.assertIn('No map available', without_map)
+        self.assertIn(kwargs['map_file'], with_map)
@@ -0,0 +1,100 @@
+import ast
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_q.models import OrmQ, Schedule, Task
+
+from ..models import FieldOp, FieldOpNotify, AidType, AidRequest
+from ..cot_pending import flush_schedule_name
+from ..queues import queue_name, queue_stats, schedule_options
+from ..tasks import aid_request_postsave
+from takserver.cot_sweep import COT_SWEEP_TIMEOUT
+from takserver.models import TakServer
+
+
+# every named queue configured, as with Q_ALT_CLUSTERS=cot,notify,maps,geocode
+NAMED_QUEUES = {**settings.Q_CLUSTER, 'ALT_CLUSTERS': settings.Q_NAMED_CLUSTERS}
+
+
+class TestQueues(TestCase):
+    """Test routing of tasks to the named django-q queues."""
+
+    def setUp(self):
+        self.field_op = FieldOp.objects.create(name='Test Operation', slug='test-op', latitude=34.0, longitude=-118.0)
+        self.aid_type = AidType.objects.create(name='Test Aid Type', slug='test-aid')
+        self.aid_request = AidRequest.objects.create(field_op=self.field_op, aid_type=self.aid_type)
+
+    def queues(self):
+        """The routing queues.py resolves under the current settings"""
+        return {setting: queue_name(setting, default) for setting, default in
+                (('COT_QUEUE', 'cot'), ('NOTIFY_QUEUE', 'notify'), ('MAPS_QUEUE', 'maps'))}
+
+    def postsave_routes(self, queues):
+        """{task: queue} of the tasks the post-save pipeline enqueues for a new aid request"""
+        self.field_op.notify.add(FieldOpNotify.objects.create(name='Dispatch', type='email-group', email='d@example.com'))
+        self.field_op.tak_server = TakServer.objects.create(name='test-server', dns_name='test.example.com')
+        self.field_op.save()
+        with mock.patch.multiple('aidrequests.postsave', **queues), \
+                mock.patch('aidrequests.postsave.async_task') as async_task:
+            aid_request_postsave(self.aid_request, is_new=True, latitude=34.1, longitude=-118.1)
+        return {call.args[0]: call.kwargs['cluster'] for call in async_task.call_args_list}
+
+    def test_queue_without_a_cluster_routes_to_the_default_queue(self):
+        with override_settings(Q_CLUSTER=NAMED_QUEUES):
+            self.assertEqual(queue_name('NOTIFY_QUEUE', 'notify'), 'notify')
+        with override_settings(Q_CLUSTER={'name': 'ORM'}):
+            self.assertIsNone(queue_name('NOTIFY_QUEUE', 'notify'))
+        self.assertEqual(schedule_options(None), {})
+
+    def test_unconfigured_queues_route_to_the_default_queue(self):
+        with override_settings(Q_CLUSTER={**settings.Q_CLUSTER, 'ALT_CLUSTERS': {}}):
+            queues = self.queues()
+        self.assertEqual(set(queues.values()), {None})
+        self.assertEqual(set(self.postsave_routes(queues).values()), {None})
+
+    def test_cot_sweep_finishes_within_the_cot_queue_timeout(self):
+        cot = settings.Q_NAMED_CLUSTERS['cot']
+        self.assertLess(COT_SWEEP_TIMEOUT, cot['timeout'])
+        self.assertLess(cot['timeout'], cot['retry'])
+
+    def test_postsave_fans_out_to_separate_queues(self):
+        with override_settings(Q_CLUSTER=NAMED_QUEUES):
+            queues = self.queues()
+        self.assertEqual(self.postsave_routes(queues), {
+            'aidrequests.tasks.send_notification_email': 'notify',
+            'aidrequests.tasks.generate_static_map_for_location': 'maps',
+            'aidrequests.tasks.send_cot_task': 'cot',
+        })
+
+    def test_cot_flush_schedule_enqueues_on_the_cot_queue(self):
+        with mock.patch('aidrequests.cot_pending.COT_QUEUE', 'cot'):
+            self.aid_request.status = 'assigned'
+            self.aid_request.save()
+        schedule = Schedule.objects.get(name=flush_schedule_name('test-op'))
+        self.assertIsNone(schedule.cluster)  # left to the default cluster's scheduler
+        self.assertEqual(ast.literal_eval(schedule.kwargs), {'q_options': {'cluster': 'cot'}})
+
+    @override_settings(Q_CLUSTER=NAMED_QUEUES)
+    def test_queue_stats_report_depth_and_wait_per_queue(self):
+        now = timezone.now()
+        OrmQ.objects.create(key='notify', payload='x', lock=now - timedelta(seconds=40))
+        OrmQ.objects.create(key='notify', payload='x', lock=now - timedelta(seconds=5))
+        OrmQ.objects.create(key='notify', payload='x', lock=now + timedelta(seconds=60))
+        Task.objects.create(id='t1', name='t1', func='f', cluster='cot', started=now - timedelta(seconds=3),
+                            stopped=now, success=True)
+        Task.objects.create(id='t2', name='t2', func='f', cluster='cot', started=now - timedelta(seconds=1),
+                            stopped=now, success=False)
+
+        stats = {queue.name: queue for queue in queue_stats()}
+        self.assertEqual(set(stats), {'ORM', 'cot', 'notify', 'maps', 'geocode'})
+        notify = stats['notify']
+        self.assertEqual((notify.queued, notify.running), (2, 1))
+        self.assertGreaterEqual(notify.oldest_wait, 40)
+        self.assertIsNone(notify.run_time)
+        cot = stats['cot']
+        self.assertEqual((cot.queued, cot.oldest_wait), (0, 0.0))
+        self.assertAlmostEqual(cot.run_time, 2.0, places=3)
+        self.assertEqual(cot.failed, 1)
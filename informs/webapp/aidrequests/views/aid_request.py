@@ -13,7 +13,6 @@ import logging
 from geopy.distance import geodesic
 
 from ..models import AidRequest, FieldOp, AidRequestLog, AidLocation
-from ..tasks import aid_request_postsave, send_cot_task
 from ..forms import (
     AidRequestCreateFormA,
     RequestorInformationForm,
@@ -28,6 +27,7 @@ from .aid_request_forms_c import AidRequestCreateFormC
 from .aid_location_forms import AidLocationCreateForm
 from ..context_processors import get_field_op_from_kwargs
 from ..geocoder import get_azure_geocode
+from ..queues import GEOCODE_QUEUE
 
 logger = logging.getLogger(__name__)
 
@@ -124,6 +124,7 @@ class AidRequestCreateView(CreateView):
             location_note=location_note,
             location_source=location_source,
             task_name=task_name,
+            cluster=GEOCODE_QUEUE,
         )
 
         # Redirect to the list view for this field_op after creating
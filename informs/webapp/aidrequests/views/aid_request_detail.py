@@ -12,7 +12,6 @@ from .aid_location_forms import AidLocationStatusForm
 from .aid_request import has_location_status, format_aid_location_note
 from .maps import staticmap_aid
 from ..geocoder import get_azure_geocode, geocode_save
-from ..tasks import send_cot_task
 
 from datetime import datetime
 # from time import perf_counter as timer
@@ -7,7 +7,7 @@ from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit
 
 from ..models import FieldOp, AidRequest, FieldOpNotify
-from ..tasks import aid_request_notify
+from ..queues import NOTIFY_QUEUE
 
 from datetime import datetime
 
@@ -83,12 +83,13 @@ class AidRequestNotifyView(LoginRequiredMixin, PermissionRequiredMixin, DetailVi
                 )
                 return self.render_to_response(self.get_context_data(form=form))
             tasks.async_task(
-                        aid_request_notify,
+                        'aidrequests.tasks.aid_request_notify',
                         self.object,
                         kwargs={
                             'notifies': notifies,
                             'email_extra': email_extra},
-                        task_name=f"AR{self.object.pk}-Notifications-Manual-{timestamp}")
+                        task_name=f"AR{self.object.pk}-Notifications-Manual-{timestamp}",
+                        cluster=NOTIFY_QUEUE)
             return redirect('aid_request_detail', field_op=self.get_object().field_op.slug, pk=self.get_object().pk)
         else:
             return self.render_to_response(self.get_context_data(form=form))
@@ -20,6 +20,20 @@ def get_task_status(task_name):
         return "Failed"
     return "In Progress"
 
+def get_map_status(task_name):
+    """Status of the post-save map task, and the map's filename once it is drawn."""
+    task = fetch(task_name) if task_name else None
+    if task is None:
+        return "Pending", None
+    if task.success:
+        result = task.result or {}
+        if result.get('status') == 'success':
+            return "Success", result.get('map_filename')
+        return "Failed", None
+    if task.stopped:
+        return "Failed", None
+    return "In Progress", None
+
 def get_aid_request_status(request, pk):
     """
     API endpoint to get the processing status of an AidRequest.
@@ -43,21 +57,38 @@ def get_aid_request_status(request, pk):
     if not post_save_task:
         return JsonResponse(status_data)
 
+    cot_task = None
     if post_save_task.success:
-        status_data['location_status'] = "Success"
-        post_save_result = post_save_task.result()
+        post_save_result = post_save_task.result if isinstance(post_save_task.result, dict) else {}
+        stages = post_save_result.get('stages')
 
-        if post_save_result.get('map_generated'):
-            status_data['map_status'] = "Success"
-            map_filename = post_save_result.get('map_filename')
+        if stages is None:
+            # Results from before the staged pipeline
+            status_data['location_status'] = "Success"
+            if post_save_result.get('map_generated'):
+                status_data['map_status'] = "Success"
+                map_filename = post_save_result.get('map_filename')
+                if map_filename:
+                    status_data['map_url'] = f"{settings.MEDIA_URL}maps/{map_filename}"
+            else:
+                status_data['map_status'] = "Failed"
+        elif stages['location']['status'] != 'success':
+            status_data['location_status'] = "Failed"
+            status_data['map_status'] = "Skipped"
+            status_data['cot_status'] = "Skipped"
+        else:
+            status_data['location_status'] = "Success"
+            status_data['map_status'], map_filename = get_map_status(post_save_result.get('map_task'))
             if map_filename:
                 status_data['map_url'] = f"{settings.MEDIA_URL}maps/{map_filename}"
-        else:
-            status_data['map_status'] = "Failed"
+            cot_task = post_save_result.get('cot_task')
+            status_data['cot_status'] = get_task_status(cot_task) if cot_task else "Not Required"
 
         # 2. Check email tasks based on the result of the first task
         email_tasks = post_save_result.get('email_tasks_queued', [])
-        if not email_tasks:
+        if not email_tasks and (stages or {}).get('notify', {}).get('digest'):
+            status_data['email_status'] = "Digest"
+        elif not email_tasks:
             status_data['email_status'] = "Not Required"
         else:
             email_statuses = [get_task_status(name) for name in email_tasks]
@@ -78,12 +109,14 @@ def get_aid_request_status(request, pk):
         status_data['location_status'] = "In Progress"
         status_data['map_status'] = "In Progress"
 
-    # Placeholder for CoT status check
-    if aid_request.logs.filter(log_entry__icontains='COT sent').exists():
+    # Aid requests from before the staged pipeline have no CoT task to follow
+    if status_data['cot_status'] == 'Pending' and aid_request.logs.filter(log_entry__icontains='COT sent').exists():
         status_data['cot_status'] = "Success"
 
     final_statuses = [status_data['location_status'], status_data['map_status'], status_data['email_status']]
-    if all(s in ["Success", "Not Required", "Skipped"] for s in final_statuses):
+    if cot_task:
+        final_statuses.append(status_data['cot_status'])
+    if all(s in ["Success", "Not Required", "Skipped", "Digest"] for s in final_statuses):
         status_data['all_done'] = True
 
     return JsonResponse(status_data)
@@ -7,7 +7,7 @@ from django_q.tasks import async_task
 from datetime import datetime
 
 from ..models import FieldOp
-from ..tasks import send_cot_task
+from ..queues import COT_QUEUE
 # from icecream import ic
 
 
@@ -35,10 +35,11 @@ def toggle_cot(request, field_op):
             timestamp_now = datetime.now().strftime('%Y%m%d-%H%M%S')
             task_title = f"TAK-field-OnEnable_{timestamp_now}"
             async_task(
-                send_cot_task,
+                'aidrequests.tasks.send_cot_task',
                 field_op_slug=field_op,
                 mark_type='field',
-                task_name=task_title
+                task_name=task_title,
+                cluster=COT_QUEUE
             )
 
         return JsonResponse({
@@ -5,6 +5,7 @@ from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django_q.tasks import async_task
 from ..models import AidRequest
+from ..queues import NOTIFY_QUEUE
 import json
 import logging
 
@@ -37,9 +38,11 @@ def send_email_view(request, pk, field_op):
         }
 
         async_task(
-            'aidrequests.tasks.send_email',
-            message,
-            task_name=f"Send Email for Aid Request {pk}"
+            'aidrequests.tasks.send_emails',
+            [message],
+            aid_request_pk=pk,
+            task_name=f"Send Email for Aid Request {pk}",
+            cluster=NOTIFY_QUEUE
         )
 
         return JsonResponse({'status': 'success', 'message': 'Email task has been queued.'})
@@ -6,6 +6,7 @@ from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required, permission_required
 
 from ..models import AidRequest, FieldOp
+from ..queues import COT_QUEUE
 from icecream import ic
 from datetime import datetime
 import re
@@ -73,6 +74,7 @@ def send_cot(request, field_op=None):
         sendcot_id = async_task(
             'aidrequests.tasks.send_cot_task',
             task_name=task_title,
+            cluster=COT_QUEUE,
             **task_kwargs
         )
 
@@ -0,0 +1,51 @@
+from asgiref.sync import async_to_sync
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_http_methods
+from django.contrib.auth.decorators import login_required, permission_required
+
+from takserver.cot_kml import KML_CONTENT_TYPE, kml_state, field_op_kml, network_link_kml
+from ..models import FieldOp
+
+
+@login_required
+@permission_required('aidrequests.view_aidrequest')
+@require_http_methods(["GET", "HEAD"])
+def cot_kml(request, field_op=None):
+    """
+    KML of the field op marker and the field op's active aid requests.
+
+    Answers If-None-Match / If-Modified-Since with 304 after a single query;
+    the markers are only built when the field op changed.
+    """
+    state = kml_state(field_op)
+    if state is None:
+        raise Http404("No field operation found")
+    last_modified, etag = state
+    etag = quote_etag(etag)
+    last_modified = int(last_modified.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        field_operation = FieldOp.objects.get(slug=field_op)
+        response = HttpResponse(async_to_sync(field_op_kml)(field_operation), content_type=KML_CONTENT_TYPE)
+        response['Content-Disposition'] = f'inline; filename="{field_operation.slug}.kml"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+@permission_required('aidrequests.view_aidrequest')
+@require_http_methods(["GET", "HEAD"])
+def cot_kml_link(request, field_op=None):
+    """KML network link that has Google Earth (or a TAK plugin) poll the field op's KML feed."""
+    field_operation = get_object_or_404(FieldOp, slug=field_op)
+    href = request.build_absolute_uri(reverse('cot_kml', kwargs={'field_op': field_operation.slug}))
+    response = HttpResponse(network_link_kml(field_operation.name, href), content_type=KML_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{field_operation.slug}-link.kml"'
+    return response
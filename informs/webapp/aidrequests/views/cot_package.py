@@ -0,0 +1,38 @@
+import os
+
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_http_methods
+from django.contrib.auth.decorators import login_required, permission_required
+
+from takserver.cot_package import current_package, build_package
+from ..models import FieldOp
+
+
+def package_etag(request, field_op=None):
+    """ETag of the cached package, so an unchanged field op answers 304 without building anything."""
+    package = current_package(get_object_or_404(FieldOp, slug=field_op))
+    return package.etag if package else None
+
+
+@login_required
+@permission_required('aidrequests.view_aidrequest')
+@require_http_methods(["GET", "HEAD"])
+@condition(etag_func=package_etag)
+def cot_package(request, field_op=None):
+    """
+    TAK data package (zip) of the field op marker and the field op's active aid requests,
+    for side-loading into ATAK/WinTAK. Built on the first download after a change.
+    """
+    field_operation = get_object_or_404(FieldOp, slug=field_op)
+
+    package, cached = current_package(field_operation), True
+    if package is None:
+        package, cached = build_package(field_operation)
+    response = FileResponse(open(package.path, 'rb'), as_attachment=True, filename=f"{field_operation.slug}.zip")
+    if not cached:
+        # served from the open file; a newer package is built for the next download
+        os.remove(package.path)
+    response['ETag'] = f'"{package.etag}"'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
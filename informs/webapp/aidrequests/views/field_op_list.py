@@ -16,7 +16,8 @@ class FieldOpListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     permission_required = 'aidrequests.view_fieldop'
 
     def get_queryset(self):
-        queryset = FieldOp.objects.annotate(
+        # TAK server circuit state is shown in each row
+        queryset = FieldOp.objects.select_related('tak_server__health').annotate(
             aidrequests_active_count=Count(
                 'aid_requests',
                 filter=Q(aid_requests__status__in=AidRequest.ACTIVE_STATUSES)
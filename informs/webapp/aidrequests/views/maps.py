@@ -12,6 +12,7 @@ from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 import os
 from ..models import AidLocation, AidRequest, FieldOp
+from ..queues import MAPS_QUEUE
 
 def staticmap_aid(width=600, height=400,
                   fieldop_lat=0.0, fieldop_lon=0.0,
@@ -73,6 +74,45 @@ def staticmap_aid(width=600, height=400,
         return None
 
 
+def staticmap_digest(width=600, height=600, fieldop_lat=0.0, fieldop_lon=0.0, aid_points=()):
+    """Static map of a field op and several aid locations, each labelled with its aid request ID.
+
+    aid_points: (label, latitude, longitude) tuples
+    """
+    lats = [float(fieldop_lat)] + [float(lat) for _, lat, _ in aid_points]
+    lons = [float(fieldop_lon)] + [float(lon) for _, _, lon in aid_points]
+    center_lat = (min(lats) + max(lats)) / 2
+    center_lon = (min(lons) + max(lons)) / 2
+    try:
+        distance_km = geodesic((min(lats), min(lons)), (max(lats), max(lons))).kilometers
+    except Exception:
+        distance_km = 0
+
+    aid_pins = '|'.join(f"'{label}'{lon} {lat}" for label, lat, lon in aid_points)
+    params = [
+        ('subscription-key', settings.AZURE_MAPS_KEY),
+        ('api-version', '2024-04-01'),
+        ('tilesetId', 'microsoft.base.road'),
+        ('zoom', calculate_zoom(distance_km)),
+        ('center', f'{center_lon},{center_lat}'),
+        ('width', width),
+        ('height', height),
+        ('pins', f"default|co008000|lcFFFFFF||'OP'{fieldop_lon} {fieldop_lat}"),
+        ('pins', f"default|coFFFF00|lc000000||{aid_pins}"),
+    ]
+    try:
+        response = httpx.get(settings.AZURE_MAPS_STATIC_URL, params=params)
+        response.raise_for_status()
+    except Exception as e:
+        ic(f"Error making digest static map request: {e}")
+        return None
+
+    if response.content.startswith(b'\x89PNG'):
+        return response.content
+    ic("Non-PNG response from Azure Maps:", response.text)
+    return None
+
+
 def calculate_zoom(distance_km):
     """Calculate zoom level based on distance between points."""
     if distance_km <= 1:
@@ -144,7 +184,8 @@ def create_static_map(location: object, synchronous=False) -> None:
         async_task(
             'aidrequests.tasks.generate_static_map_for_location',
             location.pk,
-            task_name=task_name
+            task_name=task_name,
+            cluster=MAPS_QUEUE
         )
 
 def update_location_map_filename(task):
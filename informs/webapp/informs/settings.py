@@ -259,6 +259,19 @@ AZURE_MAPS_STATIC_URL = 'https://atlas.microsoft.com/map/static'
 MAPS_PATH = 'media/maps'
 
 # django-q configuration
+# Named queues, each run by its own cluster: Q_CLUSTER_NAME=cot python manage.py qcluster
+# Tasks are routed to them in aidrequests.queues; retry must stay above timeout.
+# cot runs the CoT sweeps, whose COT_SWEEP_TIMEOUT (150s) must stay under its timeout.
+Q_NAMED_CLUSTERS = {
+    'cot': {'workers': 2, 'timeout': 180, 'retry': 300, 'scheduler': False, 'label': 'CoT Queue'},
+    'notify': {'workers': 2, 'timeout': 60, 'retry': 90, 'scheduler': False, 'label': 'Notify Queue'},
+    'maps': {'workers': 1, 'timeout': 120, 'retry': 180, 'scheduler': False, 'label': 'Maps Queue'},
+    'geocode': {'workers': 2, 'timeout': 60, 'retry': 90, 'scheduler': False, 'label': 'Geocode Queue'},
+}
+# Only the named queues listed here (e.g. "cot,notify,maps,geocode") are used, and each needs
+# its cluster running; the rest go to the default queue. Web and clusters need the same list.
+Q_ALT_CLUSTERS = [name.strip() for name in os.environ.get('Q_ALT_CLUSTERS', '').split(',') if name.strip()]
+
 Q_CLUSTER = {
     'name': 'ORM',
     'workers': 1,
@@ -270,7 +283,8 @@ Q_CLUSTER = {
     # 'sync': DEBUG,
     'scheduler': True,
     'catch_up': False,
-    'label': 'Default ORM Queue'
+    'label': 'Default ORM Queue',
+    'ALT_CLUSTERS': {name: Q_NAMED_CLUSTERS[name] for name in Q_ALT_CLUSTERS if name in Q_NAMED_CLUSTERS},
 }
 
 # Email Setup
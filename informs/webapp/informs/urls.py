@@ -39,6 +39,8 @@ from aidrequests.views.aid_location_add import (
 )
 
 from aidrequests.views.ajax_sendcot import send_cot, sendcot_checkstatus
+from aidrequests.views.cot_package import cot_package
+from aidrequests.views.cot_kml import cot_kml, cot_kml_link
 from aidrequests.views.ajax_fieldop import toggle_cot
 from aidrequests.views.location import geocode_address
 from aidrequests.views.aid_request_status import get_aid_request_status
@@ -122,6 +124,9 @@ urlpatterns = [
      path('api/<slug:field_op>/send-cot/', send_cot, name='send_cot'),
      path('api/<slug:field_op>/sendcot-aidrequest/', send_cot, name='sendcot_aidrequest'),
      path('api/<slug:field_op>/sendcot-checkstatus/', sendcot_checkstatus, name='sendcot_checkstatus'),
+     path('api/<slug:field_op>/cot-package/', cot_package, name='cot_package'),
+     path('api/<slug:field_op>/kml/', cot_kml, name='cot_kml'),
+     path('api/<slug:field_op>/kml/link/', cot_kml_link, name='cot_kml_link'),
      path('api/<slug:field_op>/geocode/', geocode_address, name='geocode_address'),
      path('api/<slug:field_op>/aidrequest/<int:pk>/status/', get_aid_request_status, name='get_aid_request_status'),
      path('api/<slug:field_op>/aidlocation/<int:location_pk>/remap/', regenerate_static_map, name='static_map_regenerate'),
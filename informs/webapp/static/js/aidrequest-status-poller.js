@@ -79,6 +79,9 @@ document.addEventListener('DOMContentLoaded', function () {
             case 'Queued':
                 textClass = 'text-primary';
                 break;
+            case 'Digest':
+                icon = '<i class="bi bi-clock-fill text-secondary"></i>';
+                break;
             case 'Pending':
                  // Don't show anything for pending
                 return;
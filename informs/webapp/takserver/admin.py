@@ -1,12 +1,47 @@
 from django.contrib import admin
 # from django.db.models import Count
 
-from .models import TakServer
+from .models import TakServer, TakServerHealth, CotTrack
+
+
+class TakServerHealthInline(admin.StackedInline):
+    """Read-only CoT circuit breaker state"""
+    model = TakServerHealth
+    can_delete = False
+    readonly_fields = ('state', 'consecutive_failures', 'last_error', 'last_error_at', 'last_success_at', 'opened_at')
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 class TakServerAdmin(admin.ModelAdmin):
     """TAK Service admin"""
-    list_display = ('name', 'dns_name',)
+    list_display = ('name', 'dns_name', 'transport', 'cot_encoding', 'circuit_state', 'last_error',)
+    list_select_related = ('health',)
+    inlines = [TakServerHealthInline]
+
+    @admin.display(description='Circuit')
+    def circuit_state(self, obj):
+        health = getattr(obj, 'health', None)
+        return health.get_state_display() if health else 'Closed'
+
+    @admin.display(description='Last error')
+    def last_error(self, obj):
+        health = getattr(obj, 'health', None)
+        if not health or not health.last_error_at:
+            return '-'
+        return f"{health.last_error_at:%Y-%m-%d %H:%M} {health.last_error}"
 
 
 admin.site.register(TakServer, TakServerAdmin)
+
+
+class CotTrackAdmin(admin.ModelAdmin):
+    """Positions and markers received from TAK servers"""
+    list_display = ('callsign', 'uid', 'cot_type', 'tak_server', 'latitude', 'longitude', 'event_time', 'received_at')
+    list_filter = ('tak_server',)
+    search_fields = ('callsign', 'uid')
+    readonly_fields = ('tak_server', 'uid', 'cot_type', 'callsign', 'latitude', 'longitude', 'event_time', 'stale_at', 'received_at')
+
+
+admin.site.register(CotTrack, CotTrackAdmin)
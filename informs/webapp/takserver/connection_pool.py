@@ -0,0 +1,469 @@
+"""
+Long-lived TLS connections to TAK servers for CoT sends.
+
+django-q runs each CoT task synchronously, so every send used to create a new
+event loop, SSL context and TLS session. Instead, each worker process keeps one
+background event loop thread and one authenticated connection per TakServer.
+Connections are health checked before use and reopened transparently.
+
+A TakServer with transport 'udp' is a local SA destination (multicast group or EUD
+address, e.g. 239.2.3.1:6969) for when the TAK server cannot be reached: the pool keeps a
+non-blocking datagram socket for it instead, one event per datagram, paced to COT_UDP_RATE.
+"""
+import asyncio
+import atexit
+import ipaddress
+import logging
+import os
+import socket
+import ssl
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from .cot_protobuf import TAK_PROTO_VERSION, takp_request, offered_versions, response_status, mesh_packet
+
+logger = logging.getLogger(__name__)
+
+# TAK server streaming (TLS) port
+TAK_STREAMING_PORT = 8089
+# ATAK SA multicast port
+TAK_SA_PORT = 6969
+
+PYTAK_CONNECTION_TIMEOUT = getattr(settings, 'PYTAK_CONNECTION_TIMEOUT', 10)  # Default 10s, for asyncio.open_connection
+PYTAK_WRITER_CLOSE_TIMEOUT = getattr(settings, 'PYTAK_WRITER_CLOSE_TIMEOUT', 10)  # Default 10s, for writer.wait_closed()
+PYTAK_CONNECT_SETTLE_DELAY = getattr(settings, 'PYTAK_CONNECT_SETTLE_DELAY', 0.25)  # server-side queue setup, new connections only
+PYTAK_POOL_IDLE_TIMEOUT = getattr(settings, 'PYTAK_POOL_IDLE_TIMEOUT', 600)  # reconnect connections idle longer than this
+PYTAK_NEGOTIATION_TIMEOUT = getattr(settings, 'PYTAK_NEGOTIATION_TIMEOUT', 10)  # TAK protocol v1 negotiation, protobuf endpoints only
+COT_UDP_MAX_PACKET = getattr(settings, 'COT_UDP_MAX_PACKET', 8192)  # bytes per SA datagram; larger events are not sent
+COT_UDP_RATE = getattr(settings, 'COT_UDP_RATE', 2000)  # SA datagrams per second, 0 to send unpaced
+COT_UDP_PACING_SLICE = getattr(settings, 'COT_UDP_PACING_SLICE', 0.005)  # seconds ahead of the rate before pausing
+COT_UDP_MULTICAST_TTL = getattr(settings, 'COT_UDP_MULTICAST_TTL', 1)  # multicast hops; 1 stays on the local network
+
+# Identifies one TAK server connection: same host, certificate files, encoding and transport share a socket
+TakEndpoint = namedtuple('TakEndpoint', ['host', 'port', 'certfile', 'cafile', 'encoding', 'transport'],
+                         defaults=('xml', 'tls'))
+
+
+def endpoint_for(tak_server, encoding=None):
+    """Return the pool key for a TakServer.
+
+    dns_name may carry a port ("host:port"), otherwise the TAK streaming port (SA port for
+    UDP) is used. encoding overrides the server's cot_encoding (a CotDestination may ask for
+    another one).
+    """
+    host, _, port = tak_server.dns_name.partition(':')
+    if tak_server.transport == 'udp':
+        return TakEndpoint(host=host, port=int(port) if port else TAK_SA_PORT, certfile=None, cafile=None,
+                           encoding=encoding or tak_server.cot_encoding, transport='udp')
+    return TakEndpoint(
+        host=host,
+        port=int(port) if port else TAK_STREAMING_PORT,
+        certfile=tak_server.cert_private.path if tak_server.cert_private else None,
+        cafile=tak_server.cert_trust.path if tak_server.cert_trust else None,
+        encoding=encoding or tak_server.cot_encoding,
+    )
+
+
+def ssl_context_for(endpoint):
+    """Build the client SSL context for an endpoint, None for plain TCP."""
+    if not endpoint.certfile:
+        return None
+    ssl_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ssl_ctx.check_hostname = False  # TAK server certs rarely match the DNS name
+    ssl_ctx.verify_mode = ssl.CERT_REQUIRED
+    if endpoint.cafile:
+        ssl_ctx.load_verify_locations(cafile=endpoint.cafile)
+    ssl_ctx.load_cert_chain(certfile=endpoint.certfile)
+    return ssl_ctx
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+class SslContextCache:
+    """Client SSL contexts per TakServer certificate files, built once per process.
+
+    A context is rebuilt when either certificate file's mtime changes; saving a TakServer
+    (admin update) clears the cache via takserver.signals.
+    """
+
+    def __init__(self):
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint):
+        if not endpoint.certfile:
+            return None
+        key = (endpoint.certfile, endpoint.cafile)
+        stamp = (_mtime(endpoint.certfile), _mtime(endpoint.cafile))
+        with self._lock:
+            cached = self._contexts.get(key)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+        ssl_ctx = ssl_context_for(endpoint)
+        with self._lock:
+            self._contexts[key] = (stamp, ssl_ctx)
+        return ssl_ctx
+
+    def clear(self):
+        with self._lock:
+            self._contexts.clear()
+
+
+ssl_contexts = SslContextCache()
+
+
+async def read_control_event(reader, buffer, cot_type):
+    """Read XML events until one of cot_type arrives.
+
+    Returns:
+        tuple: (the event, bytes read past it)
+    """
+    wanted = f'type="{cot_type}"'.encode()
+    while True:
+        end = buffer.find(b'</event>')
+        if end >= 0:
+            event, buffer = buffer[:end + 8], buffer[end + 8:]
+            if wanted in event:
+                return event, buffer
+            continue
+        chunk = await reader.read(65536)
+        if not chunk:
+            raise ConnectionError(f"Connection closed while waiting for {cot_type}")
+        buffer += chunk
+
+
+async def negotiate(endpoint, reader, writer):
+    """Switch a new connection to TAK protocol v1: wait for the server's offer, request v1, await the answer.
+
+    Returns:
+        bytes: whatever the server sent after its answer, the start of the framed stream
+    """
+    try:
+        offer, buffer = await asyncio.wait_for(read_control_event(reader, b'', 't-x-takp-v'), PYTAK_NEGOTIATION_TIMEOUT)
+        if TAK_PROTO_VERSION not in offered_versions(offer):
+            raise ConnectionError(f"{endpoint.host}:{endpoint.port} does not offer TAK protocol version {TAK_PROTO_VERSION}")
+        writer.write(takp_request())
+        await writer.drain()
+        response, buffer = await asyncio.wait_for(read_control_event(reader, buffer, 't-x-takp-r'), PYTAK_NEGOTIATION_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ConnectionError(f"Timeout negotiating TAK protocol with {endpoint.host}:{endpoint.port}")
+    if not response_status(response):
+        raise ConnectionError(f"{endpoint.host}:{endpoint.port} refused TAK protocol version {TAK_PROTO_VERSION}")
+    logger.info(f"Negotiated TAK protocol version {TAK_PROTO_VERSION} with {endpoint.host}:{endpoint.port}")
+    return buffer
+
+
+async def open_stream(endpoint):
+    """Open a streaming connection to a TAK server, negotiated to the endpoint's encoding.
+
+    Returns:
+        tuple: (reader, writer, bytes already read past the negotiation)
+
+    Raises:
+        ConnectionError: the server cannot be reached or refuses the encoding
+    """
+    ssl_ctx = ssl_contexts.get(endpoint)
+    logger.info(f"Connecting to {endpoint.host}:{endpoint.port} (SSL: {bool(ssl_ctx)})")
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(endpoint.host, endpoint.port, ssl=ssl_ctx),
+            timeout=PYTAK_CONNECTION_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise ConnectionError(f"Timeout connecting to {endpoint.host}:{endpoint.port}")
+    except ssl.SSLError as e_ssl:
+        if "CERTIFICATE_VERIFY_FAILED" in str(e_ssl):
+            logger.error(f"SSL Certificate Verification Failed for {endpoint.host}. Check CA trust and client certificate.")
+        raise ConnectionError(f"SSL Error connecting to {endpoint.host}:{endpoint.port}: {e_ssl}")
+    except OSError as e_os:
+        raise ConnectionError(f"OS Error connecting to {endpoint.host}:{endpoint.port}: {e_os}")
+
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as e_sockopt:
+            logger.warning(f"Failed to set TCP_NODELAY for {endpoint.host}: {e_sockopt}")
+
+    buffer = b''
+    if endpoint.encoding == 'protobuf':
+        # The handshake also tells us the server is ready for events
+        try:
+            buffer = await negotiate(endpoint, reader, writer)
+        except ConnectionError:
+            writer.close()
+            raise
+    elif PYTAK_CONNECT_SETTLE_DELAY:
+        # Allow server-side queue setup before the first write on a new connection
+        await asyncio.sleep(PYTAK_CONNECT_SETTLE_DELAY)
+    return reader, writer, buffer
+
+
+class TakConnection:
+    """An open connection to one TAK server."""
+
+    def __init__(self, endpoint, reader, writer):
+        self.endpoint = endpoint
+        self.reader = reader
+        self.writer = writer
+        self.lock = asyncio.Lock()
+        self.opened_at = time.monotonic()
+        self.last_used = self.opened_at
+        self.messages_sent = 0
+        # TAK servers push data (pings, other clients' events) to us. Read and discard it
+        # so the socket buffer never fills, and so a server-side close is noticed right away.
+        self._inbound_task = asyncio.create_task(self._discard_inbound())
+
+    def __repr__(self):
+        return f"<TakConnection {self.endpoint.host}:{self.endpoint.port} sent={self.messages_sent}>"
+
+    @property
+    def is_healthy(self):
+        if self.writer.is_closing() or self.reader.at_eof() or self._inbound_task.done():
+            return False
+        return (time.monotonic() - self.last_used) < PYTAK_POOL_IDLE_TIMEOUT
+
+    async def _discard_inbound(self):
+        try:
+            while await self.reader.read(65536):
+                pass
+            logger.info(f"TAK server {self.endpoint.host}:{self.endpoint.port} closed the connection.")
+        except (ConnectionError, ssl.SSLError, OSError) as e:
+            logger.warning(f"TAK server {self.endpoint.host}:{self.endpoint.port} connection lost: {e}")
+
+    async def close(self):
+        self._inbound_task.cancel()
+        if not self.writer.is_closing():
+            self.writer.close()
+        try:
+            await asyncio.wait_for(self.writer.wait_closed(), timeout=PYTAK_WRITER_CLOSE_TIMEOUT)
+        except Exception as e:
+            logger.debug(f"Ignoring error closing {self}: {type(e).__name__} - {e}")
+
+
+class _SaProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.error = None
+        self.closed = False
+
+    def error_received(self, exc):
+        # ICMP port unreachable only means nobody listens at a unicast address right now
+        if not isinstance(exc, ConnectionRefusedError):
+            self.error = exc
+
+    def connection_lost(self, exc):
+        self.closed = True
+
+
+async def open_datagram(endpoint):
+    """Open the non-blocking datagram socket for a UDP SA endpoint.
+
+    Raises:
+        ConnectionError: the address cannot be resolved or has no route
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        transport, protocol = await loop.create_datagram_endpoint(_SaProtocol, remote_addr=(endpoint.host, endpoint.port))
+    except OSError as e_os:
+        raise ConnectionError(f"OS Error opening UDP socket to {endpoint.host}:{endpoint.port}: {e_os}")
+    sock = transport.get_extra_info('socket')
+    try:
+        multicast = ipaddress.ip_address(transport.get_extra_info('peername')[0]).is_multicast
+    except ValueError:
+        multicast = False
+    if multicast and sock.family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, COT_UDP_MULTICAST_TTL)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    return transport, protocol
+
+
+class SaSocket:
+    """A datagram socket sending SA to one multicast group or EUD, in place of a TakConnection."""
+
+    def __init__(self, endpoint, transport, protocol):
+        self.endpoint = endpoint
+        self.transport = transport
+        self.protocol = protocol
+        self.lock = asyncio.Lock()
+        self.opened_at = time.monotonic()
+        self.last_used = self.opened_at
+        self.messages_sent = 0
+        self.oversized = 0
+
+    def __repr__(self):
+        return f"<SaSocket {self.endpoint.host}:{self.endpoint.port} sent={self.messages_sent}>"
+
+    @property
+    def is_healthy(self):
+        return not (self.transport.is_closing() or self.protocol.closed or self.protocol.error)
+
+    async def send(self, messages):
+        """Send one datagram per event, at most COT_UDP_RATE a second.
+
+        Events over COT_UDP_MAX_PACKET bytes are left out: a datagram that has to be
+        fragmented is lost whole when any fragment is.
+
+        Returns:
+            int: number of datagrams sent
+        """
+        interval = 1 / COT_UDP_RATE if COT_UDP_RATE else 0
+        started = time.monotonic()
+        sent = 0
+        for message in messages:
+            if self.endpoint.encoding == 'protobuf':
+                message = mesh_packet(message)
+            if len(message) > COT_UDP_MAX_PACKET:
+                self.oversized += 1
+                logger.warning(f"Not sending a {len(message)} byte CoT event to {self.endpoint.host}:{self.endpoint.port}, over COT_UDP_MAX_PACKET.")
+                continue
+            self.transport.sendto(message)
+            sent += 1
+            if interval:
+                ahead = started + sent * interval - time.monotonic()
+                if ahead > COT_UDP_PACING_SLICE:
+                    await asyncio.sleep(ahead)
+            if self.protocol.error:
+                raise ConnectionError(f"UDP send to {self.endpoint.host}:{self.endpoint.port} failed: {self.protocol.error}")
+        self.last_used = time.monotonic()
+        self.messages_sent += sent
+        return sent
+
+    async def close(self):
+        self.transport.close()
+
+
+class CotConnectionPool:
+    """Per-process pool of TAK server connections, served by one background event loop.
+
+    Synchronous callers (django-q tasks) hand coroutines to `run()`; coroutines running
+    on the pool loop use `connection()` and `send()`.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._connections = {}
+        self._connect_locks = {}
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            # A forked worker inherits the parent's pool object but not its thread.
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='tak-cot-pool', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+                self._connections = {}
+                self._connect_locks = {}
+                logger.info(f"Started TAK connection pool loop in process {self._pid}.")
+        return self._loop
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the pool loop from synchronous code and return its result."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    async def connection(self, endpoint):
+        """Return a healthy connection for the endpoint, opening one if needed."""
+        lock = self._connect_locks.setdefault(endpoint, asyncio.Lock())
+        async with lock:
+            conn = self._connections.get(endpoint)
+            if conn is not None:
+                if conn.is_healthy:
+                    return conn
+                logger.info(f"Discarding stale connection {conn}.")
+                self._connections.pop(endpoint, None)
+                await conn.close()
+            conn = await self._open(endpoint)
+            self._connections[endpoint] = conn
+            return conn
+
+    async def _open(self, endpoint):
+        if endpoint.transport == 'udp':
+            conn = SaSocket(endpoint, *await open_datagram(endpoint))
+            logger.info(f"Opened {conn}.")
+            return conn
+        reader, writer, _ = await open_stream(endpoint)
+        conn = TakConnection(endpoint, reader, writer)
+        logger.info(f"Connected {conn}.")
+        return conn
+
+    async def send(self, endpoint, messages, drain_timeout=None):
+        """Write encoded CoT events to the endpoint's connection and drain them.
+
+        A connection found dead while writing is replaced and the batch is written once more;
+        CoT events are keyed by UID, so a repeated event just replaces itself on the server.
+        A drain that takes longer than drain_timeout is not retried: the connection is
+        discarded and asyncio.TimeoutError raised.
+
+        Returns:
+            int: number of messages written
+        """
+        if endpoint.transport == 'udp':
+            conn = await self.connection(endpoint)
+            async with conn.lock:
+                try:
+                    return await conn.send(messages)
+                except ConnectionError:
+                    await self.discard(endpoint, conn)
+                    raise
+        for attempt in (1, 2):
+            conn = await self.connection(endpoint)
+            async with conn.lock:
+                try:
+                    conn.writer.writelines(messages)
+                    await asyncio.wait_for(conn.writer.drain(), timeout=drain_timeout)
+                except asyncio.TimeoutError:
+                    # an OSError too, but a server that cannot keep up is not sent the batch again
+                    logger.warning(f"Drain on {conn} timed out after {drain_timeout}s")
+                    await self.discard(endpoint, conn)
+                    raise
+                except (ConnectionError, ssl.SSLError, OSError) as e:
+                    logger.warning(f"Send on {conn} failed (attempt {attempt}): {type(e).__name__} - {e}")
+                    await self.discard(endpoint, conn)
+                    if attempt == 2:
+                        raise ConnectionError(f"Connection to {endpoint.host}:{endpoint.port} lost while sending: {e}")
+                    continue
+                conn.last_used = time.monotonic()
+                conn.messages_sent += len(messages)
+                return len(messages)
+
+    async def discard(self, endpoint, conn=None):
+        """Drop (and close) the pooled connection for an endpoint."""
+        current = self._connections.get(endpoint)
+        conn = conn or current
+        if conn is None:
+            return
+        if current is conn:
+            self._connections.pop(endpoint, None)
+        await conn.close()
+
+    async def close_all(self):
+        connections = list(self._connections.values())
+        self._connections.clear()
+        for conn in connections:
+            await conn.close()
+
+    def shutdown(self):
+        """Close every connection and stop the loop (process exit)."""
+        if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self.run(self.close_all(), timeout=PYTAK_WRITER_CLOSE_TIMEOUT)
+        except Exception as e:
+            logger.debug(f"Ignoring error during TAK connection pool shutdown: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+cot_pool = CotConnectionPool()
+atexit.register(cot_pool.shutdown)
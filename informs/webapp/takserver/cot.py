@@ -1,37 +1,41 @@
-from django.conf import settings
-from django.contrib.sites.models import Site
+from collections import namedtuple
 
-from aidrequests.models import FieldOp, AidRequest, AidLocation
-from .cot_helper import aidrequest_location, make_cot
-from .models import TakServer
+from django.conf import settings
+from django.db.models import Prefetch
+
+from aidrequests.models import FieldOp, CotDestination
+from .cot_maker import CotMaker, CotJob
+from .cot_audit import cot_audit
+from .cot_delta import select_changed, record_sent
+from .cot_spool import spool, replay
+from . import cot_circuit
+from .cot_encoder import encode_cot
+from .cot_protobuf import encode_cot_protobuf
+from .connection_pool import cot_pool, endpoint_for, PYTAK_CONNECTION_TIMEOUT, PYTAK_WRITER_CLOSE_TIMEOUT
 
 import asyncio
-import pytak
-# Removed: from pytak.protocol import TAKProtocol
-from configparser import ConfigParser
-from urllib.parse import urlparse # Added import
-from io import StringIO
 import logging
-from datetime import datetime
-# Removed ic if not used after changes
-from tempfile import NamedTemporaryFile
-from lxml import etree
-import ssl
-from icecream import ic # Re-added icecream
-# from pytak import TCPClientWorker, TLSClientWorker # Reverting this import
+import time
 
-# import time
+logger = logging.getLogger(__name__)
 
-# Get the COT logger
-cot_logger = logging.getLogger('cot')
+# Marker encoders by TakServer.cot_encoding
+COT_ENCODERS = {
+    'xml': encode_cot,
+    'protobuf': encode_cot_protobuf,
+}
 
-logger = logging.getLogger(__name__)
+# One TakServer a batch goes to; tak_server is its name, for reports
+CotTarget = namedtuple('CotTarget', ['tak_server', 'endpoint', 'tak_server_id'])
+
+# prefetch_related() lookup for cot_targets_for()
+COT_DESTINATIONS = Prefetch('cot_destinations', queryset=CotDestination.objects.select_related('tak_server'))
 
 # Define PyTAK operation timeouts, with defaults and warnings if not set in Django settings
-PYTAK_CONNECTION_TIMEOUT = getattr(settings, 'PYTAK_CONNECTION_TIMEOUT', 10) # Default 10s, for asyncio.open_connection
-PYTAK_MESSAGE_GENERATION_TIMEOUT = getattr(settings, 'PYTAK_MESSAGE_GENERATION_TIMEOUT', 30) # Default 30s, for cot_maker.build_messages()
-PYTAK_BATCH_DRAIN_TIMEOUT = getattr(settings, 'PYTAK_BATCH_DRAIN_TIMEOUT', 60) # Default 60s, for single writer.drain() after all messages written
-PYTAK_WRITER_CLOSE_TIMEOUT = getattr(settings, 'PYTAK_WRITER_CLOSE_TIMEOUT', 10) # Default 10s, for writer.wait_closed()
+# (connection and close timeouts live with the connection pool)
+PYTAK_MESSAGE_GENERATION_TIMEOUT = getattr(settings, 'PYTAK_MESSAGE_GENERATION_TIMEOUT', 30) # Default 30s, for cot_maker.build_markers()
+PYTAK_BATCH_DRAIN_TIMEOUT = getattr(settings, 'PYTAK_BATCH_DRAIN_TIMEOUT', 60) # Default 60s, for each writer.drain() of a streamed batch
+PYTAK_DRAIN_HIGH_WATER = getattr(settings, 'PYTAK_DRAIN_HIGH_WATER', 256 * 1024) # bytes of encoded events written before each drain
 
 # Remove warnings for obsolete timeouts if they existed
 if not hasattr(settings, 'PYTAK_CONNECTION_TIMEOUT'):
@@ -43,55 +47,294 @@ if not hasattr(settings, 'PYTAK_BATCH_DRAIN_TIMEOUT'):
 if not hasattr(settings, 'PYTAK_WRITER_CLOSE_TIMEOUT'):
     logger.warning(f"PYTAK_WRITER_CLOSE_TIMEOUT not set in Django settings, using default of {PYTAK_WRITER_CLOSE_TIMEOUT}s.")
 
-class CotSender: # Simplified: No longer a pytak.QueueWorker
+def cot_job_for(field_op, mark_type='field', aid_request_ids=None, include_field_op_marker=True):
+    """Describe one send to a field op's TakServer as a CotJob.
+
+    Args are as for pytak_send_cot(). Where the job goes is up to the caller (cot_targets_for()).
+
+    Returns:
+        CotJob: the job for CotMaker
+    """
+    # Aid request IDs only matter for mark_type 'aid'
+    if mark_type == 'aid' and aid_request_ids:
+        if not isinstance(aid_request_ids, (list, tuple)):
+            aid_request_ids = [aid_request_ids]
+        aid_request_ids = tuple(aid_request_ids)
+    else:
+        aid_request_ids = ()
+
+    return CotJob(
+        field_op_slug=field_op.slug,
+        mark_type=mark_type,
+        aid_request_ids=aid_request_ids,
+        include_field_op_marker=include_field_op_marker,
+    )
+
+
+async def _flush(field_op_slug, endpoint, tak_server_id, messages, markers, now, timings):
+    """Write one high-water buffer of events to the pooled connection, drain it and record it as sent."""
+    # Hand a copy to the audit sink; it is written off the send path
+    cot_audit.record(field_op_slug, messages)
+    drain_started = time.monotonic()
+    try:
+        await cot_pool.send(endpoint, messages, drain_timeout=PYTAK_BATCH_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError as e_timeout:
+        logger.error(f"[{field_op_slug}] Timeout ({PYTAK_BATCH_DRAIN_TIMEOUT}s) draining {len(messages)} messages.")
+        # The pool has dropped the connection; the server counts as unreachable and the
+        # rest of the batch is spooled
+        raise ConnectionError(f"Timeout ({PYTAK_BATCH_DRAIN_TIMEOUT}s) draining {len(messages)} messages") from e_timeout
+    timings['drain'] += time.monotonic() - drain_started
+    logger.debug(f"[{field_op_slug}] Drained {len(messages)} messages.")
+
+    # State is only recorded once the server has the events; losing it just means a resend
+    try:
+        await record_sent(tak_server_id, markers, now)
+    except Exception as e_state:
+        logger.error(f"[{field_op_slug}] Failed to record CoT marker state: {type(e_state).__name__} - {e_state}")
+
+
+def cot_targets_for(field_op):
+    """Every TAK server a field op's CoT goes to.
+
+    The field op's tak_server first, if it has one, then its enabled CotDestinations. A
+    destination for the field op's own tak_server overrides its encoding, or turns it off
+    when disabled. A field op without any of them sends no CoT.
+    Load the field op with select_related('tak_server') and prefetch_related(COT_DESTINATIONS).
+
+    Returns:
+        list: CotTarget per TAK server
     """
-    Generates Cursor on Target Events using CotMaker.
-    Does not handle queuing or direct transmission in this linear model.
-
-    COTINFO Structure (ConfigParser format):
-        [cot]
-        mark_type = field|aid
-        field_op_slug = <slug>
-        aid_request_ids = comma,separated,ids  # Only when mark_type=aid
+    targets = {}
+    if field_op.tak_server:
+        targets[field_op.tak_server_id] = CotTarget(
+            field_op.tak_server.name, endpoint_for(field_op.tak_server), field_op.tak_server_id
+        )
+    for destination in field_op.cot_destinations.all():
+        if not destination.enabled:
+            targets.pop(destination.tak_server_id, None)
+            continue
+        targets[destination.tak_server_id] = CotTarget(
+            destination.tak_server.name,
+            endpoint_for(destination.tak_server, destination.encoding),
+            destination.tak_server_id,
+        )
+    return list(targets.values())
+
+
+def no_targets_reason(field_op):
+    """Why cot_targets_for() found no TAK server to send the field op's CoT to."""
+    if field_op.tak_server_id or field_op.cot_destinations.all():
+        return "all CoT destinations are disabled"
+    return "no CoT destinations configured"
+
+
+class _Destination:
+    """One TAK server's share of a send: its connection, spool and counts.
+
+    Once the server is unreachable (error is set) its events go to the spool instead.
     """
-    def __init__(self, config): # Removed queue argument
-        # super().__init__(queue, config) # No longer a QueueWorker
-        self._task_name = f"CotSender-{id(self)}" # Keep for logging consistency if needed
+    def __init__(self, field_op_slug, target):
+        self.field_op_slug = field_op_slug
+        self.name = target.tak_server
+        self.endpoint = target.endpoint
+        self.tak_server_id = target.tak_server_id
+        self.error = None
+        self.timings = {'connect': 0.0, 'drain': 0.0}
+        self.sent = self.bytes = self.skipped = self.replayed = self.spooled = 0
+        self.pending, self.pending_markers, self.pending_bytes = [], [], 0
+
+    async def open(self):
+        """Get the pooled connection (connects only if there is no healthy one) and replay
+        anything spooled for this server while it was unreachable.
+        A server whose circuit is open is not tried at all (see cot_circuit)."""
+        started = time.monotonic()
+        try:
+            health = await cot_circuit.allow(self.tak_server_id)
+            await cot_pool.connection(self.endpoint)
+            self.timings['connect'] = round(time.monotonic() - started, 4)
+            self.replayed = await replay(self.endpoint, self.tak_server_id, drain_timeout=PYTAK_BATCH_DRAIN_TIMEOUT)
+            await cot_circuit.record_success(self.tak_server_id, health)
+        except ConnectionError as e_conn:
+            # Still build the events, for the spool
+            logger.error(f"[{self.field_op_slug}] Fatal Connection Error ({self.name}): {e_conn}. Spooling the CoT events.")
+            self.error = e_conn
+            if not isinstance(e_conn, cot_circuit.CircuitOpen):
+                await cot_circuit.record_failure(self.tak_server_id, e_conn)
+
+    def add(self, markers, messages):
+        self.pending.extend(messages)
+        self.pending_markers.extend(markers)
+        self.pending_bytes += sum(len(message) for message in messages)
+
+    async def flush(self, now, final=False):
+        """Write out the buffer once PYTAK_DRAIN_HIGH_WATER bytes are waiting (or it is the last one),
+        spool it when the server is unreachable."""
+        if not self.pending or not (final or self.error or self.pending_bytes >= PYTAK_DRAIN_HIGH_WATER):
+            return
+        try:
+            if self.error:
+                self.spooled += await spool(self.tak_server_id, self.endpoint.encoding, self.pending_markers, self.pending, now)
+            else:
+                await _flush(self.field_op_slug, self.endpoint, self.tak_server_id, self.pending, self.pending_markers, now, self.timings)
+                self.sent += len(self.pending)
+                self.bytes += self.pending_bytes
+        except ConnectionError as e_conn:
+            logger.error(f"[{self.field_op_slug}] Fatal Connection Error ({self.name}): {e_conn}. Spooling the remaining CoT events.")
+            self.error = e_conn
+            await cot_circuit.record_failure(self.tak_server_id, e_conn)
+            self.spooled += await spool(self.tak_server_id, self.endpoint.encoding, self.pending_markers, self.pending, now)
+        self.pending, self.pending_markers, self.pending_bytes = [], [], 0
+
+    def result(self, started, generate):
+        if self.error:
+            logger.error(f"[{self.field_op_slug}] Fatal Connection Error ({self.name}): {self.error}. Aborting CoT send after {self.sent} messages, {self.spooled} spooled for replay.")
+            return f"Failed: {self.error} ({self.sent} messages sent before the failure, {self.spooled} spooled)"
+        if self.sent:
+            logger.info(f"[{self.field_op_slug}] {self.sent} messages sent to {self.name} ({self.skipped} unchanged, skipped).")
+        else:
+            logger.info(f"[{self.field_op_slug}] No messages were generated to send to {self.name} ({self.skipped} unchanged, skipped).")
+        return {
+            'sent': self.sent,
+            'skipped': self.skipped,
+            'replayed': self.replayed,
+            'bytes': self.bytes,
+            'duration': round(time.monotonic() - started, 3),
+            'timings': {
+                'connect': self.timings['connect'],
+                'generate': generate,
+                'drain': round(self.timings['drain'], 4),
+            },
+        }
 
-        # Validate COTINFO is present
-        if 'COTINFO' not in config:
-            raise ValueError("COTINFO is required in config")
 
-        # Store config for CotMaker or other uses if necessary
-        self.config = config # Store the config
+async def _each(coroutines):
+    """Await one coroutine per destination concurrently; an unexpected error is raised once all are done."""
+    for result in await asyncio.gather(*coroutines, return_exceptions=True):
+        if isinstance(result, BaseException):
+            raise result
 
-        # Create CotMaker instance
-        from .cot_maker import CotMaker
-        self.cot_maker = CotMaker(config['COTINFO'])
 
-        # ic(f"{self._task_name}: Initialized (Simplified for linear processing)")
+async def send_cot_to(field_op_slug, targets, cot_job, delta_only=False):
+    """Build one batch of CoT events and send it to several TakServers at once.
+    Runs on the connection pool's event loop, reusing the open connection to each server.
 
-    # handle_data and run are no longer primary interface for _run_cot
-    # build_messages will be called directly via self.cot_maker by _run_cot
+    The markers are built once and each is encoded once per wire format, however many
+    servers receive them; every server gets the same encoded bytes, written concurrently.
+    Events are generated and written in chunks, so a connection lost mid-batch keeps
+    what was already drained (and recorded as sent) and the failure reports how far it got.
+    Events a server could not take go to its spool (cot_spool) and are replayed first on
+    the next send that connects. Delta state, spool and circuit are kept per server.
 
-    async def cleanup(self):
-        """Cleanup resources for CotSender if any."""
-        # ic(f"{self._task_name}: Starting cleanup process (Simplified)")
-        logger.info(f"Starting {self._task_name} cleanup...")
-        # Most cleanup (queue draining) was removed in previous steps.
-        # If CotMaker or other components initialized by CotSender need cleanup, add here.
-        # For now, this is likely minimal.
-        # ic(f"{self._task_name}: Cleanup complete (Simplified).")
-        logger.info(f"{self._task_name} cleanup complete.")
+    Returns:
+        list: per target, as for send_cot()
+    """
+    started = time.monotonic()
+    generate = 0.0
+    destinations = [_Destination(field_op_slug, target) for target in targets]
 
-# pytak.QueueWorker related methods like handle_data, run are removed or will be unused by _run_cot.
-# _run_cot will directly use sender.cot_maker.build_messages().
+    logger.info(f"[{field_op_slug}] Initiating CoT send process to {len(destinations)} TAK servers (Pooled Connection).")
+    try:
+        # 1. The maker builds the job's markers
+        cot_maker = CotMaker(cot_job)
+
+        # 2. Connect to every server (and replay its spool) concurrently
+        await _each(destination.open() for destination in destinations)
+
+        # 3. Stream the markers chunk by chunk: per server drop the ones it has unchanged for a
+        # delta sweep, encode the rest (once per encoding) and write them out whenever
+        # PYTAK_DRAIN_HIGH_WATER bytes are waiting. Only one chunk plus the unsent buffers
+        # are ever held in memory.
+        stream = cot_maker.stream_markers()
+        try:
+            logger.info(f"[{field_op_slug}] Generating and sending CoT messages (generation timeout: {PYTAK_MESSAGE_GENERATION_TIMEOUT}s per chunk, drain timeout: {PYTAK_BATCH_DRAIN_TIMEOUT}s).")
+            while True:
+                generate_started = time.monotonic()
+                try:
+                    markers = await asyncio.wait_for(anext(stream, None), timeout=PYTAK_MESSAGE_GENERATION_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.error(f"[{field_op_slug}] Timeout ({PYTAK_MESSAGE_GENERATION_TIMEOUT}s) generating CoT messages.")
+                    raise # Re-raise to be handled by outer try/except and then finally block for cleanup
+                except Exception as e_gen:
+                    logger.error(f"[{field_op_slug}] Exception during CoT message generation: {type(e_gen).__name__} - {e_gen}")
+                    raise # Re-raise for cleanup
+                if markers is None:
+                    break
+                now = cot_maker.now  # set once the stream has started
+                encoded = {}  # {encoding: {uid: message}} for this chunk
+                for destination in destinations:
+                    selected = markers
+                    if delta_only and markers:
+                        selected, unchanged = await select_changed(destination.tak_server_id, markers, now)
+                        destination.skipped += len(unchanged)
+                    encode = COT_ENCODERS[destination.endpoint.encoding]
+                    messages = encoded.setdefault(destination.endpoint.encoding, {})
+                    for marker in selected:
+                        if marker.uid not in messages:
+                            messages[marker.uid] = encode(marker, now=now)
+                    destination.add(selected, [messages[marker.uid] for marker in selected])
+                generate += time.monotonic() - generate_started
+
+                await _each(destination.flush(now) for destination in destinations)
+
+            await _each(destination.flush(cot_maker.now, final=True) for destination in destinations)
+        finally:
+            await stream.aclose()
+
+        logger.info(f"[{field_op_slug}] CoT message processing (generation & batch send) logic finished.")
+
+    except ValueError as e_val:
+        logger.error(f"[{field_op_slug}] Value Error during CoT setup: {e_val}. Aborting.")
+        return [f"Failed: {e_val}"] * len(destinations)
+    except Exception as e: # Catch-all for other errors (e.g., message generation, drain timeout)
+        logger.error(f"[{field_op_slug}] Unhandled exception in send_cot main try block: {type(e).__name__} - {e}")
+        # Raising the exception will let Django-Q handle it and mark task as failed.
+        raise
+
+    logger.info(f"[{field_op_slug}] send_cot completed its course (Pooled Connection).")
+    # If an exception was raised, cot_pool.run() will propagate it.
+    return [destination.result(started, round(generate, 4)) for destination in destinations]
+
+
+async def send_cot(field_op_slug, endpoint, tak_server_id, cot_job, delta_only=False):
+    """Build and send one batch of CoT events to one TakServer (see send_cot_to()).
 
-def pytak_send_cot(field_op_slug, mark_type='field', aid_request_ids=None, include_field_op_marker=True):
+    Returns:
+        dict: {'sent', 'skipped', 'replayed', 'bytes', 'duration', 'timings'} for the batch, or a "Failed: ..." string;
+              timings holds the connect, generate and drain seconds
+    """
+    target = CotTarget(str(tak_server_id), endpoint, tak_server_id)
+    return (await send_cot_to(field_op_slug, [target], cot_job, delta_only))[0]
+
+
+def combine_results(targets, results):
+    """One report for a send to several TakServers: the totals, and per server its send_cot() result.
+
+    Returns:
+        dict: totals as for send_cot() plus 'destinations' and 'failed' (server name: failure),
+              or a "Failed: ..." string when no server took the batch
+    """
+    reports = dict(zip((target.tak_server for target in targets), results))
+    failed = {name: result for name, result in reports.items() if not isinstance(result, dict)}
+    if len(failed) == len(reports):
+        return "Failed: " + "; ".join(f"{name}: {result}" for name, result in failed.items())
+    sent = [result for result in results if isinstance(result, dict)]
+    return {
+        'sent': sum(result['sent'] for result in sent),
+        'skipped': sum(result['skipped'] for result in sent),
+        'replayed': sum(result['replayed'] for result in sent),
+        'bytes': sum(result['bytes'] for result in sent),
+        'duration': max(result['duration'] for result in sent),
+        'destinations': reports,
+        'failed': failed,
+    }
+
+
+def pytak_send_cot(field_op_slug, mark_type='field', aid_request_ids=None, include_field_op_marker=True, delta_only=False):
     """Send COT messages synchronously using PyTAK.
 
     This is the main entry point for sending COT messages. It handles the sync/async boundary
-    and is called by both the Django-Q task and direct API calls.
+    and is called by both the Django-Q task and direct API calls. The events go to the field
+    op's TAK server and every enabled CotDestination (see cot_targets_for()).
 
     Args:
         field_op_slug (str): The slug identifier for the field operation
@@ -100,320 +343,36 @@ def pytak_send_cot(field_op_slug, mark_type='field', aid_request_ids=None, inclu
         aid_request_ids (list, optional): List of aid request IDs when mark_type is 'aid'.
         include_field_op_marker (bool): Whether to explicitly include the field op (presence) marker.
                                         Defaults to True.
+        delta_only (bool): Skip markers the TAK server already has unchanged and not close to stale
+                           (see cot_delta). Defaults to False: send every marker.
 
     Returns:
-        str: Success message or Exception if error occurred
+        dict: send_cot() report (combine_results() with more than one TAK server),
+              a "Failed: ..." string, a "Skipped: ..." string when there is no TAK server
+              to send to, or the Exception if an error occurred
     """
     try:
         # Get the field op
-        field_op = FieldOp.objects.get(slug=field_op_slug)
-
-        # Ensure TakServer is available (for certs, remote DNS)
-        if not field_op.tak_server:
-            raise ValueError(f"FieldOp {field_op_slug} has no associated TakServer.")
-
-        # Get the local server name from Django Sites framework
-        current_site = Site.objects.get_current()
-        local_server_name_part = current_site.name # Or current_site.domain if preferred
-
-        # Construct the desired PyTAK UID as local_servername.env_name
-        env_name_part = settings.ENV_NAME
-
-        if env_name_part:
-            desired_pytak_uid = f"{local_server_name_part}.{env_name_part}"
-        else:
-            desired_pytak_uid = local_server_name_part
-
-        # This desired_pytak_uid will be used by PyTAK for its own identity (e.g., pings).
-        # COT_HOST_ID is set to empty to prevent PyTAK appending -HOST_ID to our desired UID.
-
-        # Determine host_id part for COTINFO - PyTAK appends its own host_id if COT_HOST_ID is not empty.
-        # We want to control the full UID, so this will be empty for PyTAK itself.
-        # CotMaker might construct its own UIDs differently, so we pass ENV_NAME for its context.
-        host_id_part_for_cotinfo = settings.ENV_NAME
-
-        # Create ConfigParser for COTINFO
-        config = ConfigParser()
-        config['cot'] = {
-            'mark_type': mark_type,
-            'field_op_slug': field_op_slug,
-            'include_field_op_marker': str(include_field_op_marker)
-        }
-
-        # Add aid request IDs if provided and mark_type is 'aid'
-        if mark_type == 'aid' and aid_request_ids:
-            if not isinstance(aid_request_ids, list):
-                aid_request_ids = [aid_request_ids]
-            config['cot']['aid_request_ids'] = ','.join(map(str, aid_request_ids))
-
-        config['DEFAULT']['COT_UID'] = desired_pytak_uid # PyTAK will use this.
-        config['DEFAULT']['COT_HOST_ID'] = ""           # Prevent PyTAK from appending -HOST_ID.
-        # PYTAK_TLS_CLIENT_CERT, PYTAK_TLS_CLIENT_KEY, PYTAK_TLS_CLIENT_CAFILE etc. are set by PyTAK via os.environ
-        # If PYTAK_TLS_CLIENT_KEY is needed and it's different from CERT, it needs to be set.
-        # Usually, client certs for TAK contain both public and private keys or are used with a separate key file.
-        # PyTAK expects PYTAK_TLS_CLIENT_CERT to be the cert, and if the private key is separate,
-        # it might look for PYTAK_TLS_CLIENT_KEY. If the cert_private file is a PEM bundle with key+cert, this is fine.
-
-        # Convert config to string
-        config_string = StringIO()
-        config.write(config_string)
-        cotinfo = config_string.getvalue()
-
-        # Build full config
-        cot_config = {
-            "COT_URL": f'tls://{field_op.tak_server.dns_name}:8089',
-            "PYTAK_TLS_CLIENT_CERT": field_op.tak_server.cert_private.path,
-            "PYTAK_TLS_CLIENT_CAFILE": field_op.tak_server.cert_trust.path,
-            "PYTAK_TLS_DONT_CHECK_HOSTNAME": True,
-            "PYTAK_DISABLE_PING": True,  # Disable the takPing messages
-            "PYTAK_UID": desired_pytak_uid, # Sets the base for COT_UID
-            "PYTAK_COT_HOST_ID": "", # Sets the suffix for COT_UID (empty to use desired_pytak_uid as is)
-            "COTINFO": cotinfo
-        }
-
-        # Log TAK server configuration
-        logger.info("TAK Server Config:", {
-            'server': field_op.tak_server.dns_name if field_op.tak_server else None,
-            'cert_private_path': field_op.tak_server.cert_private.path if field_op.tak_server else None,
-            'cert_trust_path': field_op.tak_server.cert_trust.path if field_op.tak_server else None,
-            'disable_cot': field_op.disable_cot,
-            'disable_ping': True
-        })
-
-        # Run everything in a new event loop
-        async def _run_cot():
-            # No asyncio.Queue, CotSenderTask, or TXWorkerTask in this linear model
-            sender = None
-            writer = None
-
-            logger.info(f"[{field_op_slug}] Initiating CoT send process (Linear Batch Mode).")
-            try:
-                # 1. Instantiate simplified CotSender
-                # ic(f"[{field_op_slug}] Preparing CoT components.")
-                sender = CotSender(config=cot_config) # No queue passed
-
-                # 2. Establish network connection and get writer
-                url_parts = urlparse(cot_config['COT_URL'])
-                if not url_parts.hostname or not url_parts.port:
-                    logger.error(f"[{field_op_slug}] Could not parse hostname/port from COT_URL: {cot_config['COT_URL']}")
-                    raise ValueError(f"Could not parse hostname/port from COT_URL: {cot_config['COT_URL']}")
-                # ic(f"[{field_op_slug}] Parsed URL: Host={url_parts.hostname}, Port={url_parts.port}, Scheme={url_parts.scheme}")
-
-                ssl_ctx = None
-                if url_parts.scheme == 'tls':
-                    # ic(f"[{field_op_slug}] Scheme is TLS. Creating SSLContext.")
-                    ssl_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-                    ssl_ctx.check_hostname = not cot_config.get("PYTAK_TLS_DONT_CHECK_HOSTNAME", False)
-                    ssl_ctx.verify_mode = ssl.CERT_REQUIRED
-                    client_cafile = cot_config.get("PYTAK_TLS_CLIENT_CAFILE")
-                    client_cert = cot_config.get("PYTAK_TLS_CLIENT_CERT")
-                    if client_cafile:
-                        # ic(f"[{field_op_slug}] Loading CA cert: {client_cafile}")
-                        ssl_ctx.load_verify_locations(cafile=client_cafile)
-                    if client_cert:
-                        # ic(f"[{field_op_slug}] Loading client cert/key: {client_cert}")
-                        ssl_ctx.load_cert_chain(certfile=client_cert)
-                    # ic(f"[{field_op_slug}] SSL context configured.")
-
-                logger.info(f"[{field_op_slug}] Attempting to connect to {url_parts.hostname}:{url_parts.port} (SSL: {bool(ssl_ctx)})" )
-                try:
-                    connect_task = asyncio.open_connection(url_parts.hostname, url_parts.port, ssl=ssl_ctx)
-                    _, writer = await asyncio.wait_for(connect_task, timeout=PYTAK_CONNECTION_TIMEOUT)
-                    logger.info(f"[{field_op_slug}] Successfully connected to {url_parts.hostname}:{url_parts.port}. Writer acquired.")
-
-                    # Add a 250ms delay to allow server-side queue setup
-                    logger.info(f"[{field_op_slug}] Delaying for 0.25s before sending data...")
-                    await asyncio.sleep(0.25)
-                    logger.info(f"[{field_op_slug}] Delay complete. Proceeding to send CoT messages.")
-
-                    transport = writer.transport
-                    if transport:
-                        sock = transport.get_extra_info('socket')
-                        if sock:
-                            import socket
-                            try:
-                                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                                logger.info(f"[{field_op_slug}] Successfully set TCP_NODELAY on the socket.")
-                            except Exception as e_sockopt:
-                                logger.warning(f"[{field_op_slug}] Failed to set TCP_NODELAY on the socket: {e_sockopt}")
-                        else:
-                            logger.warning(f"[{field_op_slug}] Could not get socket from transport to set TCP_NODELAY.")
-                    else:
-                        logger.warning(f"[{field_op_slug}] Could not get transport from writer to set TCP_NODELAY.")
-                except asyncio.TimeoutError:
-                    logger.error(f"[{field_op_slug}] Connection to {url_parts.hostname}:{url_parts.port} timed out after {PYTAK_CONNECTION_TIMEOUT}s.")
-                    raise ConnectionError(f"Timeout connecting to {url_parts.hostname}:{url_parts.port}")
-                except ConnectionRefusedError:
-                    logger.error(f"[{field_op_slug}] Connection to {url_parts.hostname}:{url_parts.port} refused.")
-                    raise ConnectionRefusedError(f"Connection refused by {url_parts.hostname}:{url_parts.port}")
-                except ssl.SSLError as e_ssl:
-                    logger.error(f"[{field_op_slug}] SSL Error connecting to {url_parts.hostname}:{url_parts.port}: {e_ssl}")
-                    if "CERTIFICATE_VERIFY_FAILED" in str(e_ssl):
-                        logger.error(f"[{field_op_slug}] SSL Certificate Verification Failed. Check CA trust and client certificate.")
-                    raise ConnectionError(f"SSL Error connecting to {url_parts.hostname}:{url_parts.port}: {e_ssl}")
-                except OSError as e_os:
-                    logger.error(f"[{field_op_slug}] OS Error connecting to {url_parts.hostname}:{url_parts.port}: {e_os}")
-                    raise ConnectionError(f"OS Error connecting to {url_parts.hostname}:{url_parts.port}: {e_os}")
-
-                # 3. Generate all CoT messages into a list
-                messages = []
-                message_count = 0
-                try:
-                    logger.info(f"[{field_op_slug}] Generating CoT messages (timeout: {PYTAK_MESSAGE_GENERATION_TIMEOUT}s).")
-                    messages = await asyncio.wait_for(sender.cot_maker.build_messages(), timeout=PYTAK_MESSAGE_GENERATION_TIMEOUT)
-                    message_count = len(messages)
-                    # ic(f"[{field_op_slug}] Successfully generated {message_count} CoT messages.")
-                    logger.info(f"[{field_op_slug}] Successfully generated {message_count} CoT messages.")
-                except asyncio.TimeoutError:
-                    logger.error(f"[{field_op_slug}] Timeout ({PYTAK_MESSAGE_GENERATION_TIMEOUT}s) generating CoT messages.")
-                    raise # Re-raise to be handled by outer try/except and then finally block for cleanup
-                except Exception as e_gen:
-                    logger.error(f"[{field_op_slug}] Exception during CoT message generation: {type(e_gen).__name__} - {e_gen}")
-                    raise # Re-raise for cleanup
-
-                # 4. Write all messages to the writer's buffer, then drain once for the batch
-                if message_count > 0 and writer and not writer.is_closing():
-                    logger.info(f"[{field_op_slug}] Writing {message_count} messages to send buffer.")
-                    field_op_slug_log = sender.cot_maker.field_op_slug
-                    mark_type_log = sender.cot_maker.mark_type
-
-                    for i, msg_bytes in enumerate(messages):
-                        writer.write(msg_bytes) # Write to buffer
-                        # Log message details (similar to how CotSender used to log when queueing)
-                        log_prefix = f"[{field_op_slug}] (FieldOp: {field_op_slug_log}, MarkType: {mark_type_log})"
-                        if isinstance(msg_bytes, bytes):
-                            try:
-                                xml_tree = etree.fromstring(msg_bytes)
-                                beautified_message = etree.tostring(xml_tree, pretty_print=True).decode('utf-8')
-                                cot_logger.info(f"{log_prefix}: Writing message {i+1}/{message_count} to buffer:\n{beautified_message}")
-                            except etree.XMLSyntaxError:
-                                cot_logger.info(f"{log_prefix}: Writing message {i+1}/{message_count} to buffer (non-XML/malformed):\n{msg_bytes.decode('utf-8', errors='replace')}")
-                        else:
-                             cot_logger.info(f"{log_prefix}: Writing message {i+1}/{message_count} to buffer (non-bytes):\n{msg_bytes}")
-                        # ic(f"[{field_op_slug}] Wrote message {i+1}/{message_count} to buffer. Buffer size: {writer.transport.get_write_buffer_size() if writer.transport else 'N/A'}")
-
-                    logger.info(f"[{field_op_slug}] All {message_count} messages written to buffer. Draining batch (timeout: {PYTAK_BATCH_DRAIN_TIMEOUT}s).")
-                    try:
-                        await asyncio.wait_for(writer.drain(), timeout=PYTAK_BATCH_DRAIN_TIMEOUT)
-                        logger.info(f"[{field_op_slug}] Batch of {message_count} messages successfully drained (sent).")
-                        # ic(f"[{field_op_slug}] Batch drained. Write buffer size: {writer.transport.get_write_buffer_size() if writer.transport else 'N/A'}")
-                    except asyncio.TimeoutError:
-                        logger.error(f"[{field_op_slug}] Timeout ({PYTAK_BATCH_DRAIN_TIMEOUT}s) draining batch of {message_count} messages.")
-                        # Note: Even on timeout, some messages might have been sent.
-                        # The writer will be closed in finally block.
-                        raise # Re-raise to ensure task reports failure
-                    except ConnectionResetError as e_conn_reset:
-                        logger.error(f"[{field_op_slug}] Connection reset while draining batch: {e_conn_reset}")
-                        raise
-                    except Exception as e_drain:
-                        logger.error(f"[{field_op_slug}] Exception during batch drain: {type(e_drain).__name__} - {e_drain}")
-                        raise
-                elif message_count == 0:
-                    logger.info(f"[{field_op_slug}] No messages were generated to send.")
-                else:
-                    logger.warning(f"[{field_op_slug}] Writer not available or closing. Cannot send {message_count} messages.")
-
-                logger.info(f"[{field_op_slug}] CoT message processing (generation & batch send) logic finished.")
-
-            except ConnectionError as e_conn: # Catches issues from open_connection or early write/drain issues
-                logger.error(f"[{field_op_slug}] Fatal Connection Error: {e_conn}. Aborting CoT send.")
-                return f"Failed: {e_conn}" # Return failure message
-            except ValueError as e_val: # e.g., from URL parsing
-                logger.error(f"[{field_op_slug}] Value Error during CoT setup: {e_val}. Aborting.")
-                return f"Failed: {e_val}"
-            except Exception as e: # Catch-all for other errors (e.g., message generation, non-connection drain issues re-raised)
-                logger.error(f"[{field_op_slug}] Unhandled exception in _run_cot main try block: {type(e).__name__} - {e}")
-                # ic(f"[{field_op_slug}] Unhandled exception context in _run_cot main try block: {e}")
-                # Raising the exception will let Django-Q handle it and mark task as failed.
-                # The finally block below will still run for cleanup.
-                raise
-
-            finally:
-                logger.info(f"[{field_op_slug}] Entering _run_cot main cleanup phase (finally block).")
-
-                # 1. Call simplified CotSender's cleanup method (if it has one and sender exists)
-                if sender and hasattr(sender, 'cleanup') and callable(getattr(sender, 'cleanup')):
-                    try:
-                        # ic(f"[{field_op_slug}] FINALLY: Calling sender.cleanup().")
-                        logger.debug(f"[{field_op_slug}] FINALLY: Calling sender.cleanup().")
-                        await sender.cleanup()
-                        logger.info(f"[{field_op_slug}] FINALLY: sender.cleanup() completed.")
-                    except Exception as e_sender_cleanup:
-                        logger.error(f"[{field_op_slug}] FINALLY: Exception during sender.cleanup(): {type(e_sender_cleanup).__name__} - {e_sender_cleanup}")
-
-                # 2. Close the writer if it's open and not already closing
-                if writer and not writer.is_closing():
-                    logger.info(f"[{field_op_slug}] FINALLY: Writer is open and not closing. Closing writer directly.")
-                    # ic(f"[{field_op_slug}] FINALLY: Closing writer directly.")
-                    writer.close()
-                    try:
-                        await asyncio.wait_for(writer.wait_closed(), timeout=PYTAK_WRITER_CLOSE_TIMEOUT)
-                        logger.info(f"[{field_op_slug}] FINALLY: Writer closed and waited successfully.")
-                        # ic(f"[{field_op_slug}] FINALLY: Writer.wait_closed() completed.")
-                    except asyncio.TimeoutError:
-                        pass
-                        # ic(f"[{field_op_slug}] FINALLY: Timeout waiting for writer.wait_closed().")
-                    except Exception as e_close_direct:
-                        pass
-                        # ic(f"[{field_op_slug}] FINALLY: writer.close()/wait_closed() exception: {e_close_direct}")
-                elif writer and writer.is_closing():
-                    logger.info(f"[{field_op_slug}] FINALLY: Writer was already closing. Attempting to wait for it to complete.")
-                    # ic(f"[{field_op_slug}] FINALLY: Writer was already closing. Waiting for wait_closed().")
-                    try:
-                        await asyncio.wait_for(writer.wait_closed(), timeout=PYTAK_WRITER_CLOSE_TIMEOUT)
-                        logger.info(f"[{field_op_slug}] FINALLY: Writer confirmed closed after already closing.")
-                    except asyncio.TimeoutError:
-                        pass
-                        # ic(f"[{field_op_slug}] FINALLY: Timeout waiting for already-closing writer.")
-                    except Exception as e_already_closing:
-                         logger.warning(f"[{field_op_slug}] FINALLY: Exception waiting for already-closing writer: {type(e_already_closing).__name__} - {e_already_closing}")
-                elif not writer:
-                    logger.info(f"[{field_op_slug}] FINALLY: Writer was not created (e.g., connection error). No writer to close.")
-                    # ic(f"[{field_op_slug}] FINALLY: Writer is None.")
-
-                logger.info(f"[{field_op_slug}] _run_cot main cleanup phase complete.")
-
-            logger.info(f"[{field_op_slug}] _run_cot completed its course (Linear Batch Mode).")
-            # If an exception was raised, asyncio.run() will propagate it.
-            # If a "Failed: ..." string was returned, that will be the result.
-            # Otherwise, successful completion implies None is returned by asyncio.run().
-
-        # Run the async function in a new event loop
-        return asyncio.run(_run_cot())
+        field_op = FieldOp.objects.select_related('tak_server').prefetch_related(COT_DESTINATIONS).get(slug=field_op_slug)
+        cot_job = cot_job_for(field_op, mark_type, aid_request_ids, include_field_op_marker)
+
+        targets = cot_targets_for(field_op)
+        if not targets:
+            # nothing to send to is not a failed send
+            reason = no_targets_reason(field_op)
+            logger.info(f"[{field_op_slug}] No CoT sent: {reason}.")
+            return f"Skipped: {reason}"
+
+        # Log where it goes; a UDP server has no certificates
+        for target in targets:
+            logger.info(f"[{field_op_slug}] TAK server {target.tak_server}: {target.endpoint}")
+
+        # Run on the pool's long-lived event loop
+        results = cot_pool.run(send_cot_to(field_op_slug, targets, cot_job, delta_only))
+        if len(results) == 1:
+            return results[0]
+        return combine_results(targets, results)
 
     except Exception as e:
         logger.error(f"Error in pytak_send_cot: {e}")
-        # ic(f"Outer error context in pytak_send_cot: {e}")
         return e
-
-async def main():
-    # Example usage (requires Django context or mocked objects)
-    # Replace with actual field_op_slug and aid_request_ids as needed
-    field_op_slug_example = "example-field-op"
-    # Mock FieldOp and TakServer if running outside Django
-    # For simplicity, this example assumes it can run within a Django-aware context or that models are mocked.
-
-    # To test field op marker only:
-    # result = pytak_send_cot(field_op_slug_example, mark_type='field')
-    # print(f"Result for field op marker: {result}")
-
-    # To test aid request markers (assuming aid_request_ids are valid for the field_op):
-    # aid_ids_example = [1, 2, 3]
-    # result_aid = pytak_send_cot(field_op_slug_example, mark_type='aid', aid_request_ids=aid_ids_example)
-    # print(f"Result for aid request markers: {result_aid}")
-    pass # Placeholder for example
-
-if __name__ == '__main__':
-    # This part is tricky to run directly without Django's context.
-    # You would need to set up Django environment or mock Django components (models, settings).
-    # For direct script execution, consider a management command or a standalone script
-    # that initializes Django settings if model access is needed.
-
-    # Example of how you might try to run it (very basic, likely needs more setup):
-    # import os
-    # import django
-    # os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'informs.settings') # Adjust to your project
-    # django.setup()
-
-    # asyncio.run(main())
-    print("To run examples, ensure Django context is available or mock necessary components.")
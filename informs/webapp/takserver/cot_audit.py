@@ -0,0 +1,158 @@
+"""
+CoT audit sink: keeps a copy of every CoT event written to a TAK server.
+
+Recording is an append to a bounded in-memory ring buffer; a background thread
+writes the raw bytes to a size-rotated (optionally gzip-compressed) file. Nothing is
+parsed or pretty-printed on the send path - use `manage.py cot_audit` to read it back.
+
+The web process and every qcluster share the file, so each append and rotation holds
+an exclusive flock on `<path>.lock`. Events dropped from a full ring buffer are
+logged as a warning by the writer.
+
+Record format (one per event):
+    <unix time> <field op slug> <payload length>\n<payload>\n
+"""
+import atexit
+import fcntl
+import gzip
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+COT_AUDIT_ENABLED = getattr(settings, 'COT_AUDIT_ENABLED', True)
+COT_AUDIT_PATH = getattr(settings, 'COT_AUDIT_PATH', os.path.join(settings.LOGS_DIR, 'cot_audit.log.gz'))
+COT_AUDIT_COMPRESS = getattr(settings, 'COT_AUDIT_COMPRESS', True)
+COT_AUDIT_MAX_BYTES = getattr(settings, 'COT_AUDIT_MAX_BYTES', 10 * 1024 * 1024)  # rotate after 10MB on disk
+COT_AUDIT_BACKUP_COUNT = getattr(settings, 'COT_AUDIT_BACKUP_COUNT', 5)
+COT_AUDIT_BUFFER_SIZE = getattr(settings, 'COT_AUDIT_BUFFER_SIZE', 10000)  # events held in memory before the oldest drop
+COT_AUDIT_FLUSH_INTERVAL = getattr(settings, 'COT_AUDIT_FLUSH_INTERVAL', 1.0)  # seconds
+
+
+class CotAuditSink:
+    """Ring buffer of sent CoT events plus a background writer thread."""
+
+    def __init__(self, path=COT_AUDIT_PATH, compress=COT_AUDIT_COMPRESS, max_bytes=COT_AUDIT_MAX_BYTES,
+                 backup_count=COT_AUDIT_BACKUP_COUNT, buffer_size=COT_AUDIT_BUFFER_SIZE,
+                 flush_interval=COT_AUDIT_FLUSH_INTERVAL, enabled=COT_AUDIT_ENABLED):
+        self.path = str(path)
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.buffer = deque(maxlen=buffer_size)
+        self.recorded = 0
+        self.written = 0
+        self._dropped_logged = 0
+        self._wakeup = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def dropped(self):
+        """Events pushed out of the ring buffer before they were written."""
+        return self.recorded - self.written - len(self.buffer)
+
+    def record(self, field_op_slug, messages):
+        """Queue encoded events for writing. Cheap enough to call on the send path."""
+        if not self.enabled:
+            return
+        now = time.time()
+        for payload in messages:
+            self.buffer.append((now, field_op_slug, payload))
+        self.recorded += len(messages)
+        self._ensure_writer()
+
+    def _ensure_writer(self):
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='cot-audit-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"CoT audit writer failed: {type(e).__name__} - {e}")
+
+    def flush(self):
+        """Write everything buffered so far."""
+        with self._write_lock:
+            self._log_dropped()
+            records = []
+            while self.buffer:
+                try:
+                    records.append(self.buffer.popleft())
+                except IndexError:
+                    break
+            if not records:
+                return 0
+            chunks = []
+            for recorded_at, field_op_slug, payload in records:
+                chunks.append(b'%.6f %s %d\n' % (recorded_at, (field_op_slug or '-').encode(), len(payload)))
+                chunks.append(payload)
+                chunks.append(b'\n')
+            self._write(b''.join(chunks))
+            self.written += len(records)
+            return len(records)
+
+    def _log_dropped(self):
+        dropped = self.dropped
+        if dropped > self._dropped_logged:
+            logger.warning(f"CoT audit buffer full: {dropped - self._dropped_logged} events dropped "
+                           f"({dropped} since start, pid {os.getpid()})")
+            self._dropped_logged = dropped
+
+    def _write(self, data):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if self.compress:
+            # each flush appends one gzip member; gzip readers see a single stream
+            data = gzip.compress(data, compresslevel=6)
+        # other processes append to and rotate the same file
+        with open(f"{self.path}.lock", 'ab') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with open(self.path, 'ab') as audit_file:
+                audit_file.write(data)
+                size = audit_file.tell()
+            if self.max_bytes and size >= self.max_bytes:
+                self._rotate()
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def audit_files(self):
+        """Audit files from oldest to newest."""
+        files = [f"{self.path}.{i}" for i in range(self.backup_count, 0, -1)] + [self.path]
+        return [f for f in files if os.path.exists(f)]
+
+    def read(self):
+        """Yield (recorded_at, field_op_slug, payload) from the audit files, oldest first."""
+        for audit_file in self.audit_files():
+            opener = gzip.open if self.compress else open
+            with opener(audit_file, 'rb') as stream:
+                while header := stream.readline():
+                    recorded_at, field_op_slug, length = header.split()
+                    payload = stream.read(int(length))
+                    stream.read(1)  # record separator
+                    yield float(recorded_at), field_op_slug.decode(), payload
+
+
+cot_audit = CotAuditSink()
+atexit.register(cot_audit.flush)
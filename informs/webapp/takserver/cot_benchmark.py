@@ -0,0 +1,189 @@
+"""
+End-to-end CoT throughput benchmark against a local CotSink.
+
+Creates a throwaway TakServer pointing at the sink plus one synthetic field op per size
+(each with that many aid requests), drives the real send paths against them and reports
+events/sec, bytes received and p50/p95 connect, generate and drain times, plus the size of
+every field op's markers as CoT XML and as TAK protocol v1. Everything it creates is
+prefixed with BENCH_PREFIX and removed again afterwards.
+
+Run it with `manage.py cot_benchmark`.
+"""
+import math
+import os
+import shutil
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from aidrequests.models import FieldOp, AidType, AidRequest, AidLocation
+from .connection_pool import cot_pool, endpoint_for
+from .cot import pytak_send_cot, COT_ENCODERS
+from .cot_maker import CotMaker
+from .cot_audit import cot_audit
+from .cot_sink import CotSink, generate_certificates, server_ssl_context
+from .cot_sweep import run_sweep, sweep_job
+from .models import TakServer, CotMarkerState
+
+BENCH_PREFIX = 'cotbench'
+BENCH_TARGETS = ['pytak_send_cot', 'send_cot_task', 'send_all_field_op_cot']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list of numbers."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class CotBenchmark:
+    """Set up the sink and synthetic data, run the targets, tear it all down."""
+
+    def __init__(self, sizes=(10, 1000, 10000), runs=3, host='127.0.0.1', port=18089, cold=False,
+                 encoding='xml', log=print):
+        self.sizes = list(sizes)
+        self.encoding = encoding
+        self.runs = runs
+        self.host = host
+        self.port = port
+        self.cold = cold
+        self.log = log
+        self.cert_dir = os.path.join(settings.MEDIA_ROOT, 'certificates', BENCH_PREFIX)
+        self.sink = None
+        self.tak_server = None
+        self.field_ops = {}
+
+    def setup(self):
+        certs = generate_certificates(self.cert_dir, hostname=self.host)
+        self.sink = CotSink(self.host, self.port, ssl_context=server_ssl_context(certs),
+                            offer_protobuf=self.encoding == 'protobuf').start()
+
+        self.tak_server = TakServer.objects.create(
+            name=BENCH_PREFIX,
+            dns_name=f"{self.host}:{self.port}",
+            cert_trust=os.path.relpath(certs['ca'], settings.MEDIA_ROOT),
+            cert_private=os.path.relpath(certs['client'], settings.MEDIA_ROOT),
+            notes='Temporary TakServer for manage.py cot_benchmark',
+            cot_encoding=self.encoding,
+        )
+        aid_type, _ = AidType.objects.get_or_create(slug=BENCH_PREFIX, defaults={'name': 'CoT Benchmark'})
+        for size in self.sizes:
+            self.log(f"Creating field op with {size} aid requests...")
+            field_op = FieldOp.objects.create(
+                name=f"CoT Benchmark {size}", slug=f"{BENCH_PREFIX}-{size}",
+                latitude=34.0, longitude=-118.0, tak_server=self.tak_server,
+            )
+            # bulk_create skips AidRequest.save, so nothing is queued for sending
+            aid_requests = AidRequest.objects.bulk_create(
+                AidRequest(field_op=field_op, aid_type=aid_type, aid_description=f"Synthetic request {i}")
+                for i in range(size)
+            )
+            AidLocation.objects.bulk_create(
+                AidLocation(aid_request=aid_request, status='confirmed', source='manual',
+                            latitude=34.0 + (i % 1000) / 10000, longitude=-118.0 - (i // 1000) / 1000)
+                for i, aid_request in enumerate(aid_requests)
+            )
+            self.field_ops[size] = (field_op, [aid_request.pk for aid_request in aid_requests])
+
+    def teardown(self):
+        FieldOp.objects.filter(slug__startswith=f"{BENCH_PREFIX}-").delete()
+        AidType.objects.filter(slug=BENCH_PREFIX).delete()
+        if self.tak_server is not None:
+            cot_pool.run(cot_pool.discard(endpoint_for(self.tak_server)))
+            self.tak_server.delete()
+        if self.sink is not None:
+            self.sink.stop()
+        shutil.rmtree(self.cert_dir, ignore_errors=True)
+
+    def _calls(self, target, size):
+        """Return (callable, expected event count) for one target and size."""
+        from aidrequests.tasks import send_cot_task
+
+        if target == 'pytak_send_cot':
+            field_op, aid_request_ids = self.field_ops[size]
+            return lambda: pytak_send_cot(field_op.slug, 'aid', aid_request_ids), size + 1
+        if target == 'send_cot_task':
+            field_op, _ = self.field_ops[size]
+            return lambda: send_cot_task(field_op_slug=field_op.slug, mark_type='aid'), size + 1
+        # send_all_field_op_cot would also sweep every real field op, so drive its sweep
+        # engine over the benchmark field ops only, with every marker sent each run
+        jobs = [sweep_job(fo, ids) for fo, ids in self.field_ops.values()]
+        return lambda: run_sweep(jobs, delta_only=False), sum(len(ids) + 1 for _, ids in self.field_ops.values())
+
+    def measure(self, target, size):
+        call, expected = self._calls(target, size)
+        samples = []
+        for _ in range(self.runs):
+            if self.cold:
+                cot_pool.run(cot_pool.discard(endpoint_for(self.tak_server)))
+            CotMarkerState.objects.filter(tak_server=self.tak_server).delete()
+            self.sink.reset()
+            started = time.monotonic()
+            result = call()
+            if not self.sink.wait_for_events(expected):
+                raise RuntimeError(f"{target} ({size}): sink got {self.sink.event_count} of {expected} events, result: {result}")
+            elapsed = self.sink.last_event_at - started
+            reports = result if isinstance(result, list) else [result]
+            samples.append({
+                'elapsed': elapsed,
+                'events': self.sink.event_count,
+                'bytes': self.sink.bytes_received,
+                'timings': [report['timings'] for report in reports if isinstance(report, dict) and 'timings' in report],
+            })
+        return self.summarize(target, size, samples)
+
+    def summarize(self, target, size, samples):
+        def series(name):
+            return [timings[name] for sample in samples for timings in sample['timings']]
+
+        summary = {
+            'target': target,
+            'encoding': self.encoding,
+            'size': size,
+            'runs': len(samples),
+            'events': samples[0]['events'],
+            'bytes': samples[0]['bytes'],
+            'events_per_sec': statistics.median(s['events'] / s['elapsed'] for s in samples),
+            'elapsed_p50': percentile([s['elapsed'] for s in samples], 50),
+        }
+        for name in ('connect', 'generate', 'drain'):
+            # None when the target does not report timings (send_cot_task returns a message)
+            values = series(name)
+            summary[f'{name}_p50'] = percentile(values, 50) if values else None
+            summary[f'{name}_p95'] = percentile(values, 95) if values else None
+        return summary
+
+    def encoding_sizes(self):
+        """Bytes for each field op's markers in every encoding, from one build."""
+        sizes = []
+        for size, (field_op, aid_request_ids) in self.field_ops.items():
+            cot_maker = CotMaker(sweep_job(field_op, aid_request_ids).cot_job)
+            markers = async_to_sync(cot_maker.build_markers)()
+            row = {'size': size, 'events': len(markers)}
+            for encoding, encode in COT_ENCODERS.items():
+                row[encoding] = sum(len(encode(marker, now=cot_maker.now)) for marker in markers)
+            sizes.append(row)
+        return sizes
+
+    def run(self, targets=BENCH_TARGETS):
+        """Run every target for every size.
+
+        Returns:
+            tuple: (one summary dict per (target, size), encoding size comparison rows)
+        """
+        audit_enabled, cot_audit.enabled = cot_audit.enabled, False  # keep benchmark events out of the audit log
+        results = []
+        try:
+            self.setup()
+            encoding_sizes = self.encoding_sizes()
+            for target in targets:
+                # the sweep sends every size at once
+                for size in (self.sizes if target != 'send_all_field_op_cot' else [sum(self.sizes)]):
+                    self.log(f"Running {target} ({size} aid requests, {self.runs} runs)...")
+                    results.append(self.measure(target, size))
+        finally:
+            cot_audit.enabled = audit_enabled
+            self.teardown()
+        return results, encoding_sizes
@@ -0,0 +1,110 @@
+"""
+Per-TakServer circuit breaker for CoT sends.
+
+An unreachable TAK server costs every send up to PYTAK_CONNECTION_TIMEOUT of a django-q
+worker's time, and with a single worker that holds up every other task. After
+COT_CIRCUIT_FAILURE_THRESHOLD consecutive connection failures the circuit opens: sends to
+that server fail fast and their events go straight to the spool (cot_spool).
+
+probe_open_circuits() runs on a schedule. It tries a plain TCP connect to every server
+whose circuit has been open for COT_CIRCUIT_RESET_TIMEOUT seconds; if the server answers,
+the circuit goes half open and the next real send decides: success closes it, failure
+opens it again.
+
+State lives in TakServerHealth so the web process can show it.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .connection_pool import cot_pool, endpoint_for
+from .models import TakServerHealth
+
+logger = logging.getLogger(__name__)
+
+COT_CIRCUIT_FAILURE_THRESHOLD = getattr(settings, 'COT_CIRCUIT_FAILURE_THRESHOLD', 3)  # consecutive failures that open the circuit
+COT_CIRCUIT_RESET_TIMEOUT = getattr(settings, 'COT_CIRCUIT_RESET_TIMEOUT', 300)  # seconds open before a probe is tried
+COT_CIRCUIT_PROBE_TIMEOUT = getattr(settings, 'COT_CIRCUIT_PROBE_TIMEOUT', 3)  # seconds for the probe's TCP connect
+
+
+class CircuitOpen(ConnectionError):
+    """Sends to this TAK server are failing fast until a probe finds it reachable again."""
+
+
+async def allow(tak_server_id):
+    """Check the circuit before connecting.
+
+    Returns:
+        TakServerHealth: current state, or None if this server never failed
+
+    Raises:
+        CircuitOpen: while the circuit is open
+    """
+    health = await TakServerHealth.objects.filter(tak_server_id=tak_server_id).afirst()
+    if health is not None and health.state == 'open':
+        raise CircuitOpen(f"Circuit open after {health.consecutive_failures} failures: {health.last_error}")
+    return health
+
+
+async def record_success(tak_server_id, health):
+    """Close the circuit; writes only when there was something to reset."""
+    if health is None or (health.state == 'closed' and not health.consecutive_failures):
+        return
+    if health.state != 'closed':
+        logger.info(f"TAK server {tak_server_id} is reachable again, closing its circuit.")
+    await TakServerHealth.objects.filter(tak_server_id=tak_server_id).aupdate(
+        state='closed', consecutive_failures=0, last_success_at=timezone.now()
+    )
+
+
+async def record_failure(tak_server_id, error):
+    """Count a connection failure; opens the circuit at the threshold, or at once when half open."""
+    now = timezone.now()
+    health, _ = await TakServerHealth.objects.aget_or_create(tak_server_id=tak_server_id)
+    health.consecutive_failures += 1
+    health.last_error = str(error)
+    health.last_error_at = now
+    if health.state == 'half_open' or health.consecutive_failures >= COT_CIRCUIT_FAILURE_THRESHOLD:
+        if health.state != 'open':
+            logger.warning(f"Opening circuit for TAK server {tak_server_id} after {health.consecutive_failures} failures: {error}")
+        health.state = 'open'
+        health.opened_at = now
+    await health.asave()
+
+
+async def probe(endpoint, timeout=COT_CIRCUIT_PROBE_TIMEOUT):
+    """True when the endpoint accepts a TCP connection.
+
+    A UDP SA endpoint answers nothing to probe; the next send decides for it.
+    """
+    if endpoint.transport == 'udp':
+        return True
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(endpoint.host, endpoint.port), timeout)
+    except (asyncio.TimeoutError, OSError):
+        return False
+    writer.close()
+    return True
+
+
+def probe_open_circuits():
+    """django-q task: half-open the circuits of TAK servers that answer again.
+
+    Returns:
+        dict: probed server names mapped to the resulting state
+    """
+    due = timezone.now() - timedelta(seconds=COT_CIRCUIT_RESET_TIMEOUT)
+    results = {}
+    for health in TakServerHealth.objects.filter(state='open', opened_at__lte=due).select_related('tak_server'):
+        reachable = cot_pool.run(probe(endpoint_for(health.tak_server)))
+        if reachable:
+            health.state = 'half_open'
+            logger.info(f"TAK server {health.tak_server} answered the probe, circuit half open.")
+        else:
+            health.opened_at = timezone.now()
+        health.save(update_fields=['state', 'opened_at'])
+        results[health.tak_server.name] = health.state
+    return results
@@ -0,0 +1,92 @@
+"""
+Delta CoT sweeps: only send markers that changed since they were last sent.
+
+CotMarkerState keeps, per TAK server and event UID, a digest of the marker content and
+when it was last sent. A sweep skips a marker when its digest is unchanged and the copy
+on the TAK server is not close to going stale.
+"""
+import hashlib
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+
+from .cot_encoder import MARKER_CONTENT_FIELDS
+from .models import CotMarkerState
+
+logger = logging.getLogger(__name__)
+
+# Resend unchanged markers this long before they go stale; must be longer than the sweep interval (hourly)
+COT_STALE_RESEND_MARGIN = getattr(settings, 'COT_STALE_RESEND_MARGIN', 7200)
+COT_REFRESH_FRACTION = getattr(settings, 'COT_REFRESH_FRACTION', 0.8)  # refresh scheduler resends at this fraction of the stale time
+COT_REFRESH_JITTER = getattr(settings, 'COT_REFRESH_JITTER', 0.1)  # up to this fraction of the stale time earlier, to spread the load
+
+
+def marker_digest(marker):
+    """Hash everything that goes into a marker's event except its times."""
+    content = '\x1f'.join('' if value is None else str(value) for value in marker[:MARKER_CONTENT_FIELDS])
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def refresh_due(last_sent, stale_seconds):
+    """When the refresh scheduler should resend a marker sent at last_sent.
+
+    The random jitter keeps markers sent together from all coming due together again.
+    """
+    fraction = COT_REFRESH_FRACTION - random.uniform(0, COT_REFRESH_JITTER)
+    return last_sent + timedelta(seconds=stale_seconds * fraction)
+
+
+def is_due(state, digest, now, margin=COT_STALE_RESEND_MARGIN):
+    """True when a marker with this digest has to be sent again."""
+    if state is None or state.digest != digest:
+        return True
+    return now >= state.last_sent + timedelta(seconds=state.stale_seconds - margin)
+
+
+async def select_changed(tak_server_id, markers, now, margin=COT_STALE_RESEND_MARGIN):
+    """Split markers into those that must be sent and those the TAK server already has.
+
+    Returns:
+        tuple: (markers to send, markers skipped)
+    """
+    states = CotMarkerState.objects.filter(tak_server_id=tak_server_id, uid__in=[marker.uid for marker in markers])
+    states = {state.uid: state async for state in states}
+    to_send, skipped = [], []
+    for marker in markers:
+        if is_due(states.get(marker.uid), marker_digest(marker), now, margin):
+            to_send.append(marker)
+        else:
+            skipped.append(marker)
+    return to_send, skipped
+
+
+# CotMarkerState fields an upsert overwrites
+STATE_UPDATE_FIELDS = ['digest', 'stale_seconds', 'last_sent', 'field_op', 'aid_request', 'refresh_due']
+
+
+async def record_sent(tak_server_id, markers, now):
+    """Remember what was sent to a TAK server, one upsert for the batch."""
+    # one row per UID; the last marker for a UID is the one the server kept
+    states = {
+        marker.uid: CotMarkerState(
+            tak_server_id=tak_server_id,
+            uid=marker.uid,
+            digest=marker_digest(marker),
+            stale_seconds=int(marker.stale_seconds),
+            last_sent=now,
+            field_op_id=marker.field_op_id,
+            aid_request_id=marker.aid_request_id,
+            refresh_due=refresh_due(now, int(marker.stale_seconds)),
+        )
+        for marker in markers
+    }
+    if not states:
+        return
+    await CotMarkerState.objects.abulk_create(
+        states.values(),
+        update_conflicts=True,
+        unique_fields=['tak_server', 'uid'],
+        update_fields=STATE_UPDATE_FIELDS,
+    )
@@ -0,0 +1,142 @@
+"""
+Compiled CoT XML encoder.
+
+`make_cot` used to build every event from ~12 ElementTree elements. The event layout
+never changes, so the skeleton is rendered once per CoT type and link shape, and each
+event only splices in its escaped values. Output is byte-identical to
+`ET.tostring(event)` of the old builder: same attribute order, same escaping, ASCII
+output with non-ASCII characters as numeric character references.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+# Stale times used by make_cot
+FIELD_MARK_STALE = 86400  # 1 day
+AID_MARK_STALE = 21600  # 6 hours
+
+# Everything needed to encode one map marker, independent of when it is sent, plus the
+# field op and aid request it was built from (not encoded)
+CotMarker = namedtuple(
+    'CotMarker',
+    ['uid', 'cot_type', 'callsign', 'lat', 'lon', 'remarks',
+     'stale_seconds', 'link_uid', 'link_type', 'link_parent_callsign',
+     'field_op_id', 'aid_request_id'],
+    defaults=('', FIELD_MARK_STALE, None, None, None, None, None)
+)
+# The leading CotMarker fields that go into the event
+MARKER_CONTENT_FIELDS = 10
+
+_EVENT_HEAD = '<event version="2.0" uid="%s" type="{type}" how="h-e" time="%s" start="%s" stale="%s">'
+_POINT = '<point lat="%s" lon="%s" hae="0" ce="9999999" le="9999999" />'
+_DETAIL_HEAD = '<detail><archive /><status readiness="true" /><color argb="-1" />'
+_LINK = '<link uid="%s" relation="p-p" type="{link_type}" />'
+_LINK_PARENT = '<link uid="%s" relation="p-p" type="{link_type}" parent_callsign="%s" />'
+_PRECISION = '<precisionlocation geopointsrc="???" altsrc="???" />'
+_REMARKS = '<remarks>%s</remarks>'
+_REMARKS_EMPTY = '<remarks />'
+_DETAIL_TAIL = '<contact callsign="%s" /></detail></event>'
+
+
+def escape_attrib(text):
+    """Escape an attribute value exactly as xml.etree.ElementTree does."""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    if "\"" in text:
+        text = text.replace("\"", "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
+
+
+def escape_cdata(text):
+    """Escape element text exactly as xml.etree.ElementTree does."""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _literal(value):
+    # escaped value baked into a template, protected from %-formatting
+    return escape_attrib(value).replace('%', '%%')
+
+
+@lru_cache(maxsize=512)
+def compile_template(cot_type, link_type=None, has_parent_callsign=False, has_remarks=True):
+    """Render the fixed event skeleton for one CoT type / link shape.
+
+    The result is a %-format string whose slots are, in order: uid, time, start, stale,
+    lat, lon, [link uid, [parent callsign]], [remarks], callsign.
+    """
+    parts = [_EVENT_HEAD.format(type=_literal(cot_type)), _POINT, _DETAIL_HEAD]
+    if link_type is not None:
+        link = _LINK_PARENT if has_parent_callsign else _LINK
+        parts.append(link.format(link_type=_literal(link_type)))
+    parts.append(_PRECISION)
+    parts.append(_REMARKS if has_remarks else _REMARKS_EMPTY)
+    parts.append(_DETAIL_TAIL)
+    return ''.join(parts)
+
+
+def w3c_time(dt):
+    """Format a UTC datetime like pytak.cot_time() (W3C XML dateTime), without strftime."""
+    return '%04d-%02d-%02dT%02d:%02d:%02d.%06dZ' % (
+        dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, dt.microsecond)
+
+
+@lru_cache(maxsize=64)
+def _cot_times(now, stale_seconds):
+    return w3c_time(now), w3c_time(now + timedelta(seconds=int(stale_seconds)))
+
+
+def cot_times(stale_seconds, now=None):
+    """Return (time, stale) strings in pytak.cot_time() format.
+
+    Pass the same `now` for every event of a batch and the strings are formatted once.
+    """
+    return _cot_times(now or datetime.now(timezone.utc), stale_seconds)
+
+
+def encode_cot(marker, now=None):
+    """Encode a CotMarker as CoT XML bytes.
+
+    Args:
+        marker (CotMarker): marker to encode
+        now (datetime): event time (UTC), defaults to the current time
+
+    Returns:
+        bytes: the encoded event
+    """
+    has_link = bool(marker.link_uid and marker.link_type)
+    has_parent = has_link and bool(marker.link_parent_callsign)
+    template = compile_template(
+        marker.cot_type,
+        marker.link_type if has_link else None,
+        has_parent,
+        bool(marker.remarks),
+    )
+    cot_time, stale_time = cot_times(marker.stale_seconds, now)
+
+    values = [escape_attrib(marker.uid), cot_time, cot_time, stale_time,
+              escape_attrib(str(marker.lat)), escape_attrib(str(marker.lon))]
+    if has_link:
+        values.append(escape_attrib(marker.link_uid))
+        if has_parent:
+            values.append(escape_attrib(marker.link_parent_callsign))
+    if marker.remarks:
+        values.append(escape_cdata(marker.remarks))
+    values.append(escape_attrib(marker.callsign))
+
+    return (template % tuple(values)).encode('ascii', 'xmlcharrefreplace')
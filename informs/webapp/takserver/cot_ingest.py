@@ -0,0 +1,318 @@
+"""
+CoT ingest: positions and markers coming back from TAK servers.
+
+Informs only pushes CoT; responders' positions and markers placed in ATAK/iTAK never
+came back. `manage.py cot_ingest` holds one read connection per TakServer, opened like
+the send pool's (open_stream, in the server's CoT encoding), and parses the inbound
+stream as it arrives: XML events are split off the buffer at </event> and parsed one at
+a time with lxml, protobuf events are split off by their frames. Memory stays bounded by
+one event (COT_INGEST_MAX_EVENT_BYTES) per connection plus the batch waiting to be written.
+
+Events are filtered on type and UID prefix (COT_INGEST_TYPES, COT_INGEST_UID_PREFIXES),
+and our own markers echoed back by the server are dropped. The latest event per UID is
+kept and every COT_INGEST_FLUSH_INTERVAL seconds the batch is written in one transaction
+per server, with bulk upserts:
+
+- every event updates the CotTrack of its UID (responder positions, map points)
+- an event linked to one of our aid request markers also becomes a candidate AidLocation
+  with source 'other', so a position marked on the TAK map can be confirmed in Informs
+"""
+import asyncio
+import logging
+import ssl
+import struct
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone as django_timezone
+from lxml import etree
+
+from aidrequests.models import AidLocation
+from .connection_pool import endpoint_for, open_stream
+from .cot_package import stale_packages
+from .cot_snapshot import invalidate
+from .cot_protobuf import decode_cot_protobuf, split_frames, read_varint, TAK_PROTO_MAGIC
+from .models import CotMarkerState, CotTrack
+
+logger = logging.getLogger(__name__)
+
+COT_INGEST_TYPES = getattr(settings, 'COT_INGEST_TYPES', ('a-f-', 'b-m-p-'))  # type prefixes kept: friendly units, map points
+COT_INGEST_UID_PREFIXES = getattr(settings, 'COT_INGEST_UID_PREFIXES', ())  # only UIDs starting with one of these; empty keeps all
+COT_INGEST_FLUSH_INTERVAL = getattr(settings, 'COT_INGEST_FLUSH_INTERVAL', 0.5)  # seconds between batch writes
+COT_INGEST_MAX_PENDING = getattr(settings, 'COT_INGEST_MAX_PENDING', 5000)  # UIDs waiting that trigger an early write
+COT_INGEST_MAX_EVENT_BYTES = getattr(settings, 'COT_INGEST_MAX_EVENT_BYTES', 64 * 1024)  # larger events are skipped
+COT_INGEST_RECONNECT_DELAY = getattr(settings, 'COT_INGEST_RECONNECT_DELAY', 5)  # seconds, doubled after each failed connect
+COT_INGEST_RECONNECT_MAX = getattr(settings, 'COT_INGEST_RECONNECT_MAX', 120)  # longest wait between connects
+
+EVENT_END = b'</event>'
+EVENT_START = b'<event'
+
+# One inbound event, as much of it as ingest uses; link_uid is the parent of a linked marker
+CotIngestEvent = namedtuple('CotIngestEvent', ['uid', 'cot_type', 'callsign', 'lat', 'lon', 'time', 'stale', 'link_uid'])
+
+# Events come from the network: no entities, no DTDs, no network access
+_XML_PARSER = etree.XMLParser(resolve_entities=False, no_network=True, load_dtd=False, remove_comments=True)
+
+
+def _cot_time(value):
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _millis_time(value):
+    return datetime.fromtimestamp(value / 1000, timezone.utc)
+
+
+def parse_xml_event(data):
+    """Parse one CoT XML event; None when it is not a usable event."""
+    try:
+        root = etree.fromstring(data, _XML_PARSER)
+    except etree.XMLSyntaxError:
+        return None
+    point = root.find('point')
+    if root.tag != 'event' or point is None:
+        return None
+    contact = root.find('detail/contact')
+    link = root.find('detail/link')
+    try:
+        return CotIngestEvent(
+            uid=root.get('uid') or '',
+            cot_type=root.get('type') or '',
+            callsign=contact.get('callsign', '') if contact is not None else '',
+            lat=float(point.get('lat')),
+            lon=float(point.get('lon')),
+            time=_cot_time(root.get('time')),
+            stale=_cot_time(root.get('stale')),
+            link_uid=link.get('uid') if link is not None else None,
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_protobuf_event(payload):
+    """Parse one TakMessage payload; None when it carries no usable event."""
+    try:
+        event = decode_cot_protobuf(payload)
+    except (ValueError, IndexError, struct.error):
+        return None
+    if event is None:
+        return None
+    link_uid = None
+    if event['xml_detail']:
+        try:
+            link = etree.fromstring(f"<detail>{event['xml_detail']}</detail>", _XML_PARSER).find('link')
+        except etree.XMLSyntaxError:
+            link = None
+        link_uid = link.get('uid') if link is not None else None
+    try:
+        return CotIngestEvent(
+            uid=event['uid'],
+            cot_type=event['type'],
+            callsign=event['callsign'],
+            lat=float(event['lat']),
+            lon=float(event['lon']),
+            time=_millis_time(event['time']),
+            stale=_millis_time(event['stale']),
+            link_uid=link_uid,
+        )
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+class CotStreamParser:
+    """Splits a TAK server's inbound stream into CotIngestEvents as chunks arrive.
+
+    Only the unfinished event is buffered. An XML event that grows past
+    COT_INGEST_MAX_EVENT_BYTES is skipped up to the next <event; an oversized protobuf frame
+    cannot be skipped safely and raises ValueError, so the connection is reopened.
+    """
+
+    def __init__(self, encoding='xml', buffer=b''):
+        self.encoding = encoding
+        self.buffer = buffer
+
+    def feed(self, chunk):
+        """Add received bytes.
+
+        Returns:
+            list: the CotIngestEvents completed by this chunk
+        """
+        self.buffer += chunk
+        if self.encoding == 'protobuf':
+            self._check_frame()
+            payloads, self.buffer = split_frames(self.buffer)
+            events = [parse_protobuf_event(payload) for payload in payloads]
+        else:
+            *raw_events, self.buffer = self.buffer.split(EVENT_END)
+            events = [parse_xml_event(raw.lstrip() + EVENT_END) for raw in raw_events]
+            if len(self.buffer) > COT_INGEST_MAX_EVENT_BYTES:
+                start = self.buffer.find(EVENT_START, 1)
+                logger.warning(f"Skipping an inbound CoT event over {COT_INGEST_MAX_EVENT_BYTES} bytes.")
+                self.buffer = self.buffer[start:] if start >= 0 else b''
+        return [event for event in events if event is not None]
+
+    def _check_frame(self):
+        if not self.buffer:
+            return
+        if self.buffer[0] != TAK_PROTO_MAGIC:
+            raise ValueError(f"Bad TAK protocol magic byte {self.buffer[0]:#x}")
+        length, _ = read_varint(self.buffer, 1)
+        if length is not None and length > COT_INGEST_MAX_EVENT_BYTES:
+            raise ValueError(f"Inbound TAK message of {length} bytes is over {COT_INGEST_MAX_EVENT_BYTES}")
+
+
+def accept(event, types=None, uid_prefixes=None):
+    """True for events ingest keeps (COT_INGEST_TYPES and COT_INGEST_UID_PREFIXES by default)."""
+    types = COT_INGEST_TYPES if types is None else types
+    uid_prefixes = COT_INGEST_UID_PREFIXES if uid_prefixes is None else uid_prefixes
+    if not event.uid or not event.cot_type.startswith(tuple(types)):
+        return False
+    return not uid_prefixes or event.uid.startswith(tuple(uid_prefixes))
+
+
+def location_uid(tak_server_id, event_uid):
+    """Stable AidLocation uid for a TAK event, so a moved point updates its candidate location."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"cot:{tak_server_id}:{event_uid}"))
+
+
+def store(tak_server_id, events, now):
+    """Write one batch of a TAK server's events: bulk upserts in one transaction.
+
+    Events for UIDs we send to that server ourselves (CotMarkerState) are echoes and dropped.
+    A moved point updates its candidate location until staff confirm or reject it; after
+    that its location is left alone.
+
+    Returns:
+        tuple: (tracks written, candidate aid locations written)
+    """
+    uids = {event.uid for event in events} | {event.link_uid for event in events if event.link_uid}
+    ours = dict(
+        CotMarkerState.objects.filter(tak_server_id=tak_server_id, uid__in=uids).values_list('uid', 'aid_request_id')
+    )
+    events = [event for event in events if event.uid not in ours]
+    tracks = [
+        CotTrack(tak_server_id=tak_server_id, uid=event.uid, cot_type=event.cot_type, callsign=event.callsign,
+                 latitude=event.lat, longitude=event.lon, event_time=event.time, stale_at=event.stale, received_at=now)
+        for event in events
+    ]
+    candidates = [
+        AidLocation(uid=location_uid(tak_server_id, event.uid), aid_request_id=ours[event.link_uid],
+                    status='candidate', source='other', latitude=round(event.lat, 5), longitude=round(event.lon, 5),
+                    note=f"From TAK: {event.callsign or event.uid}")
+        for event in events if ours.get(event.link_uid)
+    ]
+    with transaction.atomic():
+        if tracks:
+            CotTrack.objects.bulk_create(
+                tracks,
+                update_conflicts=True,
+                unique_fields=['tak_server', 'uid'],
+                update_fields=['cot_type', 'callsign', 'latitude', 'longitude', 'event_time', 'stale_at', 'received_at'],
+            )
+        # confirmed and rejected locations are staff decisions, not overwritten by a moved point
+        settled = set(
+            AidLocation.objects.filter(uid__in=[candidate.uid for candidate in candidates])
+            .exclude(status='candidate').values_list('uid', flat=True)
+        ) if candidates else set()
+        candidates = [candidate for candidate in candidates if candidate.uid not in settled]
+        if candidates:
+            AidLocation.objects.bulk_create(
+                candidates,
+                update_conflicts=True,
+                unique_fields=['uid'],
+                update_fields=['latitude', 'longitude', 'note', 'updated_at'],
+            )
+            # bulk_create sends no signals
+            aid_request_ids = {candidate.aid_request_id for candidate in candidates}
+            invalidate(aid_request_id__in=aid_request_ids)
+            stale_packages(field_op__aid_requests__in=aid_request_ids)
+    return len(tracks), len(candidates)
+
+
+class CotIngest:
+    """Listens to every given TakServer and writes what arrives in batches."""
+
+    def __init__(self, tak_servers, flush_interval=None):
+        self.servers = [(tak_server.pk, tak_server.name, endpoint_for(tak_server)) for tak_server in tak_servers]
+        self.flush_interval = flush_interval or COT_INGEST_FLUSH_INTERVAL
+        self.pending = {}  # {(tak server id, uid): latest CotIngestEvent}
+        self.received = self.stored = self.candidates = 0
+        self._flush_now = None
+
+    async def run(self):
+        """Listen until cancelled; whatever is still pending is written on the way out."""
+        self._flush_now = asyncio.Event()
+        tasks = [asyncio.create_task(self.listen(*server)) for server in self.servers]
+        tasks.append(asyncio.create_task(self.flush_loop()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.flush()
+
+    async def listen(self, tak_server_id, name, endpoint):
+        """Hold a read connection to one server, reconnecting with backoff."""
+        delay = COT_INGEST_RECONNECT_DELAY
+        while True:
+            try:
+                reader, writer, buffer = await open_stream(endpoint)
+            except ConnectionError as e_conn:
+                logger.warning(f"CoT ingest could not connect to {name}: {e_conn}. Retrying in {delay}s.")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, COT_INGEST_RECONNECT_MAX)
+                continue
+            delay = COT_INGEST_RECONNECT_DELAY
+            logger.info(f"CoT ingest listening to {name} ({endpoint.encoding}).")
+            parser = CotStreamParser(endpoint.encoding, buffer)
+            try:
+                self.add(tak_server_id, parser.feed(b''))
+                while chunk := await reader.read(65536):
+                    self.add(tak_server_id, parser.feed(chunk))
+                logger.warning(f"CoT ingest connection to {name} closed by the server.")
+            except (ConnectionError, ssl.SSLError, OSError, ValueError) as e:
+                logger.warning(f"CoT ingest connection to {name} failed: {type(e).__name__} - {e}")
+            finally:
+                writer.close()
+            await asyncio.sleep(delay)
+
+    def add(self, tak_server_id, events):
+        """Keep the accepted events, latest per UID, for the next batch."""
+        self.received += len(events)
+        for event in events:
+            if accept(event):
+                self.pending[(tak_server_id, event.uid)] = event
+        if len(self.pending) >= COT_INGEST_MAX_PENDING and self._flush_now is not None:
+            self._flush_now.set()
+
+    async def flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write the pending batch, one transaction per server; a failed write is logged and dropped."""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        by_server = {}
+        for (tak_server_id, _), event in batch.items():
+            by_server.setdefault(tak_server_id, []).append(event)
+        now = django_timezone.now()
+        for tak_server_id, events in by_server.items():
+            try:
+                tracks, candidates = await sync_to_async(store)(tak_server_id, events, now)
+            except Exception as e:
+                logger.error(f"CoT ingest failed to store {len(events)} events from TAK server {tak_server_id}: {type(e).__name__} - {e}")
+                continue
+            self.stored += tracks
+            self.candidates += candidates
@@ -0,0 +1,125 @@
+"""
+KML feed of a field op's markers, for tools that poll KML instead of taking CoT (Google Earth,
+older TAK plugins).
+
+The placemarks are the CotMarkers CotMaker builds for the field op and its active aid requests,
+served from the same snapshot, styled by their settings.COT_ICONS icon. Pollers come back
+often, so the feed answers conditional GETs: kml_state() derives Last-Modified and the ETag
+from one aggregate query over the field op, its aid requests and their locations, and only a
+changed feed builds any markers. Aid type edits do not touch those timestamps; they show up
+with the next aid request or location change.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from aidrequests.models import FieldOp, AidRequest
+from .cot import cot_job_for
+from .cot_encoder import escape_attrib, escape_cdata
+from .cot_maker import CotMaker
+
+COT_KML_REFRESH_INTERVAL = getattr(settings, 'COT_KML_REFRESH_INTERVAL', 60)  # seconds between network link polls
+
+KML_CONTENT_TYPE = 'application/vnd.google-earth.kml+xml'
+KML_ICON_HREF = 'https://maps.google.com/mapfiles/kml/shapes/placemark_circle.png'
+
+# KML colors (aabbggrr) by CoT affiliation, the second field of the CoT type
+AFFILIATION_COLORS = {
+    'f': 'ffffff80',  # friend: cyan
+    'h': 'ff8080ff',  # hostile: red
+    'n': 'ff80ff80',  # neutral: green
+    'u': 'ff80ffff',  # unknown: yellow
+}
+DEFAULT_ICON = 'neutral_ground'
+
+
+def kml_state(field_op_slug):
+    """Last change and ETag of a field op's feed, from one query.
+
+    The aid request and location counts catch deletions, which leave the latest
+    updated_at alone.
+
+    Returns:
+        tuple: (last modified datetime, etag), or None for an unknown field op
+    """
+    row = (
+        FieldOp.objects.filter(slug=field_op_slug)
+        .annotate(
+            aid_requests_at=Max('aid_requests__updated_at'),
+            locations_at=Max('aid_requests__locations__updated_at'),
+            aid_request_count=Count('aid_requests', distinct=True),
+            location_count=Count('aid_requests__locations', distinct=True),
+        )
+        .values_list('pk', 'updated_at', 'aid_requests_at', 'locations_at', 'aid_request_count', 'location_count')
+        .first()
+    )
+    if row is None:
+        return None
+    last_modified = max(at for at in row[1:4] if at is not None)
+    etag = hashlib.md5(repr((row, settings.ENV_NAME)).encode('utf-8')).hexdigest()
+    return last_modified, etag
+
+
+def icon_styles():
+    """{CoT type: style id} for the COT_ICONS icons."""
+    return {cot_type: icon for icon, cot_type in settings.COT_ICONS.items()}
+
+
+def style_xml(icon, cot_type):
+    fields = cot_type.split('-')
+    color = AFFILIATION_COLORS.get(fields[1] if len(fields) > 1 else '', AFFILIATION_COLORS['u'])
+    return (
+        f'<Style id="{escape_attrib(icon)}"><IconStyle><color>{color}</color>'
+        f'<Icon><href>{KML_ICON_HREF}</href></Icon></IconStyle></Style>'
+    )
+
+
+def placemark_xml(marker, styles):
+    return (
+        f'<Placemark id="{escape_attrib(marker.uid)}">'
+        f'<name>{escape_cdata(marker.callsign)}</name>'
+        f'<description>{escape_cdata(marker.remarks or "")}</description>'
+        f'<styleUrl>#{escape_attrib(styles.get(marker.cot_type, DEFAULT_ICON))}</styleUrl>'
+        f'<Point><coordinates>{marker.lon},{marker.lat},0</coordinates></Point>'
+        '</Placemark>'
+    )
+
+
+async def field_op_kml(field_op):
+    """KML document of the field op marker and the field op's active aid requests.
+
+    Returns:
+        bytes: the document
+    """
+    aid_request_ids = [
+        pk async for pk in AidRequest.objects
+        .filter(field_op=field_op, status__in=AidRequest.ACTIVE_STATUSES)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    ]
+    styles = icon_styles()
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>',
+        f'<name>{escape_cdata(field_op.name)}</name>',
+    ]
+    parts.extend(style_xml(icon, cot_type) for cot_type, icon in styles.items())
+    if DEFAULT_ICON not in styles.values():
+        parts.append(style_xml(DEFAULT_ICON, 'a-n-G'))
+    async for markers in CotMaker(cot_job_for(field_op, 'aid', aid_request_ids)).stream_markers():
+        parts.extend(placemark_xml(marker, styles) for marker in markers)
+    parts.append('</Document></kml>')
+    return '\n'.join(parts).encode('utf-8')
+
+
+def network_link_kml(name, href):
+    """KML network link that has the client poll href every COT_KML_REFRESH_INTERVAL seconds."""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<kml xmlns="http://www.opengis.net/kml/2.2"><NetworkLink>'
+        f'<name>{escape_cdata(name)}</name>'
+        f'<Link><href>{escape_cdata(href)}</href>'
+        f'<refreshMode>onInterval</refreshMode><refreshInterval>{COT_KML_REFRESH_INTERVAL}</refreshInterval></Link>'
+        '</NetworkLink></kml>'
+    ).encode('utf-8')
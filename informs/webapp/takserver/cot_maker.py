@@ -1,50 +1,77 @@
 """
-COT Message Builder that handles message creation based on ConfigParser COTINFO.
+COT Message Builder: turns a CotJob into CotMarkers and encoded CoT events.
 """
-from configparser import ConfigParser
+from typing import NamedTuple
+
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.db.models import Prefetch
+from django.db.models.signals import post_save, post_delete
 from asgiref.sync import sync_to_async
 from aidrequests.models import FieldOp, AidRequest, AidLocation
-from .cot_helper import make_cot, aidrequest_location
+from .cot_helper import make_marker, aidrequest_location
+from .cot_encoder import encode_cot
+from .cot_snapshot import COT_SNAPSHOT, snapshot_markers, save_snapshot
 import logging
-from icecream import ic
-import xml.etree.ElementTree as ET
-from datetime import datetime
-import pytak
-import platform
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
-class CotMaker:
-    """Builds COT messages based on ConfigParser formatted COTINFO."""
+COT_STREAM_CHUNK_SIZE = getattr(settings, 'COT_STREAM_CHUNK_SIZE', 500)  # aid requests loaded and encoded per chunk
+
+
+class CotJob(NamedTuple):
+    """What one CoT send builds, handed straight from the caller to CotMaker."""
+    field_op_slug: str
+    mark_type: str = 'field'  # 'field' for the field op marker only, 'aid' for aid requests
+    aid_request_ids: tuple = ()
+    include_field_op_marker: bool = True
+
+
+# Local server identity (Sites name + ENV_NAME), cached per process
+_client_uid = None
+
+
+def _load_client_uid():
+    site_name = Site.objects.get_current().name
+    if settings.ENV_NAME and settings.ENV_NAME != 'prod':
+        return f"{site_name}.{settings.ENV_NAME}"
+    return site_name
+
 
-    def __init__(self, cotinfo_string):
-        """Initialize with COTINFO string in ConfigParser format."""
-        self.config = ConfigParser()
-        self.config.read_string(cotinfo_string)
+async def client_uid():
+    """The local server's CoT client UID; the Site is only read once per process."""
+    global _client_uid
+    if _client_uid is None:
+        _client_uid = await sync_to_async(_load_client_uid, thread_sensitive=True)()
+    return _client_uid
 
-        # Validate required sections and options
-        if not self.config.has_section('cot'):
-            raise ValueError("COTINFO missing required [cot] section")
 
-        required_options = ['mark_type', 'field_op_slug']
-        for option in required_options:
-            if not self.config.has_option('cot', option):
-                raise ValueError(f"COTINFO missing required option: {option}")
+def clear_client_uid(**kwargs):
+    global _client_uid
+    _client_uid = None
 
-        self.mark_type = self.config.get('cot', 'mark_type')
-        self.field_op_slug = self.config.get('cot', 'field_op_slug')
 
-        # Get include_field_op_marker flag, defaulting to True if not present
-        self.include_field_op_marker = self.config.getboolean('cot', 'include_field_op_marker', fallback=True)
+post_save.connect(clear_client_uid, sender=Site, dispatch_uid='cot_maker_clear_client_uid')
+post_delete.connect(clear_client_uid, sender=Site, dispatch_uid='cot_maker_clear_client_uid_delete')
 
-        # Get optional aid request IDs if present
-        self.aid_request_ids = []
-        if self.config.has_option('cot', 'aid_request_ids'):
-            aid_ids = self.config.get('cot', 'aid_request_ids')
-            if aid_ids:
-                self.aid_request_ids = [int(id.strip()) for id in aid_ids.split(',')]
+
+class CotMaker:
+    """Builds COT messages for a CotJob."""
+
+    def __init__(self, job):
+        if job.mark_type not in ('field', 'aid'):
+            raise ValueError(f"Invalid mark_type: {job.mark_type}. Must be 'field' or 'aid'")
+        self.mark_type = job.mark_type
+        self.field_op_slug = job.field_op_slug
+        self.include_field_op_marker = job.include_field_op_marker
+        self.aid_request_ids = [int(pk) for pk in job.aid_request_ids]
+
+        # Event time shared by every message of a batch, set by stream_markers
+        self.now = None
+        # UID and callsign suffixes, read from settings once per batch by stream_markers
+        self.env_suffix = ''
+        self.takv_suffix = ''
 
     async def build_messages(self):
         """Build all COT messages based on configuration.
@@ -52,57 +79,45 @@ class CotMaker:
         Returns:
             list: List of COT message XML strings
         """
-        messages = []
+        return [message async for chunk in self.stream_messages() for message in chunk]
+
+    async def build_markers(self):
+        """Build the CotMarker for every map marker in the configuration.
+
+        Returns:
+            list: List of CotMarker, field op marker first
+        """
+        return [marker async for chunk in self.stream_markers() for marker in chunk]
+
+    async def stream_messages(self, encode=encode_cot, chunk_size=None):
+        """Encoded events, chunk by chunk (see stream_markers)."""
+        async for markers in self.stream_markers(chunk_size):
+            yield [encode(marker, now=self.now) for marker in markers]
+
+    async def stream_markers(self, chunk_size=None):
+        """Build the CotMarkers in chunks, loading at most chunk_size aid requests at a time.
+
+        The field op marker comes first, in the first chunk. Memory stays bounded by the
+        chunk size however many aid requests the field op has. chunk_size defaults to
+        COT_STREAM_CHUNK_SIZE.
+
+        Yields:
+            list: CotMarkers, possibly empty when a chunk's aid requests have no location
+        """
+        chunk_size = chunk_size or COT_STREAM_CHUNK_SIZE
+        # One event time for the whole batch
+        self.now = datetime.now(timezone.utc)
 
         try:
             # Get the field op using aget
-            field_op = await FieldOp.objects.select_related('tak_server').aget(slug=self.field_op_slug)
-
-            if not field_op.tak_server:
-                logger.warning(f"FieldOp {self.field_op_slug} does not have an associated TAK server for connection details. No CoT messages will be built.")
-                return []
-
-            # Construct the full client UID using the local server name from Django Sites and ENV_NAME
-            # Site.objects.get_current() typically does not have an official aget_current(), so sync_to_async is safer here.
-            get_current_site_sync = sync_to_async(Site.objects.get_current, thread_sensitive=True)
-            current_site = await get_current_site_sync()
-            local_server_name_part = current_site.name
-            env_suffix = settings.ENV_NAME
-
-            if env_suffix and env_suffix != 'prod':
-                full_client_uid_for_cot_maker = f"{local_server_name_part}.{env_suffix}"
-            else:
-                full_client_uid_for_cot_maker = local_server_name_part
-
-            # Generate and add takPong message first
-            # timestamp_str = datetime.utcnow().strftime("%Y%m%d%H%M%S%f") # Removed
-            # takpong_uid = f"{full_client_uid_for_cot_maker}.{timestamp_str}" # Removed
-
-            # pong_root = ET.Element("event") # Removed
-            # pong_root.set("version", "2.0") # Removed
-            # pong_root.set("type", "t-x-d-d")  # takPong type # Removed
-            # pong_root.set("uid", full_client_uid_for_cot_maker) # Removed
-            # pong_root.set("how", "m-g") # Machine-generated # Removed
-            # current_cot_time = pytak.cot_time() # Removed
-            # pong_root.set("time", current_cot_time) # Removed
-            # pong_root.set("start", current_cot_time) # Removed
-            # pong_root.set("stale", pytak.cot_time(3600)) # 1 hour stale, as per PyTAK example # Removed
-
-            # # Add detail with contact and takv for initial pong EUD registration # Removed
-            # detail_element = ET.SubElement(pong_root, "detail") # Removed
-
-            # # contact_element = ET.SubElement(detail_element, "contact") # Removed
-            # # contact_element.set("callsign", full_client_uid_for_cot_maker) # Stable server callsign, no timestamp # Removed
-
-            # # takv_element = ET.SubElement(detail_element, "takv") # Removed
-            # # takv_element.set("os", platform.system()) # Removed
-            # # takv_element.set("platform", "informs") # Removed
-            # # takv_element.set("version", getattr(settings, 'VERSION', 'unknown')) # Removed
-            # # takv_element.set("device", "informs") # Removed
-
-            # # takpong_message = ET.tostring(pong_root) # Removed
-            # # messages.append(takpong_message) # Removed
-            # # ic(f"Built initial takPong message with event UID and contact callsign: {full_client_uid_for_cot_maker}") # Removed
+            field_op = await FieldOp.objects.aget(slug=self.field_op_slug)
+
+            # The full client UID: local server name from Django Sites and ENV_NAME, cached per process
+            full_client_uid_for_cot_maker = await client_uid()
+            env_name = settings.ENV_NAME
+            self.env_suffix = f".{env_name}" if env_name and env_name != 'prod' else ''
+            takv_signature = getattr(settings, 'TAKV_DEVICE_SIGNATURE', None)
+            self.takv_suffix = f".{takv_signature}" if takv_signature else ''
 
             # Determine the CoT type for the FieldOp's marker.
             # This should come from the field_op.cot_icon, resolved to a CoT type string.
@@ -112,84 +127,108 @@ class CotMaker:
             # Default to a generic non-presence type.
             field_op_cot_type = settings.COT_ICONS.get(field_op_icon, 'a-n-G') # Default to Neutral Generic Point
 
+            # Built even when it is not sent: aid request markers link to its UID and callsign
+            field_op_marker = await self.build_field_op_marker(field_op, full_client_uid_for_cot_maker, field_op_icon)
+            markers = []
             if self.include_field_op_marker:
-                field_op_msg = await self.build_field_op_message(field_op, full_client_uid_for_cot_maker, field_op_icon)
-                if field_op_msg:
-                    messages.append(field_op_msg)
-                    # ic(f"Built field op marker for {self.field_op_slug} with client UID {full_client_uid_for_cot_maker}")
+                markers.append(field_op_marker)
 
             # Build aid request messages if needed
-            if self.mark_type == 'aid' and self.aid_request_ids:
-                for aid_id in self.aid_request_ids:
-                    try:
-                        # Get AidRequest using aget
-                        aid_request = await AidRequest.objects.select_related('aid_type').aget(pk=aid_id, field_op=field_op)
-
-                        # Get related AidLocations asynchronously
-                        locations = []
-                        async for loc in AidLocation.objects.filter(aid_request_id=aid_request.id):
-                            locations.append(loc)
-
-                        status, location_obj = aidrequest_location(locations) # Assuming aidrequest_location is sync
-
-                        if not location_obj:
-                            logger.warning(f"No valid location found for aid request {aid_id}. Skipping marker.")
-                            continue
-
-                        # Pass the actual CoT type of the field_op marker for linking
-                        aid_msg = await self.build_aid_request_message(aid_request, field_op, full_client_uid_for_cot_maker, field_op_cot_type, location_obj)
-                        if aid_msg:
-                            messages.append(aid_msg)
-                            # ic(f"Built aid request marker for ID {aid_id}, linked to client {full_client_uid_for_cot_maker}")
-                    except AidRequest.DoesNotExist:
-                        logger.warning(f"Aid request {aid_id} not found for field_op {self.field_op_slug}. Skipping.")
-                        continue
-                    except Exception as e:
-                        logger.error(f"Error building message for aid request {aid_id}: {e}")
-                        # Continue with other messages even if one fails
-
-            return messages
+            aid_request_ids = self.aid_request_ids if self.mark_type == 'aid' else []
+            for offset in range(0, len(aid_request_ids), chunk_size):
+                chunk_ids = aid_request_ids[offset:offset + chunk_size]
+                aid_markers = await self.aid_request_markers(field_op, chunk_ids, full_client_uid_for_cot_maker, field_op_cot_type, field_op_marker)
+                markers.extend(aid_markers[aid_id] for aid_id in chunk_ids if aid_markers.get(aid_id))
+                yield markers
+                markers = []
+
+            if markers:
+                yield markers
 
         except FieldOp.DoesNotExist:
             logger.error(f"FieldOp {self.field_op_slug} not found. Cannot build CoT messages.")
-            # ic(f"Debug context for FieldOp {self.field_op_slug} not found.")
             raise
         except Exception as e:
             logger.error(f"Error building CoT messages for {self.field_op_slug}: {e}")
-            # ic(f"Debug context for error building messages for {self.field_op_slug}: {e}")
             raise
 
-    async def build_field_op_message(self, field_op, full_client_uid, field_op_icon):
-        """Build COT message for field operation marker."""
+    async def aid_request_markers(self, field_op, aid_request_ids, full_client_uid, field_op_cot_type, field_op_marker):
+        """The markers of one chunk of aid requests: from the snapshot (cot_snapshot) where it
+        is still good, built from the database (and kept in the snapshot) for the rest.
 
-        # Event UID for the map marker
-        base_event_uid_identifier = field_op.slug.upper()
-        if settings.ENV_NAME and settings.ENV_NAME != 'prod':
-            base_event_uid_identifier = f"{field_op.slug.upper()}.{settings.ENV_NAME}"
+        Returns:
+            dict: {aid request id: CotMarker, or None when it has no location}; unknown ids are left out
+        """
+        variant = f"{self.env_suffix}{self.takv_suffix}"
+        markers = await snapshot_markers(field_op, aid_request_ids, variant, self.now) if COT_SNAPSHOT else {}
+        missing = [aid_id for aid_id in aid_request_ids if aid_id not in markers]
+        if not missing:
+            return markers
+
+        built = {}
+        aid_requests = await self.load_aid_requests(field_op, missing)
+        for aid_id in missing:
+            aid_request = aid_requests.get(aid_id)
+            if aid_request is None:
+                logger.warning(f"Aid request {aid_id} not found for field_op {self.field_op_slug}. Skipping.")
+                continue
+            try:
+                # Locations were prefetched, so this resolves in memory
+                status, location_obj = aidrequest_location(aid_request.locations.all())
+
+                if not location_obj:
+                    logger.warning(f"No valid location found for aid request {aid_id}. Skipping marker.")
+                    built[aid_id] = None
+                    continue
+
+                # Pass the actual CoT type of the field_op marker for linking
+                built[aid_id] = await self.build_aid_request_marker(aid_request, field_op, full_client_uid, field_op_cot_type, location_obj, field_op_marker)
+            except Exception as e:
+                logger.error(f"Error building message for aid request {aid_id}: {e}")
+                # Continue with other messages even if one fails
+        if COT_SNAPSHOT:
+            await save_snapshot(field_op, built, variant, self.now)
+        markers.update(built)
+        return markers
+
+    async def load_aid_requests(self, field_op, aid_request_ids):
+        """Load aid requests with their aid types and candidate locations.
+
+        Uses a constant number of queries regardless of how many IDs were requested.
 
-        takv_signature = getattr(settings, 'TAKV_DEVICE_SIGNATURE', None)
-        if takv_signature:
-            field_op_event_uid = f"{base_event_uid_identifier}.{takv_signature}"
-        else:
-            field_op_event_uid = base_event_uid_identifier
+        Returns:
+            dict: AidRequest objects keyed by pk
+        """
+        locations = Prefetch(
+            'locations',
+            queryset=AidLocation.objects.filter(status__in=['confirmed', 'new']).order_by('pk')
+        )
+        queryset = (
+            AidRequest.objects
+            .filter(pk__in=aid_request_ids, field_op=field_op)
+            .select_related('aid_type')
+            .prefetch_related(locations)
+        )
+        return {aid_request.pk: aid_request async for aid_request in queryset}
 
+    async def build_field_op_marker(self, field_op, full_client_uid, field_op_icon):
+        """Build the CotMarker for the field operation marker."""
         # Contact callsign and EUD identity for this FieldOp marker
-        contact_callsign_for_marker = field_op.slug.upper()
-        if settings.ENV_NAME and settings.ENV_NAME != 'prod':
-            contact_callsign_for_marker = f"{field_op.slug.upper()}.{settings.ENV_NAME}"
+        contact_callsign_for_marker = f"{field_op.slug.upper()}{self.env_suffix}"
 
-        return make_cot(
+        return make_marker(
             cot_icon=field_op_icon,
             name=contact_callsign_for_marker,         # Contact callsign for this marker
-            uuid=field_op_event_uid,                  # Unique event UID for the map marker
+            uuid=f"{contact_callsign_for_marker}{self.takv_suffix}",  # Unique event UID for the map marker
             lat=field_op.latitude,
             lon=field_op.longitude,
             remarks=f'Field Op: {field_op.name}\nSource Callsign: {contact_callsign_for_marker}',
-            client_static_uid=contact_callsign_for_marker # EUD identity of the sender is marker's own callsign
+            client_static_uid=contact_callsign_for_marker, # EUD identity of the sender is marker's own callsign
+            field_op_id=field_op.pk,
         )
 
-    async def build_aid_request_message(self, aid_request, field_op, full_client_uid, field_op_cot_type, location_obj):
-        """Build COT message for an aid request, linked to the field_op marker."""
+    async def build_aid_request_marker(self, aid_request, field_op, full_client_uid, field_op_cot_type, location_obj, field_op_marker):
+        """Build the CotMarker for an aid request, linked to the field_op marker."""
         try:
             remarks = [
                 f"Aid Request #{aid_request.pk}",
@@ -202,49 +241,23 @@ class CotMaker:
             if location_obj.note: remarks.append(f"Location Note: {location_obj.note}")
             if aid_request.aid_description: remarks.append(f"\nDescription:\n{aid_request.aid_description}")
 
-            # Base for this Aid Request marker's own callsign. This can change if aid_type changes.
-            aid_request_callsign_identifier = f"{aid_request.aid_type.slug}.{aid_request.pk}"
-            contact_callsign_for_marker = aid_request_callsign_identifier
-            if settings.ENV_NAME and settings.ENV_NAME != 'prod':
-                contact_callsign_for_marker = f"{aid_request_callsign_identifier}.{settings.ENV_NAME}"
-
-            # Base for this Aid Request marker's event UID. This must be stable.
-            aid_request_uid_identifier = f"{field_op.slug}.{aid_request.pk}"
-            event_uid_base_for_marker = aid_request_uid_identifier
-            if settings.ENV_NAME and settings.ENV_NAME != 'prod':
-                event_uid_base_for_marker = f"{aid_request_uid_identifier}.{settings.ENV_NAME}"
-
-            # Unique event UID for this aid request map marker (includes TAKV signature)
-            event_uid_for_marker = event_uid_base_for_marker
-            takv_signature = getattr(settings, 'TAKV_DEVICE_SIGNATURE', None)
-            if takv_signature:
-                event_uid_for_marker = f"{event_uid_base_for_marker}.{takv_signature}"
-
-            # Event UID of the parent FieldOp map marker (for linking the map items)
-            parent_marker_base_event_uid = field_op.slug.upper()
-            if settings.ENV_NAME and settings.ENV_NAME != 'prod':
-                parent_marker_base_event_uid = f"{field_op.slug.upper()}.{settings.ENV_NAME}"
-
-            parent_marker_event_uid = parent_marker_base_event_uid # Base for parent UID
-            if takv_signature: # Use the same takv_signature for consistency if present
-                parent_marker_event_uid = f"{parent_marker_base_event_uid}.{takv_signature}"
-
-            # Callsign of the parent FieldOp marker (for link_parent_callsign)
-            parent_fo_contact_callsign = field_op.slug.upper()
-            if settings.ENV_NAME and settings.ENV_NAME != 'prod':
-                parent_fo_contact_callsign = f"{field_op.slug.upper()}.{settings.ENV_NAME}"
+            # This Aid Request marker's own callsign. This can change if aid_type changes.
+            contact_callsign_for_marker = f"{aid_request.aid_type.slug}.{aid_request.pk}{self.env_suffix}"
 
-            return make_cot(
+            return make_marker(
                 cot_icon=aid_request.aid_type.cot_icon or 'marker',
                 name=contact_callsign_for_marker,     # This AidRequest marker's own callsign
-                uuid=event_uid_for_marker,            # This AidRequest marker's unique event UID (with TAKV)
+                # This AidRequest marker's event UID (with TAKV). This must be stable.
+                uuid=f"{field_op.slug}.{aid_request.pk}{self.env_suffix}{self.takv_suffix}",
                 lat=location_obj.latitude,
                 lon=location_obj.longitude,
                 remarks="\n".join(remarks),
                 client_static_uid=contact_callsign_for_marker, # Sender EUD is this marker's own callsign
-                link_to_client_uid=parent_marker_event_uid,         # Links to parent FieldOp *map marker event UID*
+                link_to_client_uid=field_op_marker.uid,          # Links to parent FieldOp *map marker event UID*
                 link_type=field_op_cot_type,
-                link_parent_callsign=parent_fo_contact_callsign # Links to parent FieldOp *contact callsign*
+                link_parent_callsign=field_op_marker.callsign,   # Links to parent FieldOp *contact callsign*
+                field_op_id=field_op.pk,
+                aid_request_id=aid_request.pk,
             )
 
         except AidRequest.DoesNotExist:
@@ -252,5 +265,4 @@ class CotMaker:
             return None
         except Exception as e:
             logger.error(f"Error building detailed aid request message for {aid_request.pk}: {e}")
-            # ic(f"Debug context for error building detailed aid request message {aid_request.pk}: {e}")
             raise
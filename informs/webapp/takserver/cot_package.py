@@ -0,0 +1,150 @@
+"""
+TAK data package of a field op's markers, for side-loading the whole picture in one download.
+
+Sending thousands of markers one event at a time is slow on a poor link. A data package is
+a zip of one .cot file per marker plus MANIFEST/manifest.xml; ATAK and WinTAK import it
+like any other data package, and the regular (delta) CoT sends keep it current afterwards.
+
+The zip is written marker chunk by marker chunk as CotMaker streams them, so memory stays
+bounded by COT_STREAM_CHUNK_SIZE. The file is kept in COT_PACKAGE_DIR and described by a
+CotPackage row; the same signals that drop CotSnapshot rows bump the row's version, and a
+package built from an older version (or older than COT_PACKAGE_MAX_AGE, its events go
+stale on the devices) is built again. The row's etag lets a client skip an unchanged download.
+"""
+import logging
+import os
+import uuid
+import zipfile
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from aidrequests.models import AidRequest
+from .cot import cot_job_for
+from .cot_encoder import encode_cot, escape_attrib
+from .cot_maker import CotMaker, client_uid
+from .models import CotPackage
+
+logger = logging.getLogger(__name__)
+
+COT_PACKAGE_DIR = getattr(settings, 'COT_PACKAGE_DIR', os.path.join(settings.BASE_DIR, 'cot_packages'))  # built package files
+COT_PACKAGE_MAX_AGE = getattr(settings, 'COT_PACKAGE_MAX_AGE', 1800)  # seconds before a package is rebuilt anyway
+
+MANIFEST_ENTRY = 'MANIFEST/manifest.xml'
+
+
+def package_uid(site_uid, field_op_slug):
+    """Stable package UID, so importing a newer package replaces the older one on the device."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"cot-package:{site_uid}:{field_op_slug}"))
+
+
+def cot_entry(uid):
+    """Zip entry of one marker's event."""
+    uid = uid.replace('/', '_').replace('\\', '_')
+    return f"{uid}/{uid}.cot"
+
+
+def manifest_xml(uid, name, contents):
+    """MissionPackageManifest (version 2) listing the package's events.
+
+    Args:
+        contents (list): (zip entry, event uid) pairs
+    """
+    lines = [
+        '<MissionPackageManifest version="2">',
+        '<Configuration>',
+        f'<Parameter name="uid" value="{escape_attrib(uid)}"/>',
+        f'<Parameter name="name" value="{escape_attrib(name)}"/>',
+        '</Configuration>',
+        '<Contents>',
+    ]
+    lines.extend(
+        f'<Content ignore="false" zipEntry="{escape_attrib(entry)}">'
+        f'<Parameter name="uid" value="{escape_attrib(event_uid)}"/></Content>'
+        for entry, event_uid in contents
+    )
+    lines.extend(['</Contents>', '</MissionPackageManifest>'])
+    return '\n'.join(lines).encode('utf-8')
+
+
+async def write_package(field_op, aid_request_ids, path):
+    """Write the data package of the field op marker and these aid requests to path.
+
+    Returns:
+        int: number of events in the package
+    """
+    maker = CotMaker(cot_job_for(field_op, 'aid', list(aid_request_ids)))
+    contents = []
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as package:
+        async for markers in maker.stream_markers():
+            for marker in markers:
+                entry = cot_entry(marker.uid)
+                package.writestr(entry, encode_cot(marker, now=maker.now))
+                contents.append((entry, marker.uid))
+        uid = package_uid(await client_uid(), field_op.slug)
+        package.writestr(MANIFEST_ENTRY, manifest_xml(uid, f"{field_op.slug}.zip", contents))
+    return len(contents)
+
+
+def current_package(field_op, now=None):
+    """The field op's cached package when it is still good to serve, else None."""
+    now = now or timezone.now()
+    package = CotPackage.objects.filter(
+        field_op=field_op,
+        built_version=F('version'),
+        built_at__gt=now - timedelta(seconds=COT_PACKAGE_MAX_AGE),
+    ).first()
+    if package is None or not os.path.exists(package.path):
+        return None
+    return package
+
+
+def build_package(field_op):
+    """Build the field op's data package from its active aid requests and cache it.
+
+    A change made while the package was being built leaves the cache alone: the new package is returned with cached=False, and the
+    caller removes its file once served.
+
+    Returns:
+        tuple: (CotPackage, cached)
+    """
+    row, _ = CotPackage.objects.get_or_create(field_op=field_op)
+    version, old_path = row.version, row.path
+    aid_request_ids = list(
+        AidRequest.objects
+        .filter(field_op=field_op, status__in=AidRequest.ACTIVE_STATUSES)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+    os.makedirs(COT_PACKAGE_DIR, exist_ok=True)
+    etag = uuid.uuid4().hex
+    path = os.path.join(COT_PACKAGE_DIR, f"{field_op.slug}-{etag}.zip")
+    built_at = timezone.now()
+    try:
+        markers = async_to_sync(write_package)(field_op, aid_request_ids, path)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    package = CotPackage(field_op=field_op, version=version, built_version=version, etag=etag, path=path,
+                         markers=markers, size=os.path.getsize(path), built_at=built_at)
+
+    cached = CotPackage.objects.filter(field_op=field_op, version=version, path=old_path).update(
+        built_version=version, etag=etag, path=path, markers=markers, size=package.size, built_at=built_at,
+    )
+    if cached:
+        if old_path and old_path != path and os.path.exists(old_path):
+            os.remove(old_path)
+        logger.info(f"[{field_op.slug}] Built CoT data package with {markers} events ({package.size} bytes).")
+    else:
+        logger.info(f"[{field_op.slug}] Field op changed while its CoT data package was built, not caching it.")
+    return package, bool(cached)
+
+
+def stale_packages(**filters):
+    """Mark the packages of the field ops matching the filters out of date; the next download rebuilds them."""
+    CotPackage.objects.filter(**filters).update(version=F('version') + 1)
@@ -0,0 +1,261 @@
+"""
+TAK Protocol Version 1 (protobuf) encoding for CoT markers.
+
+Streaming connections frame every TakMessage as 0xbf, a varint length and the protobuf
+bytes. A connection starts out in XML and switches after negotiation: the server offers
+its versions (t-x-takp-v), the client asks for version 1 (t-x-takp-q) and the server
+confirms (t-x-takp-r). Mesh (UDP SA) datagrams carry one TakMessage behind the fixed
+header 0xbf, version, 0xbf instead.
+
+Only the handful of TakMessage fields make_cot uses are encoded (and decoded, for
+cot_ingest), by hand, so no protobuf runtime is needed. Detail elements that have no
+protobuf message of their own (archive, status readiness, color, link, remarks) travel
+as xmlDetail, as the protocol specifies.
+
+    TakMessage { TakControl takControl = 1; CotEvent cotEvent = 2; }
+    CotEvent { string type = 1; string uid = 5; uint64 sendTime = 6; uint64 startTime = 7;
+               uint64 staleTime = 8; string how = 9; double lat = 10; double lon = 11;
+               double hae = 12; double ce = 13; double le = 14; Detail detail = 15; }
+    Detail { string xmlDetail = 1; Contact contact = 2; PrecisionLocation precisionLocation = 4; }
+    Contact { string endpoint = 1; string callsign = 2; }
+    PrecisionLocation { string geopointsrc = 1; string altsrc = 2; }
+"""
+import re
+import struct
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from .cot_encoder import escape_attrib, escape_cdata, w3c_time
+
+TAK_PROTO_MAGIC = 0xbf
+TAK_PROTO_VERSION = 1
+
+_HOW = b'h-e'
+_CE_LE = 9999999.0
+
+_WIRE_VARINT = 0
+_WIRE_FIXED64 = 1
+_WIRE_LENGTH = 2
+
+
+def varint(value):
+    """Protobuf base-128 varint."""
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def read_varint(data, pos=0):
+    """Decode a varint at pos; returns (value, next pos) or (None, pos) if data is incomplete."""
+    result = shift = 0
+    while pos < len(data):
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+    return None, pos
+
+
+def _key(field_number, wire_type):
+    return varint(field_number << 3 | wire_type)
+
+
+def _bytes_field(field_number, value):
+    if not value:
+        return b''
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return _key(field_number, _WIRE_LENGTH) + varint(len(value)) + value
+
+
+def _uint_field(field_number, value):
+    return _key(field_number, _WIRE_VARINT) + varint(value) if value else b''
+
+
+def _double_field(field_number, value):
+    return _key(field_number, _WIRE_FIXED64) + struct.pack('<d', value) if value else b''
+
+
+# Identical in every marker, so encoded once
+_PRECISION_LOCATION = _bytes_field(4, _bytes_field(1, '???') + _bytes_field(2, '???'))
+
+
+def frame(payload):
+    """Frame one TakMessage for a streaming connection."""
+    return bytes((TAK_PROTO_MAGIC,)) + varint(len(payload)) + payload
+
+
+def mesh_packet(framed):
+    """Turn one streaming frame into a mesh (UDP SA) datagram."""
+    length, start = read_varint(framed, 1)
+    return bytes((TAK_PROTO_MAGIC, TAK_PROTO_VERSION, TAK_PROTO_MAGIC)) + framed[start:start + length]
+
+
+def xml_detail(marker):
+    """The detail elements carried as xmlDetail, escaped like the XML encoder."""
+    parts = ['<archive /><status readiness="true" /><color argb="-1" />']
+    if marker.link_uid and marker.link_type:
+        parts.append(f'<link uid="{escape_attrib(marker.link_uid)}" relation="p-p" type="{escape_attrib(marker.link_type)}"')
+        if marker.link_parent_callsign:
+            parts.append(f' parent_callsign="{escape_attrib(marker.link_parent_callsign)}"')
+        parts.append(' />')
+    if marker.remarks:
+        parts.append(f'<remarks>{escape_cdata(marker.remarks)}</remarks>')
+    else:
+        parts.append('<remarks />')
+    return ''.join(parts)
+
+
+def epoch_millis(dt):
+    return int(dt.timestamp() * 1000)
+
+
+def encode_cot_protobuf(marker, now=None):
+    """Encode a CotMarker as a framed TAK Protocol v1 message.
+
+    Args:
+        marker (CotMarker): marker to encode
+        now (datetime): event time (UTC), defaults to the current time
+
+    Returns:
+        bytes: the framed TakMessage
+    """
+    now = now or datetime.now(timezone.utc)
+    sent = epoch_millis(now)
+    detail = (
+        _bytes_field(1, xml_detail(marker))
+        + _bytes_field(2, _bytes_field(2, marker.callsign))
+        + _PRECISION_LOCATION
+    )
+    event = b''.join((
+        _bytes_field(1, marker.cot_type),
+        _bytes_field(5, marker.uid),
+        _uint_field(6, sent),
+        _uint_field(7, sent),
+        _uint_field(8, sent + int(marker.stale_seconds) * 1000),
+        _bytes_field(9, _HOW),
+        _double_field(10, float(marker.lat)),
+        _double_field(11, float(marker.lon)),
+        _double_field(13, _CE_LE),
+        _double_field(14, _CE_LE),
+        _bytes_field(15, detail),
+    ))
+    return frame(_bytes_field(2, event))
+
+
+def decode_fields(data):
+    """Decode one protobuf message into {field number: [values]} (bytes, int or float values)."""
+    fields = {}
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == _WIRE_VARINT:
+            value, pos = read_varint(data, pos)
+        elif wire_type == _WIRE_FIXED64:
+            value = struct.unpack_from('<d', data, pos)[0]
+            pos += 8
+        elif wire_type == _WIRE_LENGTH:
+            length, pos = read_varint(data, pos)
+            value = bytes(data[pos:pos + length])
+            pos += length
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        fields.setdefault(field_number, []).append(value)
+    return fields
+
+
+def _first(fields, number, default=None):
+    values = fields.get(number)
+    return values[0] if values else default
+
+
+def decode_cot_protobuf(payload):
+    """Decode the CotEvent of one TakMessage payload (see split_frames).
+
+    Returns:
+        dict: type, uid, time and stale (epoch milliseconds), lat, lon, callsign and
+              xml_detail; None for a message without an event (TakControl only)
+    """
+    event = _first(decode_fields(payload), 2)
+    if event is None:
+        return None
+    fields = decode_fields(event)
+    detail = decode_fields(_first(fields, 15, b''))
+    contact = decode_fields(_first(detail, 2, b''))
+    return {
+        'type': _first(fields, 1, b'').decode('utf-8', 'replace'),
+        'uid': _first(fields, 5, b'').decode('utf-8', 'replace'),
+        'time': _first(fields, 6, 0),
+        'stale': _first(fields, 8, 0),
+        'lat': _first(fields, 10, 0.0),
+        'lon': _first(fields, 11, 0.0),
+        'callsign': _first(contact, 2, b'').decode('utf-8', 'replace'),
+        'xml_detail': _first(detail, 1, b'').decode('utf-8', 'replace'),
+    }
+
+
+def split_frames(buffer):
+    """Split complete frames off a stream buffer.
+
+    Returns:
+        tuple: (list of TakMessage payloads, unconsumed remainder)
+    """
+    payloads = []
+    pos = 0
+    while pos < len(buffer):
+        if buffer[pos] != TAK_PROTO_MAGIC:
+            raise ValueError(f"Bad TAK protocol magic byte {buffer[pos]:#x}")
+        length, start = read_varint(buffer, pos + 1)
+        if length is None or start + length > len(buffer):
+            break
+        payloads.append(bytes(buffer[start:start + length]))
+        pos = start + length
+    return payloads, buffer[pos:]
+
+
+def _control_event(cot_type, control, uid=None):
+    now = datetime.now(timezone.utc)
+    time = w3c_time(now)
+    return (
+        f'<event version="2.0" uid="{uid or uuid.uuid4()}" type="{cot_type}" how="m-g" '
+        f'time="{time}" start="{time}" stale="{w3c_time(now + timedelta(minutes=1))}">'
+        f'<point lat="0.0" lon="0.0" hae="0.0" ce="999999" le="999999" />'
+        f'<detail><TakControl>{control}</TakControl></detail></event>'
+    ).encode('ascii')
+
+
+def takp_offer(version=TAK_PROTO_VERSION):
+    """Server's protocol support event (t-x-takp-v)."""
+    return _control_event('t-x-takp-v', f'<TakProtocolSupport version="{version}" />', uid='protouid')
+
+
+def takp_request(version=TAK_PROTO_VERSION):
+    """Client's request to switch protocol (t-x-takp-q)."""
+    return _control_event('t-x-takp-q', f'<TakRequest version="{version}" />')
+
+
+def takp_response(status=True):
+    """Server's answer to a protocol request (t-x-takp-r)."""
+    return _control_event('t-x-takp-r', f'<TakResponse status="{str(bool(status)).lower()}" />')
+
+
+_OFFER_RE = re.compile(rb'<TakProtocolSupport\s+version="(\d+)"')
+_RESPONSE_RE = re.compile(rb'<TakResponse\s+status="(true|false)"')
+
+
+def offered_versions(event):
+    return {int(version) for version in _OFFER_RE.findall(event)}
+
+
+def response_status(event):
+    match = _RESPONSE_RE.search(event)
+    return bool(match) and match.group(1) == b'true'
@@ -0,0 +1,121 @@
+"""
+Stale-time-aware CoT refresh.
+
+Every marker sent to a TAK server gets a refresh_due time in CotMarkerState: a fraction
+(COT_REFRESH_FRACTION, less up to COT_REFRESH_JITTER) of its stale time after it was sent.
+The refresh task wakes up every few minutes and resends only the markers that are due,
+plus any marker the TAK server never got, so TAK traffic stays at a low, even rate
+instead of one sweep of every marker at the top of each hour.
+
+Each TAK server a field op sends to (see cot.cot_targets_for) keeps its own refresh times,
+so the refresh is planned per field op and TAK server.
+"""
+import logging
+
+from django.db.models import Q
+
+from aidrequests.models import FieldOp, AidRequest, CotDestination
+from .cot import COT_DESTINATIONS, cot_targets_for
+from .cot_sweep import sweep_job, sweep_report
+from .models import CotMarkerState
+
+logger = logging.getLogger(__name__)
+
+
+def destination_pairs():
+    """(field op id, TAK server id) for every TAK server a CoT-enabled field op sends to,
+    as cot_targets_for() resolves them."""
+    pairs = set(FieldOp.objects.filter(tak_server__isnull=False, disable_cot=False).values_list('pk', 'tak_server_id'))
+    for field_op_id, tak_server_id, enabled in CotDestination.objects.filter(
+        field_op__disable_cot=False,
+    ).values_list('field_op_id', 'tak_server_id', 'enabled'):
+        if enabled:
+            pairs.add((field_op_id, tak_server_id))
+        else:
+            pairs.discard((field_op_id, tak_server_id))
+    return pairs
+
+
+def due_markers(now):
+    """Find the markers to send now, grouped by field op and TAK server.
+
+    Due: the marker's refresh_due has passed, on a TAK server its field op still sends to.
+    Unsent: a field op marker, or an active aid request with a location, that one of the
+    field op's TAK servers has no state for. Due markers of aid requests that are no longer
+    active are not refreshed again; they go stale on the TAK server.
+
+    Returns:
+        dict: {(field op id, TAK server id): (field op marker due, set of aid request ids)}
+    """
+    pairs = destination_pairs()
+    due = {}
+
+    def add(pair, aid_request_id):
+        field_op_due, aid_request_ids = due.setdefault(pair, (False, set()))
+        if aid_request_id is None:
+            due[pair] = (True, aid_request_ids)
+        else:
+            aid_request_ids.add(aid_request_id)
+
+    retired = []
+    for pk, field_op_id, tak_server_id, aid_request_id, status in CotMarkerState.objects.filter(
+        refresh_due__lte=now,
+        field_op__disable_cot=False,
+    ).values_list('pk', 'field_op_id', 'tak_server_id', 'aid_request_id', 'aid_request__status'):
+        if (field_op_id, tak_server_id) not in pairs:
+            continue
+        if aid_request_id is not None and status not in AidRequest.ACTIVE_STATUSES:
+            retired.append(pk)
+        else:
+            add((field_op_id, tak_server_id), aid_request_id)
+    if retired:
+        CotMarkerState.objects.filter(pk__in=retired).update(refresh_due=None)
+
+    servers = {}
+    for field_op_id, tak_server_id in pairs:
+        servers.setdefault(field_op_id, []).append(tak_server_id)
+
+    active = (
+        AidRequest.objects
+        .filter(status__in=AidRequest.ACTIVE_STATUSES, field_op_id__in=servers,
+                locations__status__in=['confirmed', 'new'])
+        .values_list('field_op_id', 'pk')
+        .distinct()
+    )
+    sent = set(
+        CotMarkerState.objects
+        .filter(Q(aid_request__isnull=True) | Q(aid_request__status__in=AidRequest.ACTIVE_STATUSES),
+                field_op_id__in=servers)
+        .values_list('tak_server_id', 'field_op_id', 'aid_request_id')
+    )
+    for field_op_id, aid_request_id in active:
+        for tak_server_id in servers[field_op_id]:
+            if (tak_server_id, field_op_id, aid_request_id) not in sent:
+                add((field_op_id, tak_server_id), aid_request_id)
+    for field_op_id, tak_server_id in pairs:
+        if (tak_server_id, field_op_id, None) not in sent:
+            add((field_op_id, tak_server_id), None)
+    return due
+
+
+def refresh_jobs(now):
+    """Sweep jobs (see cot_sweep) sending only what due_markers() found, one per field op and TAK server.
+
+    Returns:
+        tuple: (jobs, reports for field ops whose job could not be prepared)
+    """
+    due = due_markers(now)
+    jobs, reports = [], []
+    field_ops = FieldOp.objects.filter(pk__in={field_op_id for field_op_id, _ in due})
+    for field_op in field_ops.select_related('tak_server').prefetch_related(COT_DESTINATIONS):
+        targets = {}
+        try:
+            targets = {target.tak_server_id: target for target in cot_targets_for(field_op)}
+            for (field_op_id, tak_server_id), (field_op_due, aid_request_ids) in due.items():
+                if field_op_id == field_op.pk:
+                    jobs.append(sweep_job(field_op, sorted(aid_request_ids), include_field_op_marker=field_op_due,
+                                          targets=[targets[tak_server_id]]))
+        except Exception as e:
+            logger.error(f"Error preparing CoT refresh for {field_op.slug}: {str(e)}")
+            reports.append(sweep_report(field_op.slug, field_op.tak_server.name if field_op.tak_server else None, error=str(e)))
+    return jobs, reports
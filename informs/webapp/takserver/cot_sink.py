@@ -0,0 +1,209 @@
+"""
+Local TAK server stand-in: a TLS CoT sink that accepts client-certificate connections,
+splits the stream into events and records what arrived when.
+
+Used by `manage.py cot_benchmark` and `manage.py cot_sink` to measure CoT sends without
+a real TAK server. `generate_certificates()` makes a throwaway CA plus server and client
+certificates in the PEM layout TakServer expects (client key and certificate in one file).
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import ssl
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
+
+from .cot_protobuf import takp_offer, takp_response, split_frames
+
+logger = logging.getLogger(__name__)
+
+EVENT_END = b'</event>'
+
+
+def _name(common_name):
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+
+
+def _pem(key, cert):
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    return key_pem + cert.public_bytes(serialization.Encoding.PEM)
+
+
+def _certificate(subject, issuer, public_key, signing_key, ca=False, usage=None, hostname=None):
+    now = datetime.now(timezone.utc)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(_name(subject))
+        .issuer_name(_name(issuer))
+        .public_key(public_key)
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+    )
+    if usage:
+        builder = builder.add_extension(x509.ExtendedKeyUsage([usage]), critical=False)
+    if hostname:
+        try:
+            san = x509.IPAddress(ipaddress.ip_address(hostname))
+        except ValueError:
+            san = x509.DNSName(hostname)
+        builder = builder.add_extension(x509.SubjectAlternativeName([san]), critical=False)
+    return builder.sign(signing_key, hashes.SHA256())
+
+
+def generate_certificates(directory, hostname='localhost'):
+    """Write a self-signed CA plus server and client certificates to a directory.
+
+    Returns:
+        dict: paths of 'ca' (CA certificate), 'server' and 'client' (key + certificate PEM)
+    """
+    os.makedirs(directory, exist_ok=True)
+    ca_key = ec.generate_private_key(ec.SECP256R1())
+    ca_cert = _certificate('cot-sink-ca', 'cot-sink-ca', ca_key.public_key(), ca_key, ca=True)
+
+    paths = {name: os.path.join(directory, f"{name}.pem") for name in ('ca', 'server', 'client')}
+    with open(paths['ca'], 'wb') as pem:
+        pem.write(ca_cert.public_bytes(serialization.Encoding.PEM))
+    for name, usage in (('server', ExtendedKeyUsageOID.SERVER_AUTH), ('client', ExtendedKeyUsageOID.CLIENT_AUTH)):
+        key = ec.generate_private_key(ec.SECP256R1())
+        cert = _certificate(f"cot-sink-{name}", 'cot-sink-ca', key.public_key(), ca_key, usage=usage,
+                            hostname=hostname if name == 'server' else None)
+        with open(paths[name], 'wb') as pem:
+            pem.write(_pem(key, cert))
+    return paths
+
+
+def server_ssl_context(certs):
+    """TLS context for the sink: server certificate, client certificates required."""
+    ssl_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_ctx.verify_mode = ssl.CERT_REQUIRED
+    ssl_ctx.load_verify_locations(cafile=certs['ca'])
+    ssl_ctx.load_cert_chain(certfile=certs['server'])
+    return ssl_ctx
+
+
+class CotSink:
+    """Asyncio CoT receiver running on its own thread.
+
+    Counts every connection, byte and event; keeps the events themselves when keep_events is set
+    (XML events as sent, protobuf events as TakMessage payloads).
+    """
+
+    def __init__(self, host='127.0.0.1', port=8089, ssl_context=None, keep_events=False, offer_protobuf=False):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.keep_events = keep_events
+        self.offer_protobuf = offer_protobuf  # offer TAK protocol v1 to every new connection, like a TAK server
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._started = threading.Event()
+        self.reset()
+
+    def reset(self):
+        self.connections = 0
+        self.bytes_received = 0
+        self.event_count = 0
+        self.events = []
+        self.first_event_at = None
+        self.last_event_at = None
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='cot-sink', daemon=True)
+        self._thread.start()
+        self._started.wait(10)
+        if self._server is None:
+            raise RuntimeError(f"CoT sink failed to listen on {self.host}:{self.port}")
+        logger.info(f"CoT sink listening on {self.host}:{self.port} (TLS: {bool(self.ssl_context)})")
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, ssl=self.ssl_context)
+            )
+        except OSError as e:
+            logger.error(f"CoT sink could not listen on {self.host}:{self.port}: {e}")
+            return
+        else:
+            # port 0 asks the OS for a free port
+            self.port = self._server.sockets[0].getsockname()[1]
+        finally:
+            self._started.set()
+        self._loop.run_forever()
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def close():
+            self._server.close()
+            if hasattr(self._server, 'close_clients'):  # Python 3.13+, wait_closed() waits for clients
+                self._server.close_clients()
+            await self._server.wait_closed()
+
+        if self._server is not None:
+            asyncio.run_coroutine_threadsafe(close(), self._loop).result(10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+        self._loop = None
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        pending = b''
+        protobuf = False
+        if self.offer_protobuf:
+            writer.write(takp_offer())
+        try:
+            while chunk := await reader.read(65536):
+                self.bytes_received += len(chunk)
+                pending += chunk
+                if protobuf:
+                    events, pending = split_frames(pending)
+                else:
+                    *events, pending = pending.split(EVENT_END)
+                    events = [event.lstrip() + EVENT_END for event in events]
+                    if any(b'type="t-x-takp-q"' in event for event in events):
+                        # the client asked to switch: confirm, then everything after it is framed
+                        events = [event for event in events if b'type="t-x-takp-q"' not in event]
+                        writer.write(takp_response(True))
+                        protobuf = True
+                        frames, pending = split_frames(pending)
+                        events.extend(frames)
+                self._record(events)
+        except (ConnectionError, ssl.SSLError, OSError, ValueError) as e:
+            logger.debug(f"CoT sink connection closed: {e}")
+        finally:
+            writer.close()
+
+    def _record(self, events):
+        if not events:
+            return
+        now = time.monotonic()
+        self.first_event_at = self.first_event_at or now
+        self.last_event_at = now
+        self.event_count += len(events)
+        if self.keep_events:
+            self.events.extend(events)
+
+    def wait_for_events(self, count, timeout=30):
+        """Block until `count` events arrived in total; returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self.event_count < count:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
@@ -0,0 +1,84 @@
+"""
+Per field op snapshot of the aid request CotMarkers.
+
+Building an aid request's marker needs the aid request, its aid type and its locations;
+for a large op that is most of a send's build time, paid again by every sweep and every
+"Send to TAK". The built CotMarkers are kept in CotSnapshot, one row per aid request, and
+a send reads a chunk's markers with one query. Markers carry no times: the encoders stamp
+time/start/stale into their pre-rendered event skeleton at send time, so one snapshot
+serves the XML and protobuf encodings alike.
+
+Signals (takserver.signals) drop the rows an AidRequest, AidLocation, AidType or FieldOp
+change affects; the next send rebuilds just those. Rows older than COT_SNAPSHOT_MAX_AGE are
+rebuilt as well, which bounds how long an edit racing a send, or a queryset.update() that
+sends no signal, can leave a marker out of date.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+
+from .cot_encoder import CotMarker, MARKER_CONTENT_FIELDS
+from .models import CotSnapshot
+
+COT_SNAPSHOT = getattr(settings, 'COT_SNAPSHOT', True)  # serve aid request markers from CotSnapshot
+COT_SNAPSHOT_MAX_AGE = getattr(settings, 'COT_SNAPSHOT_MAX_AGE', 3600)  # seconds before a row is rebuilt anyway
+
+# CotMarker fields 3 and 4: lat/lon are stored as text, so the Decimal comes back as built
+_LAT, _LON = 3, 4
+
+
+def marker_json(marker):
+    """The content fields of a CotMarker, as stored in CotSnapshot.marker."""
+    if marker is None:
+        return None
+    values = list(marker[:MARKER_CONTENT_FIELDS])
+    values[_LAT], values[_LON] = str(values[_LAT]), str(values[_LON])
+    return values
+
+
+def marker_from_json(values, field_op_id, aid_request_id):
+    if values is None:
+        return None
+    values = list(values)
+    values[_LAT], values[_LON] = Decimal(values[_LAT]), Decimal(values[_LON])
+    return CotMarker(*values, field_op_id=field_op_id, aid_request_id=aid_request_id)
+
+
+async def snapshot_markers(field_op, aid_request_ids, variant, now):
+    """The snapshot rows that are still good for these aid requests of a field op.
+
+    Returns:
+        dict: {aid request id: CotMarker, or None when it has no location}; missing ids need building
+    """
+    rows = CotSnapshot.objects.filter(
+        aid_request_id__in=aid_request_ids,
+        field_op=field_op,
+        variant=variant,
+        built_at__gt=now - timedelta(seconds=COT_SNAPSHOT_MAX_AGE),
+    ).values_list('aid_request_id', 'marker')
+    return {
+        aid_request_id: marker_from_json(marker, field_op.pk, aid_request_id)
+        async for aid_request_id, marker in rows
+    }
+
+
+async def save_snapshot(field_op, markers, variant, now):
+    """Keep freshly built markers ({aid request id: CotMarker or None}), one upsert."""
+    if not markers:
+        return
+    await CotSnapshot.objects.abulk_create(
+        [
+            CotSnapshot(aid_request_id=aid_request_id, field_op=field_op, variant=variant,
+                        marker=marker_json(marker), built_at=now)
+            for aid_request_id, marker in markers.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['aid_request'],
+        update_fields=['field_op', 'variant', 'marker', 'built_at'],
+    )
+
+
+def invalidate(**filters):
+    """Drop the snapshot rows matching the filters; their markers are rebuilt on the next send."""
+    CotSnapshot.objects.filter(**filters).delete()
@@ -0,0 +1,108 @@
+"""
+Durable spool for CoT events a TAK server could not take.
+
+When a send fails because the TAK server is unreachable or drops the connection, the
+events that were not delivered are written to CotSpool, one row per TAK server and event
+UID (the latest event wins, as it does on the TAK server). The next send that connects to
+that server replays the spool first over the same connection, so a change made during an
+outage reaches the server as soon as it is back, without re-sending every marker of the op.
+
+Events that have gone stale are never replayed, and a spooled event is only replayed in
+the encoding it was built for.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .connection_pool import cot_pool
+from .cot_delta import marker_digest, refresh_due, STATE_UPDATE_FIELDS
+from .models import CotMarkerState, CotSpool
+
+logger = logging.getLogger(__name__)
+
+COT_SPOOL_REPLAY_BATCH = getattr(settings, 'COT_SPOOL_REPLAY_BATCH', 500)  # spooled events per replay write
+
+
+async def spool(tak_server_id, encoding, markers, messages, now):
+    """Keep undelivered events for replay, one upsert for the batch.
+
+    Returns:
+        int: number of events spooled
+    """
+    rows = {
+        marker.uid: CotSpool(
+            tak_server_id=tak_server_id,
+            uid=marker.uid,
+            encoding=encoding,
+            payload=message,
+            digest=marker_digest(marker),
+            stale_seconds=int(marker.stale_seconds),
+            spooled_at=now,
+            stale_at=now + timedelta(seconds=int(marker.stale_seconds)),
+            field_op_id=marker.field_op_id,
+            aid_request_id=marker.aid_request_id,
+        )
+        for marker, message in zip(markers, messages)
+    }
+    if not rows:
+        return 0
+    await CotSpool.objects.abulk_create(
+        rows.values(),
+        update_conflicts=True,
+        unique_fields=['tak_server', 'uid'],
+        update_fields=['encoding', 'payload', 'digest', 'stale_seconds', 'spooled_at', 'stale_at', 'field_op', 'aid_request'],
+    )
+    return len(rows)
+
+
+async def replay(endpoint, tak_server_id, drain_timeout=None):
+    """Send a TAK server's spooled events over its pooled connection, oldest first.
+
+    Rows are removed once drained and recorded in CotMarkerState, so a delta sweep does not
+    send them again. A ConnectionError, or a drain that times out, leaves the rest of the
+    spool in place and raises ConnectionError.
+
+    Returns:
+        int: number of events replayed
+    """
+    now = timezone.now()
+    spooled = CotSpool.objects.filter(tak_server_id=tak_server_id)
+    expired, _ = await spooled.exclude(encoding=endpoint.encoding, stale_at__gt=now).adelete()
+    if expired:
+        logger.info(f"Dropped {expired} stale spooled CoT events for {endpoint.host}:{endpoint.port}.")
+
+    replayed = 0
+    while True:
+        rows = [row async for row in spooled.order_by('spooled_at', 'pk')[:COT_SPOOL_REPLAY_BATCH]]
+        if not rows:
+            break
+        try:
+            await cot_pool.send(endpoint, [bytes(row.payload) for row in rows], drain_timeout=drain_timeout)
+        except asyncio.TimeoutError as e_timeout:
+            raise ConnectionError(f"Timeout ({drain_timeout}s) replaying {len(rows)} spooled events") from e_timeout
+        await CotMarkerState.objects.abulk_create(
+            [
+                CotMarkerState(tak_server_id=tak_server_id, uid=row.uid, digest=row.digest,
+                               stale_seconds=row.stale_seconds, last_sent=row.spooled_at,
+                               field_op_id=row.field_op_id, aid_request_id=row.aid_request_id,
+                               refresh_due=refresh_due(row.spooled_at, row.stale_seconds))
+                for row in rows
+            ],
+            update_conflicts=True,
+            unique_fields=['tak_server', 'uid'],
+            update_fields=STATE_UPDATE_FIELDS,
+        )
+        # a row spooled again while we were sending holds a newer event and stays
+        by_time = {}
+        for row in rows:
+            by_time.setdefault(row.spooled_at, []).append(row.pk)
+        for spooled_at, pks in by_time.items():
+            await CotSpool.objects.filter(pk__in=pks, spooled_at=spooled_at).adelete()
+        replayed += len(rows)
+
+    if replayed:
+        logger.info(f"Replayed {replayed} spooled CoT events to {endpoint.host}:{endpoint.port}.")
+    return replayed
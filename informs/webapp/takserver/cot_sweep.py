@@ -0,0 +1,114 @@
+"""
+Concurrent CoT sweep: one pass over every field op on the connection pool's event loop.
+
+Sends to different TAK servers run in parallel, so a sweep takes as long as its slowest
+server rather than the sum of all of them. Sends to the same server are limited to
+COT_SWEEP_SERVER_CONCURRENCY at a time (they share its pooled connection anyway).
+A field op with several TAK servers (CotDestination) is built once and sent to all of
+them; it is reported per server. A failing op or an unreachable server is reported and
+does not stop the others.
+"""
+import asyncio
+import logging
+import time
+from collections import namedtuple
+from contextlib import AsyncExitStack
+
+from django.conf import settings
+
+from .connection_pool import cot_pool
+from .cot import cot_job_for, cot_targets_for, send_cot_to
+
+logger = logging.getLogger(__name__)
+
+COT_SWEEP_SERVER_CONCURRENCY = getattr(settings, 'COT_SWEEP_SERVER_CONCURRENCY', 2)  # concurrent sends per TAK server
+COT_SWEEP_TIMEOUT = getattr(settings, 'COT_SWEEP_TIMEOUT', 150)  # seconds, stays under the cot queue's task timeout (180s, Q_CLUSTER ALT_CLUSTERS)
+
+# One field op's share of a sweep, prepared synchronously before the sweep starts
+CotSweepJob = namedtuple('CotSweepJob', ['field_op_slug', 'targets', 'cot_job'])
+
+
+def sweep_job(field_op, aid_request_ids, include_field_op_marker=True, targets=None):
+    """Prepare the sweep job for a field op and its active aid requests.
+
+    The field op needs tak_server loaded and COT_DESTINATIONS prefetched; targets
+    (CotTarget list) defaults to every TAK server the field op sends to.
+    """
+    return CotSweepJob(
+        field_op_slug=field_op.slug,
+        targets=cot_targets_for(field_op) if targets is None else targets,
+        cot_job=cot_job_for(field_op, 'aid', aid_request_ids, include_field_op_marker=include_field_op_marker),
+    )
+
+
+def sweep_report(field_op_slug, tak_server, error=None):
+    """Empty per-op report; send_cot() fills in the counts."""
+    return {
+        'field_op': field_op_slug,
+        'tak_server': tak_server,
+        'sent': 0,
+        'skipped': 0,
+        'replayed': 0,
+        'bytes': 0,
+        'duration': 0.0,
+        'timings': {},
+        'error': error,
+    }
+
+
+async def _sweep_one(job, semaphores, delta_only):
+    started = time.monotonic()
+    # every server's semaphore, always taken in the same order so two jobs cannot deadlock
+    async with AsyncExitStack() as stack:
+        for endpoint in sorted({target.endpoint for target in job.targets}, key=str):
+            await stack.enter_async_context(semaphores[endpoint])
+        try:
+            results = await send_cot_to(job.field_op_slug, job.targets, job.cot_job, delta_only)
+        except Exception as e:
+            results = [f"{type(e).__name__}: {e}"] * len(job.targets)
+
+    reports = []
+    for target, result in zip(job.targets, results):
+        report = sweep_report(job.field_op_slug, target.tak_server)
+        if isinstance(result, dict):
+            report.update(result)
+        else:
+            report['error'] = str(result)
+        # wall time for this op, including any wait for its servers' semaphores
+        report['duration'] = round(time.monotonic() - started, 3)
+        reports.append(report)
+    return reports
+
+
+async def sweep(jobs, delta_only=True, timeout=COT_SWEEP_TIMEOUT, concurrency=COT_SWEEP_SERVER_CONCURRENCY):
+    """Send every job concurrently, grouped by TAK server.
+
+    Returns:
+        list: one report dict per job and TAK server, in job order
+    """
+    semaphores = {}
+    for job in jobs:
+        for target in job.targets:
+            semaphores.setdefault(target.endpoint, asyncio.Semaphore(concurrency))
+    tasks = [asyncio.create_task(_sweep_one(job, semaphores, delta_only)) for job in jobs]
+    if not tasks:
+        return []
+    await asyncio.wait(tasks, timeout=timeout)
+
+    reports = []
+    for job, task in zip(jobs, tasks):
+        if task.done():
+            reports.extend(task.result())
+            continue
+        task.cancel()
+        logger.error(f"[{job.field_op_slug}] CoT sweep timed out after {timeout}s.")
+        for target in job.targets:
+            # an interrupted batch may have left a partial event on the wire
+            await cot_pool.discard(target.endpoint)
+            reports.append(sweep_report(job.field_op_slug, target.tak_server, error=f"Timed out after {timeout}s"))
+    return reports
+
+
+def run_sweep(jobs, delta_only=True, timeout=COT_SWEEP_TIMEOUT):
+    """Run a sweep on the connection pool loop from synchronous code (django-q task)."""
+    return cot_pool.run(sweep(jobs, delta_only=delta_only, timeout=timeout))
@@ -0,0 +1,3 @@
+"""
+Django management commands for takserver app.
+"""
@@ -0,0 +1,45 @@
+from datetime import datetime
+from collections import deque
+
+from django.core.management.base import BaseCommand
+from lxml import etree
+
+from takserver.cot_audit import cot_audit
+
+
+class Command(BaseCommand):
+    help = 'Pretty-print CoT events recorded by the CoT audit sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tail', type=int, default=20, help='Show the last N matching events (0 for all)')
+        parser.add_argument('--field-op', type=str, help='Only events sent for this Field Op slug')
+        parser.add_argument('--uid', type=str, help='Only events whose payload contains this UID')
+        parser.add_argument('--raw', action='store_true', help='Print the bytes as sent, without pretty-printing')
+
+    def handle(self, *args, **options):
+        files = cot_audit.audit_files()
+        if not files:
+            self.stdout.write(self.style.WARNING(f'No CoT audit files found at {cot_audit.path}'))
+            return
+
+        uid = options['uid'].encode() if options['uid'] else None
+        matches = deque(maxlen=options['tail'] or None)
+        for recorded_at, field_op_slug, payload in cot_audit.read():
+            if options['field_op'] and field_op_slug != options['field_op']:
+                continue
+            if uid and uid not in payload:
+                continue
+            matches.append((recorded_at, field_op_slug, payload))
+
+        for recorded_at, field_op_slug, payload in matches:
+            when = datetime.fromtimestamp(recorded_at).strftime('%Y-%m-%d %H:%M:%S')
+            self.stdout.write(self.style.SUCCESS(f'[{when}] {field_op_slug} ({len(payload)} bytes)'))
+            if options['raw']:
+                self.stdout.write(payload.decode('utf-8', errors='replace'))
+                continue
+            try:
+                self.stdout.write(etree.tostring(etree.fromstring(payload), pretty_print=True).decode('utf-8'))
+            except etree.XMLSyntaxError:
+                self.stdout.write(payload.decode('utf-8', errors='replace'))
+
+        self.stdout.write(f'{len(matches)} event(s) from {len(files)} file(s)')
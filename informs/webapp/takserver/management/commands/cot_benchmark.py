@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from takserver.cot_benchmark import CotBenchmark, BENCH_TARGETS
+
+
+class Command(BaseCommand):
+    help = 'Benchmark CoT sends end to end against a local TLS CoT sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='10,1000,10000', help='Comma separated aid request counts per field op')
+        parser.add_argument('--runs', type=int, default=3, help='Runs per target and size')
+        parser.add_argument('--port', type=int, default=18089, help='Port for the local CoT sink')
+        parser.add_argument('--target', action='append', choices=BENCH_TARGETS, help='Only run this target (repeatable)')
+        parser.add_argument('--cold', action='store_true', help='Reconnect before every run instead of reusing the pooled connection')
+        parser.add_argument('--encoding', choices=['xml', 'protobuf'], default='xml', help='TakServer CoT encoding to send with')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        benchmark = CotBenchmark(
+            sizes=sizes, runs=options['runs'], port=options['port'], cold=options['cold'],
+            encoding=options['encoding'], log=lambda message: self.stderr.write(message),
+        )
+        results, encoding_sizes = benchmark.run(options['target'] or BENCH_TARGETS)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'results': results, 'encoding_sizes': encoding_sizes}, indent=2))
+            return
+
+        self.stdout.write(f"Sending as {options['encoding']}")
+
+        header = f"{'target':<22} {'size':>6} {'events/s':>10} {'bytes':>10} " \
+                 f"{'connect p50/p95 ms':>19} {'generate p50/p95 ms':>20} {'drain p50/p95 ms':>17}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for r in results:
+            self.stdout.write(
+                f"{r['target']:<22} {r['size']:>6} {r['events_per_sec']:>10.0f} {r['bytes']:>10} "
+                f"{self.ms(r['connect_p50']):>9}/{self.ms(r['connect_p95']):<9}"
+                f"{self.ms(r['generate_p50']):>10}/{self.ms(r['generate_p95']):<9}"
+                f"{self.ms(r['drain_p50']):>8}/{self.ms(r['drain_p95']):<8}"
+            )
+
+        self.stdout.write('')
+        header = f"{'size':>6} {'events':>7} {'xml bytes':>11} {'protobuf bytes':>15} {'protobuf/xml':>13}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in encoding_sizes:
+            self.stdout.write(
+                f"{row['size']:>6} {row['events']:>7} {row['xml']:>11} {row['protobuf']:>15} "
+                f"{row['protobuf'] / row['xml']:>12.0%}"
+            )
+
+    @staticmethod
+    def ms(seconds):
+        return '-' if seconds is None else f"{seconds * 1000:.1f}"
@@ -0,0 +1,42 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from takserver.cot_ingest import CotIngest
+from takserver.models import TakServer
+
+
+class Command(BaseCommand):
+    help = 'Listen to TAK servers and store the positions and markers they send (see takserver.cot_ingest)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', dest='servers', metavar='NAME',
+                            help='TakServer name to listen to (repeatable); default all TLS servers')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between statistics lines')
+
+    def handle(self, *args, **options):
+        tak_servers = TakServer.objects.filter(transport='tls')
+        if options['servers']:
+            tak_servers = tak_servers.filter(name__in=options['servers'])
+        tak_servers = list(tak_servers)
+        if not tak_servers:
+            raise CommandError("No TAK servers to listen to")
+
+        ingest = CotIngest(tak_servers)
+        self.stdout.write(self.style.SUCCESS(f"CoT ingest listening to {', '.join(s.name for s in tak_servers)}"))
+        try:
+            asyncio.run(self.serve(ingest, options['interval']))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"received={ingest.received} tracks={ingest.stored} candidates={ingest.candidates}")
+
+    async def serve(self, ingest, interval):
+        run = asyncio.create_task(ingest.run())
+        try:
+            while not run.done():
+                await asyncio.wait([run], timeout=interval)
+                self.stdout.write(f"received={ingest.received} tracks={ingest.stored} "
+                                  f"candidates={ingest.candidates} pending={len(ingest.pending)}")
+        finally:
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
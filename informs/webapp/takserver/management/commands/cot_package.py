@@ -0,0 +1,36 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aidrequests.models import FieldOp
+from takserver.cot_package import current_package, build_package
+
+
+class Command(BaseCommand):
+    help = 'Build (or reuse) the TAK data package of a field op (see takserver.cot_package)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('field_op', help='FieldOp slug')
+        parser.add_argument('--output', '-o', help='Copy the package to this file')
+        parser.add_argument('--rebuild', action='store_true', help='Build even when the cached package is current')
+
+    def handle(self, *args, **options):
+        field_op = FieldOp.objects.filter(slug=options['field_op']).first()
+        if field_op is None:
+            raise CommandError(f"No field op {options['field_op']}")
+
+        package, cached = None if options['rebuild'] else current_package(field_op), True
+        if package is None:
+            package, cached = build_package(field_op)
+            self.stdout.write(f"Built {package.path}")
+        try:
+            if options['output']:
+                shutil.copyfile(package.path, options['output'])
+                self.stdout.write(f"Wrote {options['output']}")
+        finally:
+            if not cached:
+                os.remove(package.path)
+        self.stdout.write(self.style.SUCCESS(
+            f"{field_op.slug}: {package.markers} events, {package.size} bytes, etag {package.etag}"
+        ))
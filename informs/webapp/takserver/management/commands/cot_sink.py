@@ -0,0 +1,38 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from takserver.cot_sink import CotSink, generate_certificates, server_ssl_context
+
+
+class Command(BaseCommand):
+    help = 'Run a local TLS CoT sink that stands in for a TAK server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--port', type=int, default=18089, help='Port to listen on')
+        parser.add_argument('--certs-dir', type=str, default=os.path.join(settings.MEDIA_ROOT, 'certificates', 'cotsink'),
+                            help='Where to write the generated CA, server and client certificates')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between statistics lines')
+
+    def handle(self, *args, **options):
+        certs = generate_certificates(options['certs_dir'], hostname=options['host'])
+        sink = CotSink(options['host'], options['port'], ssl_context=server_ssl_context(certs)).start()
+        self.stdout.write(self.style.SUCCESS(f"CoT sink listening on {options['host']}:{options['port']}"))
+        self.stdout.write(f"Point a TakServer at dns_name {options['host']}:{options['port']} with "
+                          f"cert_trust {certs['ca']} and cert_private {certs['client']}")
+
+        last_events = 0
+        try:
+            while True:
+                time.sleep(options['interval'])
+                rate = (sink.event_count - last_events) / options['interval']
+                last_events = sink.event_count
+                self.stdout.write(f"connections={sink.connections} events={sink.event_count} "
+                                  f"bytes={sink.bytes_received} rate={rate:.0f}/s")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.stop()
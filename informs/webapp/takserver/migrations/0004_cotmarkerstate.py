@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takserver', '0003_alter_takserver_notes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotMarkerState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.CharField(help_text='CoT event UID', max_length=255)),
+                ('digest', models.CharField(help_text='Hash of the marker content as last sent', max_length=32)),
+                ('stale_seconds', models.PositiveIntegerField(help_text='Stale time of the event as last sent')),
+                ('last_sent', models.DateTimeField()),
+                ('tak_server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='marker_states', to='takserver.takserver')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tak_server', 'uid'), name='unique_cot_marker_state')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takserver', '0004_cotmarkerstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='takserver',
+            name='cot_encoding',
+            field=models.CharField(choices=[('xml', 'CoT XML'), ('protobuf', 'TAK Protocol v1 (protobuf)')], default='xml', help_text='Wire format for CoT events. Protobuf is negotiated on connect and is much smaller.', max_length=10),
+        ),
+    ]
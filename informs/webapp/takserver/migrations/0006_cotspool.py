@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takserver', '0005_takserver_cot_encoding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotSpool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.CharField(help_text='CoT event UID', max_length=255)),
+                ('encoding', models.CharField(help_text='TakServer.cot_encoding the event was encoded with', max_length=10)),
+                ('payload', models.BinaryField(help_text='The encoded event')),
+                ('digest', models.CharField(help_text='Hash of the marker content', max_length=32)),
+                ('stale_seconds', models.PositiveIntegerField()),
+                ('spooled_at', models.DateTimeField()),
+                ('stale_at', models.DateTimeField(help_text='Not replayed after the event went stale')),
+                ('tak_server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spooled_events', to='takserver.takserver')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tak_server', 'uid'), name='unique_cot_spool')],
+            },
+        ),
+    ]
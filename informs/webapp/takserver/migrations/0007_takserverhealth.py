@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takserver', '0006_cotspool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TakServerHealth',
+            fields=[
+                ('tak_server', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='health', serialize=False, to='takserver.takserver')),
+                ('state', models.CharField(choices=[('closed', 'Closed'), ('open', 'Open'), ('half_open', 'Half open')], default='closed', max_length=10)),
+                ('consecutive_failures', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('last_error_at', models.DateTimeField(blank=True, null=True)),
+                ('last_success_at', models.DateTimeField(blank=True, null=True)),
+                ('opened_at', models.DateTimeField(blank=True, help_text='When the circuit last opened or a probe last failed', null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'TAK server health',
+            },
+        ),
+    ]
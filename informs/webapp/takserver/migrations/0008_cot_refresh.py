@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aidrequests', '0023_pendingcot'),
+        ('takserver', '0007_takserverhealth'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cotmarkerstate',
+            name='aid_request',
+            field=models.ForeignKey(blank=True, help_text='Empty for the field op marker', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='aidrequests.aidrequest'),
+        ),
+        migrations.AddField(
+            model_name='cotmarkerstate',
+            name='field_op',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='aidrequests.fieldop'),
+        ),
+        migrations.AddField(
+            model_name='cotmarkerstate',
+            name='refresh_due',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='When the refresh scheduler resends the marker; empty when it no longer does', null=True),
+        ),
+        migrations.AddField(
+            model_name='cotspool',
+            name='aid_request',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='aidrequests.aidrequest'),
+        ),
+        migrations.AddField(
+            model_name='cotspool',
+            name='field_op',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='aidrequests.fieldop'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takserver', '0008_cot_refresh'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.CharField(help_text='CoT event UID', max_length=255)),
+                ('cot_type', models.CharField(max_length=100)),
+                ('callsign', models.CharField(blank=True, max_length=255)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('event_time', models.DateTimeField(help_text='Time of the CoT event')),
+                ('stale_at', models.DateTimeField(help_text='Stale time of the CoT event')),
+                ('received_at', models.DateTimeField(db_index=True)),
+                ('tak_server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracks', to='takserver.takserver')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tak_server', 'uid'), name='unique_cot_track')],
+            },
+        ),
+    ]
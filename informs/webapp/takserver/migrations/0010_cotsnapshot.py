@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aidrequests', '0024_cotdestination'),
+        ('takserver', '0009_cottrack'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotSnapshot',
+            fields=[
+                ('aid_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='aidrequests.aidrequest')),
+                ('variant', models.CharField(blank=True, help_text='ENV and TAKV UID suffixes the marker was built with', max_length=100)),
+                ('marker', models.JSONField(blank=True, help_text='Marker content; empty when the aid request has no location to show', null=True)),
+                ('built_at', models.DateTimeField()),
+                ('field_op', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='aidrequests.fieldop')),
+            ],
+        ),
+    ]
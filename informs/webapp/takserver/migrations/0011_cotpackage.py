@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aidrequests', '0024_cotdestination'),
+        ('takserver', '0010_cotsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotPackage',
+            fields=[
+                ('field_op', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='aidrequests.fieldop')),
+                ('version', models.PositiveIntegerField(default=0, help_text="Bumped by every change to the field op's markers")),
+                ('built_version', models.PositiveIntegerField(blank=True, help_text='The version the package file was built from', null=True)),
+                ('etag', models.CharField(blank=True, max_length=32)),
+                ('path', models.CharField(blank=True, help_text='The package file', max_length=500)),
+                ('markers', models.PositiveIntegerField(default=0)),
+                ('size', models.PositiveBigIntegerField(default=0, help_text='File size in bytes')),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takserver', '0011_cotpackage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='takserver',
+            name='transport',
+            field=models.CharField(choices=[('tls', 'TAK server streaming (TLS)'), ('udp', 'Local SA over UDP (multicast or unicast)')], default='tls', help_text='UDP sends SA straight to EUDs on the local network, e.g. 239.2.3.1:6969; certificates are not used.', max_length=3),
+        ),
+        migrations.AlterField(
+            model_name='takserver',
+            name='cert_private',
+            field=models.FileField(blank=True, help_text='Upload the private certificate file - PEM Format', upload_to='certificates/certprivate/'),
+        ),
+        migrations.AlterField(
+            model_name='takserver',
+            name='cert_trust',
+            field=models.FileField(blank=True, help_text='Upload the trusted certificate file - PEM Format', upload_to='certificates/certtrust/'),
+        ),
+    ]
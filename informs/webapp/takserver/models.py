@@ -12,13 +12,151 @@ class TakServer(models.Model):
     )
     cert_trust = models.FileField(
         upload_to='certificates/certtrust/',
+        blank=True,
         help_text="Upload the trusted certificate file - PEM Format"
     )
     cert_private = models.FileField(
         upload_to='certificates/certprivate/',
+        blank=True,
         help_text="Upload the private certificate file - PEM Format"
     )
     notes = models.TextField(blank=True, null=True)
 
+    ENCODING_CHOICES = [
+        ('xml', 'CoT XML'),
+        ('protobuf', 'TAK Protocol v1 (protobuf)'),
+    ]
+    cot_encoding = models.CharField(
+        max_length=10,
+        choices=ENCODING_CHOICES,
+        default='xml',
+        help_text="Wire format for CoT events. Protobuf is negotiated on connect and is much smaller."
+    )
+
+    TRANSPORT_CHOICES = [
+        ('tls', 'TAK server streaming (TLS)'),
+        ('udp', 'Local SA over UDP (multicast or unicast)'),
+    ]
+    transport = models.CharField(
+        max_length=3,
+        choices=TRANSPORT_CHOICES,
+        default='tls',
+        help_text="UDP sends SA straight to EUDs on the local network, e.g. 239.2.3.1:6969; certificates are not used."
+    )
+
     def __str__(self):
         return self.name
+
+
+class CotMarkerState(models.Model):
+    """What was last sent to a TAK server for one CoT event UID."""
+    tak_server = models.ForeignKey(TakServer, on_delete=models.CASCADE, related_name='marker_states')
+    uid = models.CharField(max_length=255, help_text="CoT event UID")
+    digest = models.CharField(max_length=32, help_text="Hash of the marker content as last sent")
+    stale_seconds = models.PositiveIntegerField(help_text="Stale time of the event as last sent")
+    last_sent = models.DateTimeField()
+    field_op = models.ForeignKey('aidrequests.FieldOp', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    aid_request = models.ForeignKey('aidrequests.AidRequest', on_delete=models.CASCADE, null=True, blank=True,
+                                    related_name='+', help_text="Empty for the field op marker")
+    refresh_due = models.DateTimeField(null=True, blank=True, db_index=True,
+                                       help_text="When the refresh scheduler resends the marker; empty when it no longer does")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tak_server', 'uid'], name='unique_cot_marker_state'),
+        ]
+
+    def __str__(self):
+        return f"{self.tak_server} {self.uid}"
+
+
+class CotSpool(models.Model):
+    """An encoded CoT event that could not be delivered to a TAK server, waiting for replay."""
+    tak_server = models.ForeignKey(TakServer, on_delete=models.CASCADE, related_name='spooled_events')
+    uid = models.CharField(max_length=255, help_text="CoT event UID")
+    encoding = models.CharField(max_length=10, help_text="TakServer.cot_encoding the event was encoded with")
+    payload = models.BinaryField(help_text="The encoded event")
+    digest = models.CharField(max_length=32, help_text="Hash of the marker content")
+    stale_seconds = models.PositiveIntegerField()
+    spooled_at = models.DateTimeField()
+    stale_at = models.DateTimeField(help_text="Not replayed after the event went stale")
+    field_op = models.ForeignKey('aidrequests.FieldOp', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    aid_request = models.ForeignKey('aidrequests.AidRequest', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tak_server', 'uid'], name='unique_cot_spool'),
+        ]
+
+    def __str__(self):
+        return f"{self.tak_server} {self.uid}"
+
+
+class TakServerHealth(models.Model):
+    """Circuit breaker state for CoT sends to one TAK server (see cot_circuit)."""
+    STATE_CHOICES = [
+        ('closed', 'Closed'),
+        ('open', 'Open'),
+        ('half_open', 'Half open'),
+    ]
+    tak_server = models.OneToOneField(TakServer, on_delete=models.CASCADE, primary_key=True, related_name='health')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='closed')
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    last_error_at = models.DateTimeField(null=True, blank=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    opened_at = models.DateTimeField(null=True, blank=True, help_text="When the circuit last opened or a probe last failed")
+
+    class Meta:
+        verbose_name_plural = 'TAK server health'
+
+    def __str__(self):
+        return f"{self.tak_server} {self.state}"
+
+
+class CotTrack(models.Model):
+    """The latest position a TAK server reported for one CoT UID (see cot_ingest)."""
+    tak_server = models.ForeignKey(TakServer, on_delete=models.CASCADE, related_name='tracks')
+    uid = models.CharField(max_length=255, help_text="CoT event UID")
+    cot_type = models.CharField(max_length=100)
+    callsign = models.CharField(max_length=255, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    event_time = models.DateTimeField(help_text="Time of the CoT event")
+    stale_at = models.DateTimeField(help_text="Stale time of the CoT event")
+    received_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tak_server', 'uid'], name='unique_cot_track'),
+        ]
+
+    def __str__(self):
+        return f"{self.tak_server} {self.callsign or self.uid}"
+
+
+class CotSnapshot(models.Model):
+    """The CotMarker last built for an aid request, served to sends until it changes (see cot_snapshot)."""
+    aid_request = models.OneToOneField('aidrequests.AidRequest', on_delete=models.CASCADE, primary_key=True, related_name='+')
+    field_op = models.ForeignKey('aidrequests.FieldOp', on_delete=models.CASCADE, related_name='+')
+    variant = models.CharField(max_length=100, blank=True, help_text="ENV and TAKV UID suffixes the marker was built with")
+    marker = models.JSONField(null=True, blank=True, help_text="Marker content; empty when the aid request has no location to show")
+    built_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.field_op_id} AR-{self.aid_request_id}"
+
+
+class CotPackage(models.Model):
+    """The TAK data package last built for a field op, served until the field op changes (see cot_package)."""
+    field_op = models.OneToOneField('aidrequests.FieldOp', on_delete=models.CASCADE, primary_key=True, related_name='+')
+    version = models.PositiveIntegerField(default=0, help_text="Bumped by every change to the field op's markers")
+    built_version = models.PositiveIntegerField(null=True, blank=True, help_text="The version the package file was built from")
+    etag = models.CharField(max_length=32, blank=True)
+    path = models.CharField(max_length=500, blank=True, help_text="The package file")
+    markers = models.PositiveIntegerField(default=0)
+    size = models.PositiveBigIntegerField(default=0, help_text="File size in bytes")
+    built_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.field_op_id} v{self.version}"
@@ -0,0 +1,54 @@
+import os
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from aidrequests.models import FieldOp, AidRequest, AidLocation, AidType
+from .connection_pool import ssl_contexts
+from .cot_package import stale_packages
+from .cot_snapshot import invalidate
+from .models import TakServer, CotPackage
+
+
+@receiver([post_save, post_delete], sender=TakServer)
+def clear_ssl_contexts(sender, instance, **kwargs):
+    """New certificates (or a removed server) must not reuse a cached SSL context."""
+    ssl_contexts.clear()
+
+
+@receiver(post_delete, sender=CotPackage)
+def remove_package_file(sender, instance, **kwargs):
+    if instance.path and os.path.exists(instance.path):
+        os.remove(instance.path)
+
+
+@receiver(post_save, sender=FieldOp)
+def invalidate_field_op_snapshot(sender, instance, **kwargs):
+    """Aid request markers carry the field op's name, slug and marker link."""
+    invalidate(field_op=instance)
+    stale_packages(field_op=instance)
+
+
+@receiver(post_save, sender=AidRequest)
+def invalidate_aid_request_snapshot(sender, instance, **kwargs):
+    invalidate(aid_request_id=instance.pk)
+    stale_packages(field_op_id=instance.field_op_id)
+
+
+@receiver(post_delete, sender=AidRequest)
+def stale_aid_request_package(sender, instance, **kwargs):
+    """The snapshot row goes with the aid request; the field op's package still lists it."""
+    stale_packages(field_op_id=instance.field_op_id)
+
+
+@receiver([post_save, post_delete], sender=AidLocation)
+def invalidate_aid_location_snapshot(sender, instance, **kwargs):
+    invalidate(aid_request_id=instance.aid_request_id)
+    stale_packages(field_op__aid_requests=instance.aid_request_id)
+
+
+@receiver([post_save, post_delete], sender=AidType)
+def invalidate_aid_type_snapshot(sender, instance, **kwargs):
+    """Aid type name, slug and icon go into the marker's remarks, callsign and type."""
+    invalidate(aid_request__aid_type=instance)
+    stale_packages(field_op__aid_requests__aid_type=instance)